@@ -1,8 +1,11 @@
 from django import forms
 from django.contrib import admin
 from django.utils.html import format_html
+from import_export import resources
 from import_export.admin import ImportExportModelAdmin
+from finance.pricing import annotate_current_price, annotate_group_price
 from .models import (
+    LEDGER_FIELDS,
     Branch,
     Room,
     Student,
@@ -12,9 +15,32 @@ from .models import (
     Attendance,
     Holiday,
     GroupScheduleOverride,
+    LessonOccurrence,
 )
 
 
+class LedgerResource(resources.ModelResource):
+    """
+    Exports the ledger columns but never imports them; finance.ledger
+    derives them from transactions.
+    """
+
+    def import_field(self, field, instance, row, is_m2m=False, **kwargs):
+        if field.attribute in LEDGER_FIELDS:
+            return
+        super().import_field(field, instance, row, is_m2m, **kwargs)
+
+
+class StudentResource(LedgerResource):
+    class Meta:
+        model = Student
+
+
+class StudentGroupResource(LedgerResource):
+    class Meta:
+        model = StudentGroup
+
+
 @admin.register(Branch)
 class BranchAdmin(ImportExportModelAdmin):
     list_display = ("name", "address", "is_archived", "created_at")
@@ -32,6 +58,7 @@ class RoomAdmin(ImportExportModelAdmin):
 
 @admin.register(Student)
 class StudentAdmin(ImportExportModelAdmin):
+    resource_classes = [StudentResource]
     list_display = (
         "photo_tag",
         "full_name",
@@ -129,6 +156,9 @@ class GroupAdmin(ImportExportModelAdmin):
 
     form = GroupAdminForm
 
+    def get_queryset(self, request):
+        return annotate_current_price(super().get_queryset(request))
+
     @admin.display(description="Color")
     def colored_box(self, obj):
         return format_html(
@@ -150,6 +180,7 @@ class GroupAdmin(ImportExportModelAdmin):
 
 @admin.register(StudentGroup)
 class StudentGroupAdmin(ImportExportModelAdmin):
+    resource_classes = [StudentGroupResource]
     list_display = (
         "student",
         "group",
@@ -162,6 +193,9 @@ class StudentGroupAdmin(ImportExportModelAdmin):
     list_filter = ("group__branch", "group__name", "is_archived")
     search_fields = ("student__full_name", "group__name")
 
+    def get_queryset(self, request):
+        return annotate_group_price(super().get_queryset(request))
+
     @admin.display(description="Price (UZS)")
     def effective_price_display(self, obj: StudentGroup):
         return f"{obj.effective_price:0,.2f}"
@@ -200,3 +234,19 @@ class GroupScheduleOverrideAdmin(ImportExportModelAdmin):
     list_filter = ("is_cancelled", "is_extra", "group__branch")
     search_fields = ("group__name", "group__teacher__full_name", "reason")
     ordering = ("-new_date", "-original_date")
+
+
+@admin.register(LessonOccurrence)
+class LessonOccurrenceAdmin(admin.ModelAdmin):
+    # Maintained by core.lessons; use `rebuild_lessons` to regenerate it
+    list_display = ("group", "date", "start_time", "end_time", "room", "source")
+    list_filter = ("source", "group__branch", "date")
+    search_fields = ("group__name",)
+    list_select_related = ("group__branch", "group__teacher", "room")
+    date_hierarchy = "date"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,351 @@
+"""
+Attendance analytics.
+
+Attendance rates, absence streaks and at-risk students for many groups over
+any date range, rolled up per group, teacher or branch.
+
+- The denominator is the lessons actually held, read from the materialized
+  LessonOccurrence table (core.lessons), so holidays, cancellations,
+  reschedules, extra lessons and the archiving of a group are accounted for.
+  Lessons before a student joined, after they left (archived) or after today
+  are not expected.
+- Marks are counted by the database with one grouped query per enrollment
+  (and per week/month when a time series is requested), restricted to those
+  same lessons, so a mark before joining, after leaving or on a day without
+  a lesson is ignored and present + absent never exceeds expected. Only
+  absence dates are loaded row by row, for the streaks.
+
+The whole report costs a fixed number of queries, whatever the number of groups.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Count, Exists, F, Max, OuterRef, Q
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import Attendance, LessonOccurrence, StudentGroup
+
+
+PERIODS = {"week": TruncWeek, "month": TruncMonth}
+
+
+def period_start(day, period):
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return None
+
+
+class Counts:
+    """
+    Expected/present/absent student-lessons, summed over enrollments.
+    """
+
+    __slots__ = ("expected", "present", "absent")
+
+    def __init__(self):
+        self.expected = self.present = self.absent = 0
+
+    def add(self, expected=0, present=0, absent=0):
+        self.expected += expected
+        self.present += present
+        self.absent += absent
+
+    def merge(self, other):
+        self.add(other.expected, other.present, other.absent)
+
+    def as_dict(self):
+        return {
+            "expected": self.expected,
+            "present": self.present,
+            "absent": self.absent,
+            "unmarked": self.expected - self.present - self.absent,
+            "rate": round(self.present / self.expected, 4) if self.expected else None,
+        }
+
+
+def absence_streaks(absent_days, lesson_index, last_present):
+    """
+    Returns (longest, current) runs of absences on consecutive lessons.
+    `absent_days` are sorted dates, `lesson_index` maps a lesson date to its
+    position. The current streak is the last run, when no present mark follows
+    it; unmarked lessons after it do not break it.
+    """
+    longest = run = 0
+    previous = None
+    for day in absent_days:
+        index = lesson_index.get(day)
+        if index is None:
+            # A mark on a day without a lesson does not count
+            continue
+        run = run + 1 if previous is not None and index == previous + 1 else 1
+        longest = max(longest, run)
+        previous = index
+        last_absent = day
+
+    if not run or (last_present is not None and last_present > last_absent):
+        return longest, 0
+    return longest, run
+
+
+class AttendanceAnalytics:
+    """
+    Attendance of every enrollment of `groups` between `start` and `end`.
+    `groups` should select_related("teacher", "branch").
+    """
+
+    def __init__(self, groups, start, end, period=None, threshold=3, today=None):
+        self.groups = {group.pk: group for group in groups}
+        self.start = start
+        self.end = end
+        self.period = period
+        self.threshold = threshold
+        # Lessons after today have not taken place yet
+        self.until = min(end, today or timezone.localdate())
+
+        self.lesson_days = {}
+        if self.groups and self.start <= self.until:
+            self.lesson_days = self._lessons()
+        self.lesson_index = {
+            group_id: {day: index for index, day in enumerate(days)}
+            for group_id, days in self.lesson_days.items()
+        }
+        self.enrollments = self._compute()
+
+    def _lessons(self):
+        """
+        {group_id: [date, ...]} of the lessons held in the range, in date order.
+        """
+        rows = (
+            LessonOccurrence.objects.filter(
+                group_id__in=self.groups, date__range=(self.start, self.until)
+            )
+            .order_by("group_id", "date")
+            .values_list("group_id", "date")
+        )
+        lesson_days = defaultdict(list)
+        for group_id, day in rows:
+            lesson_days[group_id].append(day)
+        return dict(lesson_days)
+
+    def _expected_marks(self):
+        """
+        Marks on a lesson of the group, between joining and leaving it.
+        """
+        lesson = LessonOccurrence.objects.filter(
+            group_id=OuterRef("student_group__group_id"), date=OuterRef("date")
+        )
+        return Attendance.objects.filter(
+            Exists(lesson),
+            Q(student_group__is_archived=False)
+            | Q(student_group__archived_at__isnull=True)
+            | Q(date__lte=TruncDate("student_group__archived_at")),
+            student_group__group_id__in=self.groups,
+            date__range=(self.start, self.until),
+            date__gte=F("student_group__joined_at"),
+        )
+
+    def _marks(self):
+        """
+        {student_group_id: {period_start: (present, absent, last_present)}}
+        from one grouped query.
+        """
+        columns = {}
+        if self.period:
+            columns["bucket"] = PERIODS[self.period]("date")
+        rows = (
+            self._expected_marks()
+            .order_by()
+            .values("student_group_id", **columns)
+            .annotate(
+                present=Count("pk", filter=Q(is_present=True)),
+                absent=Count("pk", filter=Q(is_present=False)),
+                last_present=Max("date", filter=Q(is_present=True)),
+            )
+        )
+        marks = defaultdict(dict)
+        for row in rows:
+            bucket = row.get("bucket")
+            if hasattr(bucket, "date"):
+                bucket = bucket.date()
+            marks[row["student_group_id"]][bucket] = (
+                row["present"],
+                row["absent"],
+                row["last_present"],
+            )
+        return marks
+
+    def _absences(self):
+        absences = defaultdict(list)
+        rows = (
+            self._expected_marks()
+            .filter(is_present=False)
+            .order_by("student_group_id", "date")
+            .values_list("student_group_id", "date")
+        )
+        for student_group_id, day in rows:
+            absences[student_group_id].append(day)
+        return absences
+
+    def _compute(self):
+        if not self.lesson_days:
+            return []
+
+        enrollments = (
+            StudentGroup.objects.filter(group_id__in=self.groups)
+            .filter(Q(is_archived=False) | Q(archived_at__date__gte=self.start))
+            .values_list(
+                "pk",
+                "group_id",
+                "student_id",
+                "student__full_name",
+                "joined_at",
+                "is_archived",
+                "archived_at",
+            )
+        )
+        marks = self._marks()
+        absences = self._absences()
+
+        results = []
+        for (
+            pk,
+            group_id,
+            student_id,
+            name,
+            joined_at,
+            archived,
+            archived_at,
+        ) in enrollments:
+            days = self.lesson_days.get(group_id, [])
+            first = max(self.start, joined_at)
+            last = self.until
+            if archived and archived_at is not None:
+                last = min(last, timezone.localdate(archived_at))
+            held = days[bisect_left(days, first) : bisect_right(days, last)]
+
+            series = defaultdict(Counts)
+            for day in held:
+                series[period_start(day, self.period)].add(expected=1)
+            last_present = None
+            for bucket, (present, absent, bucket_last) in marks.get(pk, {}).items():
+                series[bucket].add(present=present, absent=absent)
+                if bucket_last and (last_present is None or bucket_last > last_present):
+                    last_present = bucket_last
+
+            total = Counts()
+            for counts in series.values():
+                total.merge(counts)
+            longest, current = absence_streaks(
+                absences.get(pk, []), self.lesson_index.get(group_id, {}), last_present
+            )
+            results.append(
+                {
+                    "student_group_id": pk,
+                    "group_id": group_id,
+                    "student_id": student_id,
+                    "full_name": name,
+                    "total": total,
+                    "series": series,
+                    "longest_streak": longest,
+                    "current_streak": current,
+                    "last_present": last_present,
+                }
+            )
+        return results
+
+    def _level_key(self, group, level):
+        if level == "teacher":
+            return group.teacher_id, group.teacher.full_name
+        if level == "branch":
+            return group.branch_id, group.branch.name
+        return group.pk, group.name
+
+    def at_risk(self):
+        """
+        Enrollments whose current absence streak reached the threshold,
+        longest streak first.
+        """
+        rows = []
+        for item in self.enrollments:
+            if item["current_streak"] < self.threshold:
+                continue
+            group = self.groups[item["group_id"]]
+            rows.append(
+                {
+                    "student_group_id": item["student_group_id"],
+                    "student_id": item["student_id"],
+                    "full_name": item["full_name"],
+                    "group": {"id": group.pk, "name": group.name},
+                    "teacher": {
+                        "id": group.teacher_id,
+                        "name": group.teacher.full_name,
+                    },
+                    "current_streak": item["current_streak"],
+                    "longest_streak": item["longest_streak"],
+                    "last_present": item["last_present"],
+                    "rate": item["total"].as_dict()["rate"],
+                }
+            )
+        rows.sort(key=lambda row: (-row["current_streak"], row["full_name"]))
+        return rows
+
+    def report(self, level="group"):
+        """
+        Rates rolled up per group, teacher or branch, with totals, the at-risk
+        list and, when a period is set, a time series per row.
+        """
+        rows = {}
+        for item in self.enrollments:
+            group = self.groups[item["group_id"]]
+            key, name = self._level_key(group, level)
+            row = rows.get(key)
+            if row is None:
+                row = rows[key] = {
+                    "id": key,
+                    "name": name,
+                    "students": 0,
+                    "at_risk": 0,
+                    "total": Counts(),
+                    "series": defaultdict(Counts),
+                }
+            row["students"] += 1
+            row["at_risk"] += item["current_streak"] >= self.threshold
+            row["total"].merge(item["total"])
+            for bucket, counts in item["series"].items():
+                row["series"][bucket].merge(counts)
+
+        totals = Counts()
+        output = []
+        for row in sorted(rows.values(), key=lambda row: row["name"] or ""):
+            totals.merge(row["total"])
+            item = {
+                "id": row["id"],
+                "name": row["name"],
+                "students": row["students"],
+                "at_risk": row["at_risk"],
+                **row["total"].as_dict(),
+            }
+            if level == "group":
+                item["lessons"] = len(self.lesson_days.get(row["id"], []))
+            if self.period:
+                item["series"] = [
+                    {"period": bucket, **counts.as_dict()}
+                    for bucket, counts in sorted(row["series"].items())
+                ]
+            output.append(item)
+
+        return {
+            "start_date": self.start,
+            "end_date": self.end,
+            "group_by": level,
+            "period": self.period,
+            "threshold": self.threshold,
+            "rows": output,
+            "totals": totals.as_dict(),
+            "at_risk": self.at_risk(),
+        }
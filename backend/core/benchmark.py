@@ -0,0 +1,257 @@
+"""
+API query-count and latency benchmark.
+
+`discover_endpoints` finds every GET endpoint under the core, finance and
+users APIs (router list/detail routes, extra actions and plain views).
+`run_benchmark` requests each one as the CEO and records the number of SQL
+queries, the time spent in the database and the wall time.
+
+Query counts are recorded twice: warm, with the cache filled by the previous
+requests, and cold, with the cache disabled, so endpoints that serve cached
+snapshots (dashboard stats, search) are measured on both paths. Both are
+compared with a stored baseline (`BASELINE_PATH`); an endpoint using more
+queries than its baseline is a regression. Timings are those of the warm
+requests; they are reported but never fail a run, they depend too much on
+the machine.
+"""
+
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+from dateutil.relativedelta import relativedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .models import Group, Student
+
+
+BASELINE_PATH = Path(__file__).with_name("benchmark_baseline.json")
+
+PREFIXES = ("api/core/", "api/finance/", "api/users/")
+
+# Used for the cold requests; the configured cache is left untouched
+COLD_CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+# Query strings for endpoints that need parameters to do real work. Values
+# are formatted with the keys of `_placeholders`.
+PARAMS = {
+    "attendance-analytics": {"group_by": "group", "period": "month"},
+    "global-search": {"q": "Aziz"},
+    "group-attendance": {"year": "{year}", "month": "{month}"},
+    "group-lesson-schedule": {"year": "{year}", "month": "{month}"},
+    "group-room-availability": {
+        "weekdays": "135",
+        "start_date": "{today}",
+        "end_date": "{month_end}",
+    },
+    "group-teacher-availability": {
+        "weekdays": "135",
+        "start_date": "{today}",
+        "end_date": "{month_end}",
+    },
+    "group-schedule-details": {"year": "{year}", "month": "{month}"},
+    "payroll-preview": {"month": "{period}"},
+    "schedule": {"year": "{year}", "month": "{month}"},
+    "student-enrollments": {"student_id": "{student}"},
+    "transaction-export": {"file_format": "csv"},
+    "transaction-report": {"group_by": "month,category"},
+}
+
+
+class Endpoint(NamedTuple):
+    name: str
+    path: str
+    params: dict
+
+
+def _walk(patterns, prefix=""):
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from _walk(pattern.url_patterns, route)
+        elif isinstance(pattern, URLPattern):
+            yield route, pattern
+
+
+def _allows_get(callback):
+    actions = getattr(callback, "actions", None)
+    if actions is not None:
+        return "get" in actions
+    view_class = getattr(callback, "view_class", None) or getattr(callback, "cls", None)
+    return view_class is not None and hasattr(view_class, "get")
+
+
+def _placeholders():
+    today = timezone.localdate()
+    return {
+        "today": today,
+        "month_end": today + relativedelta(day=31),
+        "year": today.year,
+        "month": today.month,
+        "period": f"{today:%Y-%m}",
+        "student": Student.objects.order_by("pk").values_list("pk", flat=True).first(),
+    }
+
+
+def _queryset_of(callback, user):
+    """
+    The queryset the view would serve to `user` when it has one.
+    """
+    view_class = getattr(callback, "cls", None)
+    if view_class is None or not hasattr(view_class, "get_queryset"):
+        return None
+    view = view_class(
+        request=Request(APIRequestFactory().get("/")),
+        action="retrieve",
+        kwargs={},
+        format_kwarg=None,
+    )
+    view.request.user = user
+    return view.get_queryset()
+
+
+def _sample_kwargs(callback, names, user):
+    """
+    Fills URL arguments with the pk of an object the view serves, or returns
+    None when there is nothing to point at.
+    """
+    kwargs = {}
+    for name in names:
+        if name == "group_id":
+            queryset = Group.objects.all()
+        elif name == "pk":
+            queryset = _queryset_of(callback, user)
+        else:
+            queryset = None
+        if queryset is None:
+            return None
+        pk = queryset.order_by("pk").values_list("pk", flat=True).first()
+        if pk is None:
+            return None
+        kwargs[name] = pk
+    return kwargs
+
+
+def discover_endpoints(user, prefixes=PREFIXES):
+    """
+    Returns one Endpoint per named GET route under `prefixes`, sorted by name.
+    URL arguments point at the first object `user` can see.
+    """
+    placeholders = _placeholders()
+    endpoints = {}
+    for route, pattern in _walk(get_resolver().url_patterns):
+        if not route.startswith(prefixes) or not pattern.name:
+            continue
+        names = list(pattern.pattern.regex.groupindex)
+        # Skip the router's API root and its `.json` format-suffix duplicates
+        if "format" in names or pattern.name == "api-root":
+            continue
+        if not _allows_get(pattern.callback) or pattern.name in endpoints:
+            continue
+        kwargs = _sample_kwargs(pattern.callback, names, user)
+        if kwargs is None:
+            continue
+        params = {
+            key: value.format(**placeholders)
+            for key, value in PARAMS.get(pattern.name, {}).items()
+        }
+        endpoints[pattern.name] = Endpoint(
+            pattern.name, reverse(pattern.name, kwargs=kwargs), params
+        )
+    return [endpoints[name] for name in sorted(endpoints)]
+
+
+def _request(client, endpoint):
+    """
+    Returns (response, queries, DB seconds, wall seconds) of one request.
+    """
+    with CaptureQueriesContext(connection) as captured:
+        started = time.perf_counter()
+        response = client.get(endpoint.path, endpoint.params)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        wall_time = time.perf_counter() - started
+    db_time = sum(float(query["time"]) for query in captured.captured_queries)
+    return response, len(captured), db_time, wall_time
+
+
+def measure(client, endpoint, repeat=3):
+    """
+    Requests the endpoint `repeat` times warm (after one warm-up request) and
+    `repeat` times cold, and returns its status, both query counts and the
+    median warm DB and wall times in ms.
+    """
+    client.get(endpoint.path, endpoint.params)
+    warm = [_request(client, endpoint) for _ in range(repeat)]
+    with override_settings(CACHES=COLD_CACHES):
+        cold = [_request(client, endpoint) for _ in range(repeat)]
+
+    responses, warm_queries, db_times, wall_times = zip(*warm)
+    cold_responses, cold_queries, _, _ = zip(*cold)
+
+    return {
+        "name": endpoint.name,
+        "path": endpoint.path,
+        "status": max(response.status_code for response in responses + cold_responses),
+        "queries": max(cold_queries),
+        "warm_queries": max(warm_queries),
+        "db_ms": round(statistics.median(db_times) * 1000, 2),
+        "wall_ms": round(statistics.median(wall_times) * 1000, 2),
+    }
+
+
+def run_benchmark(user, endpoints=None, repeat=3):
+    """
+    Measures every endpoint as `user`. Returns a list of result dicts.
+    """
+    client = APIClient()
+    client.force_authenticate(user)
+    if endpoints is None:
+        endpoints = discover_endpoints(user)
+    return [measure(client, endpoint, repeat) for endpoint in endpoints]
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path, encoding="utf-8") as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    baseline = {
+        result["name"]: {"cold": result["queries"], "warm": result["warm_queries"]}
+        for result in results
+    }
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(baseline, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+    return baseline
+
+
+def regressions(results, baseline):
+    """
+    Returns the results whose cold or warm query count exceeds the baseline,
+    with the allowed counts under "baseline". Endpoints missing from the
+    baseline are not regressions; they show up as new when the baseline is
+    refreshed.
+    """
+    failed = []
+    for result in results:
+        allowed = baseline.get(result["name"])
+        if allowed is None:
+            continue
+        if (
+            result["queries"] > allowed["cold"]
+            or result["warm_queries"] > allowed["warm"]
+        ):
+            failed.append({**result, "baseline": allowed})
+    return failed
@@ -1,8 +1,11 @@
 import django_filters
 from datetime import timedelta
 from django.utils import timezone
-from .models import Student, Group, StudentGroup, Room
+from rest_framework.filters import SearchFilter
+from .models import Student, Group, StudentGroup, Room, SearchEntry
+from .search import search
 from django.db.models import F, Sum, Max, Q, Exists, OuterRef
+from django.db.models import Case, IntegerField, Value, When
 
 
 class StudentFilter(django_filters.FilterSet):
@@ -34,19 +37,29 @@ class StudentFilter(django_filters.FilterSet):
     )
 
     # Filter by teacher ID
-    teacher_id = django_filters.NumberFilter(
-        field_name="group_memberships__group__teacher__id", distinct=True
-    )
+    teacher_id = django_filters.NumberFilter(method="filter_by_teacher")
+
     class Meta:
         model = Student
         fields = ["branch", "payment_status", "group_status", "teacher_id", "group_id"]
 
+    def filter_by_teacher(self, queryset, name, value):
+        # EXISTS keeps one row per student without DISTINCT over every column
+        return queryset.filter(
+            Exists(
+                StudentGroup.objects.filter(
+                    student=OuterRef("pk"), group__teacher_id=value
+                )
+            )
+        )
+
     def filter_by_group_status(self, queryset, name, value):
         today = timezone.now().date()
+        any_enrollment = Exists(StudentGroup.objects.filter(student=OuterRef("pk")))
 
         if value == "groupless":
             # Easiest case: find students with no StudentGroup memberships at all.
-            return queryset.filter(group_memberships__isnull=True).distinct()
+            return queryset.filter(~any_enrollment)
 
         # For 'active' and 'inactive', we need a more advanced query.
         # We will use a Subquery with Exists to check for the condition.
@@ -65,42 +78,20 @@ class StudentFilter(django_filters.FilterSet):
 
         if value == "active":
             # Find students who have AT LEAST ONE active enrollment.
-            return (
-                queryset.annotate(
-                    has_active_enrollment=Exists(active_enrollment_subquery)
-                )
-                .filter(has_active_enrollment=True)
-                .distinct()
-            )
+            return queryset.filter(Exists(active_enrollment_subquery))
 
         if value == "inactive":
             # This is the most complex case. An "inactive" student is one who:
             # 1. Is NOT groupless (they must have at least one past enrollment).
             # 2. Has NO active enrollments.
-            return (
-                queryset.filter(group_memberships__isnull=False)
-                .annotate(has_active_enrollment=Exists(active_enrollment_subquery))
-                .filter(has_active_enrollment=False)
-                .distinct()
+            return queryset.filter(any_enrollment).exclude(
+                Exists(active_enrollment_subquery)
             )
 
         return queryset
 
     def filter_by_payment_status(self, queryset, name, value):
-        # The queryset is already annotated with 'balance' from the ViewSet
-        queryset = queryset.annotate(
-            balance=Sum(
-                "group_memberships__transactions__amount",
-                filter=Q(group_memberships__transactions__transaction_type="CREDIT"),
-                default=0.0,
-            )
-            - Sum(
-                "group_memberships__transactions__amount",
-                filter=Q(group_memberships__transactions__transaction_type="DEBIT"),
-                default=0.0,
-            )
-        )
-
+        # 'balance' is a denormalized, indexed column on Student (finance.ledger)
         if value == "debtor":
             # "Qarzdor": Students whose balance is less than zero
             return queryset.filter(balance__lt=0)
@@ -206,3 +197,31 @@ class GroupFilter(django_filters.FilterSet):
         # This returns only the groups whose ID is NOT in the list of groups
         # that this student is already a member of.
         return queryset.exclude(students__student__id=student_id)
+
+
+class TransliteratedSearchFilter(SearchFilter):
+    """
+    `?search=` through the search index (core.search) instead of icontains:
+    matches names typed in Latin or Cyrillic, with spelling variants and
+    typos, and phone number digits. `search_kind` names the indexed kind.
+    Candidates are picked within the queryset, so rows the user can see are
+    never crowded out by matches elsewhere; the best `max_matches` are kept,
+    in rank order unless a paginator orders them.
+    """
+
+    max_matches = 100
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "").strip()
+        if not query:
+            return queryset
+        kind = getattr(view, "search_kind", SearchEntry.Kind.STUDENT)
+        matches = search(query, limit=self.max_matches, kinds=[kind], scope=queryset)
+        if not matches:
+            return queryset.none()
+        ranked = [match["object_id"] for match in matches]
+        rank = Case(
+            *[When(pk=pk, then=Value(index)) for index, pk in enumerate(ranked)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=ranked).order_by(rank)
@@ -0,0 +1,174 @@
+"""
+Materialized lesson schedule.
+
+`LessonOccurrence` stores every actual lesson of every group, as computed by
+core.schedule.LessonCalendar, so attendance, billing and payroll can join
+against an indexed table instead of recomputing the calendar per request.
+
+Rows are regenerated incrementally (see core.signals):
+
+- a Group whose dates, weekdays, times or room change, or which is archived
+  or restored, is regenerated whole;
+- a Holiday regenerates the groups running on its date;
+- a GroupScheduleOverride regenerates its group between the dates it touches.
+
+An archived group keeps its lessons up to the day it was archived and has
+none after it. Only rows that differ from the calendar are written. Writes
+that bypass model signals (`bulk_create`, `QuerySet.update`) must call
+`sync_lessons` or `rebuild_lessons`. Existing schedules are backfilled by
+migration 0015.
+"""
+
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from .models import Group, GroupScheduleOverride, LessonOccurrence
+from .schedule import LessonCalendar
+
+
+# Group fields the lessons are generated from
+SCHEDULE_FIELDS = (
+    "start_date",
+    "end_date",
+    "weekdays",
+    "course_start_time",
+    "course_end_time",
+    "room_id",
+    "is_archived",
+    "archived_at",
+)
+
+COMPARED_FIELDS = ("start_time", "end_time", "room_id", "source", "override_id")
+
+
+def schedule_of(group):
+    return tuple(getattr(group, field) for field in SCHEDULE_FIELDS)
+
+
+def last_lesson_day(group):
+    """
+    The day an archived group was archived, None while it is active.
+    """
+    if group.is_archived and group.archived_at is not None:
+        return timezone.localdate(group.archived_at)
+    return None
+
+
+def sync_lessons(groups, start=None, end=None):
+    """
+    Makes the stored lessons of `groups` match the calendar for dates in
+    [start, end]. Without a range every lesson of the groups is synced and
+    stale rows on any date are removed.
+    Returns (created, updated, deleted).
+    """
+    groups = list(groups)
+    if not groups:
+        return 0, 0, 0
+
+    full = start is None and end is None
+    if full:
+        # Extra lessons may fall outside the group's own dates
+        extra = GroupScheduleOverride.objects.filter(
+            group__in=groups, new_date__isnull=False
+        ).aggregate(first=Min("new_date"), last=Max("new_date"))
+        start = min(group.start_date for group in groups)
+        end = max(group.end_date for group in groups)
+        if extra["first"] is not None:
+            start = min(start, extra["first"])
+            end = max(end, extra["last"])
+    if start > end:
+        return 0, 0, 0
+
+    last_days = {group.pk: last_lesson_day(group) for group in groups}
+    expected = {}
+    for lesson in LessonCalendar(groups, start, end).all_lessons():
+        last_day = last_days[lesson.group_id]
+        if last_day is None or lesson.date <= last_day:
+            expected[(lesson.group_id, lesson.date)] = lesson
+
+    rooms = {group.pk: group.room_id for group in groups}
+    stored = LessonOccurrence.objects.filter(group_id__in=rooms)
+    if not full:
+        stored = stored.filter(date__range=(start, end))
+
+    to_update, to_delete = [], []
+    for occurrence in stored:
+        lesson = expected.pop((occurrence.group_id, occurrence.date), None)
+        if lesson is None:
+            to_delete.append(occurrence.pk)
+            continue
+        values = _values(lesson, rooms[lesson.group_id])
+        if any(getattr(occurrence, f) != values[f] for f in COMPARED_FIELDS):
+            for field, value in values.items():
+                setattr(occurrence, field, value)
+            to_update.append(occurrence)
+
+    to_create = [
+        LessonOccurrence(
+            group_id=group_id, date=day, **_values(lesson, rooms[group_id])
+        )
+        for (group_id, day), lesson in expected.items()
+    ]
+
+    with transaction.atomic():
+        if to_delete:
+            LessonOccurrence.objects.filter(pk__in=to_delete).delete()
+        LessonOccurrence.objects.bulk_update(
+            to_update, COMPARED_FIELDS, batch_size=1000
+        )
+        LessonOccurrence.objects.bulk_create(to_create, batch_size=1000)
+    return len(to_create), len(to_update), len(to_delete)
+
+
+def _values(lesson, room_id):
+    return {
+        "start_time": lesson.start_time,
+        "end_time": lesson.end_time,
+        "room_id": room_id,
+        "source": lesson.source,
+        "override_id": lesson.override_id,
+    }
+
+
+def sync_dates(dates):
+    """
+    Regenerates every group whose lessons may change on `dates` (e.g. after a
+    holiday is added or removed). A lesson rescheduled away from one of the
+    dates is synced too.
+    """
+    dates = {day for day in dates if day is not None}
+    if not dates:
+        return 0, 0, 0
+
+    running = Q(pk__in=[])
+    for day in dates:
+        running |= Q(start_date__lte=day, end_date__gte=day)
+    groups = list(Group.objects.filter(running))
+
+    moved_to = GroupScheduleOverride.objects.filter(
+        group__in=groups, original_date__in=dates, new_date__isnull=False
+    ).values_list("new_date", flat=True)
+    window = dates.union(moved_to)
+    return sync_lessons(groups, min(window), max(window))
+
+
+def rebuild_lessons(groups=None, batch_size=200):
+    """
+    Syncs every group (or the given queryset) in batches.
+    Returns the summed (created, updated, deleted).
+    """
+    if groups is None:
+        groups = Group.objects.all()
+    groups = groups.order_by("pk")
+
+    totals = [0, 0, 0]
+    batch = []
+    for group in groups.iterator(chunk_size=batch_size):
+        batch.append(group)
+        if len(batch) >= batch_size:
+            totals = [a + b for a, b in zip(totals, sync_lessons(batch))]
+            batch = []
+    if batch:
+        totals = [a + b for a, b in zip(totals, sync_lessons(batch))]
+    return tuple(totals)
@@ -0,0 +1,148 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core.benchmark import (
+    BASELINE_PATH,
+    load_baseline,
+    regressions,
+    run_benchmark,
+    save_baseline,
+)
+from core.synthetic import SyntheticData
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures SQL query counts, DB time and wall time of every GET endpoint "
+        "of the core, finance and users APIs, and fails when a query count "
+        "exceeds the stored baseline. Runs on a throwaway test database filled "
+        "with synthetic data unless --current-db is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="Defaults to 0.")
+        parser.add_argument(
+            "--scale",
+            type=int,
+            default=1,
+            help="Multiplies the synthetic volumes (200 students per step).",
+        )
+        parser.add_argument(
+            "--months",
+            type=int,
+            default=3,
+            help="Months of fees, payments and attendance. Defaults to 3.",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Measured warm and cold requests per endpoint. Defaults to 3.",
+        )
+        parser.add_argument(
+            "--baseline",
+            default=str(BASELINE_PATH),
+            help="Baseline file of query counts per endpoint.",
+        )
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Store the measured query counts as the new baseline.",
+        )
+        parser.add_argument(
+            "--current-db",
+            action="store_true",
+            help="Measure the configured database as is, without generating data.",
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the test database between runs.",
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the results as JSON."
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1 or options["scale"] < 1:
+            raise CommandError("--repeat and --scale must be positive integers.")
+
+        if options["current_db"]:
+            results = self.measure(options)
+        else:
+            results = self.measure_on_test_db(options)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.print_table(results)
+
+        if options["update_baseline"]:
+            save_baseline(results, options["baseline"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Baseline written to {options['baseline']}.")
+            )
+            return
+
+        baseline = load_baseline(options["baseline"])
+        failed = regressions(results, baseline)
+        for result in failed:
+            self.stderr.write(
+                f"{result['name']}: {result['queries']} cold, "
+                f"{result['warm_queries']} warm queries (baseline "
+                f"{result['baseline']['cold']} cold, {result['baseline']['warm']} warm)"
+            )
+        if failed:
+            raise CommandError(f"{len(failed)} endpoints exceed the query baseline.")
+        self.stdout.write(self.style.SUCCESS("No query count regressions."))
+
+    def measure_on_test_db(self, options):
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options["keepdb"], serialize=False
+        )
+        try:
+            scale = options["scale"]
+            counts = SyntheticData(
+                seed=options["seed"],
+                branches=2 * scale,
+                rooms=4,
+                teachers=8 * scale,
+                groups=20 * scale,
+                students=200 * scale,
+                months=options["months"],
+            ).generate()
+            self.stdout.write(
+                ", ".join(
+                    f"{label}: {count}" for label, count in sorted(counts.items())
+                )
+            )
+            return self.measure(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"]
+            )
+            teardown_test_environment()
+
+    def measure(self, options):
+        user = User.objects.filter(is_ceo=True, is_active=True).order_by("pk").first()
+        if user is None:
+            raise CommandError("An active CEO user is needed to call the API.")
+        return run_benchmark(user, repeat=options["repeat"])
+
+    def print_table(self, results):
+        self.stdout.write(
+            f"{'endpoint':<32} {'status':>6} {'cold':>5} {'warm':>5} "
+            f"{'db ms':>9} {'wall ms':>9}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['name']:<32} {result['status']:>6} "
+                f"{result['queries']:>5} {result['warm_queries']:>5} "
+                f"{result['db_ms']:>9} {result['wall_ms']:>9}"
+            )
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.lessons import rebuild_lessons
+from core.models import Group
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenerates the materialized lesson table from group schedules, "
+        "holidays and overrides. Needed after writes that bypass model signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--group",
+            type=int,
+            action="append",
+            dest="groups",
+            help="Only rebuild the given Group id (can be repeated).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Number of groups computed at once. Defaults to 200.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+        groups = None
+        if options["groups"]:
+            groups = Group.objects.filter(pk__in=options["groups"])
+        created, updated, deleted = rebuild_lessons(
+            groups, batch_size=options["batch_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Lessons: {created} created, {updated} updated, {deleted} deleted."
+            )
+        )
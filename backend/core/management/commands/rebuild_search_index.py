@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the global search index (students, parents, teachers, groups). "
+        "Needed after writes that bypass model signals, e.g. bulk imports."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of entries inserted per INSERT. Defaults to 1000.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+        total = rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} search entries."))
@@ -0,0 +1,114 @@
+import argparse
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.benchmark import run_benchmark
+from core.slowqueries import BUCKETS_MS, ORDERINGS, SlowQueryLog
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs a management command, or by default every GET endpoint of the "
+        "API, with the slow query log attached, and exports the statement "
+        "fingerprints with their latency histograms and the EXPLAIN plans of "
+        "the slow ones. Example: slow_queries --explain-ms 50 create_monthly_fees"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--explain-ms",
+            type=float,
+            default=100,
+            help="Capture EXPLAIN for statements at least this slow. Defaults to 100.",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help=(
+                "Use EXPLAIN ANALYZE where supported; runs read-only slow "
+                "SELECTs twice."
+            ),
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=1,
+            help="Requests per endpoint when measuring the API. Defaults to 1.",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=20, help="Fingerprints shown. Defaults to 20."
+        )
+        parser.add_argument(
+            "--order",
+            choices=ORDERINGS,
+            default="total",
+            help="Ordering of the fingerprints. Defaults to total time.",
+        )
+        parser.add_argument(
+            "--output", help="Write the full report as JSON to this file."
+        )
+        parser.add_argument(
+            "--json", action="store_true", help="Print the report as JSON."
+        )
+        parser.add_argument(
+            "workload",
+            nargs=argparse.REMAINDER,
+            help="Management command (and its arguments) to run instead of the API.",
+        )
+
+    def handle(self, *args, **options):
+        if options["limit"] < 1 or options["repeat"] < 1:
+            raise CommandError("--limit and --repeat must be positive integers.")
+
+        log = SlowQueryLog(explain_ms=options["explain_ms"], analyze=options["analyze"])
+        with log.capture():
+            if options["workload"]:
+                name, *arguments = options["workload"]
+                call_command(name, *arguments, stdout=self.stdout, stderr=self.stderr)
+            else:
+                user = (
+                    User.objects.filter(is_ceo=True, is_active=True)
+                    .order_by("pk")
+                    .first()
+                )
+                if user is None:
+                    raise CommandError("An active CEO user is needed to call the API.")
+                run_benchmark(user, repeat=options["repeat"])
+
+        if options["output"]:
+            report = log.snapshot(limit=log.max_fingerprints, order_by=options["order"])
+            with open(options["output"], "w", encoding="utf-8") as handle:
+                json.dump(report, handle, indent=2, cls=DjangoJSONEncoder)
+            self.stdout.write(
+                self.style.SUCCESS(f"Report written to {options['output']}.")
+            )
+
+        report = log.snapshot(limit=options["limit"], order_by=options["order"])
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2, cls=DjangoJSONEncoder))
+        else:
+            self.print_report(report)
+
+    def print_report(self, report):
+        self.stdout.write(f"{report['fingerprints']} fingerprints")
+        for row in report["queries"]:
+            if row["p95_ms"] is None:
+                p95 = f"> {BUCKETS_MS[-1]}"
+            else:
+                p95 = f"<= {row['p95_ms']}"
+            self.stdout.write(
+                f"\n[{row['fingerprint']}] {row['count']} calls, "
+                f"total {row['total_ms']} ms, avg {row['avg_ms']} ms, "
+                f"p95 {p95} ms, max {row['max_ms']} ms"
+            )
+            if row["caller"]:
+                self.stdout.write(f"  from {row['caller']}")
+            self.stdout.write(f"  {row['sql'][:300]}")
+            if row["plan"]:
+                self.stdout.write(f"  plan ({row['plan_ms']} ms):")
+                for line in row["plan"].splitlines():
+                    self.stdout.write(f"    {line}")
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_attendance_core_attend_student_e81481_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="student",
+            name="balance",
+            field=models.DecimalField(
+                decimal_places=2, default=0, editable=False, max_digits=14
+            ),
+        ),
+        migrations.AddField(
+            model_name="student",
+            name="total_credits",
+            field=models.DecimalField(
+                decimal_places=2, default=0, editable=False, max_digits=14
+            ),
+        ),
+        migrations.AddField(
+            model_name="student",
+            name="total_debits",
+            field=models.DecimalField(
+                decimal_places=2, default=0, editable=False, max_digits=14
+            ),
+        ),
+        migrations.AddField(
+            model_name="studentgroup",
+            name="balance",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                editable=False,
+                help_text="total_credits - total_debits",
+                max_digits=14,
+            ),
+        ),
+        migrations.AddField(
+            model_name="studentgroup",
+            name="total_credits",
+            field=models.DecimalField(
+                decimal_places=2, default=0, editable=False, max_digits=14
+            ),
+        ),
+        migrations.AddField(
+            model_name="studentgroup",
+            name="total_debits",
+            field=models.DecimalField(
+                decimal_places=2, default=0, editable=False, max_digits=14
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="student",
+            index=models.Index(
+                fields=["balance"], name="core_studen_balance_e78d06_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="studentgroup",
+            index=models.Index(
+                fields=["balance"], name="core_studen_balance_c58546_idx"
+            ),
+        ),
+    ]
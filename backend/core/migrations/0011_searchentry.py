@@ -0,0 +1,79 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_student_balance_student_total_credits_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("student", "O'quvchi"),
+                            ("parent", "Ota-ona"),
+                            ("teacher", "O'qituvchi"),
+                            ("group", "Guruh"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("object_id", models.PositiveBigIntegerField()),
+                ("name", models.CharField(help_text="Display name", max_length=150)),
+                (
+                    "phone",
+                    models.CharField(
+                        blank=True,
+                        help_text="Phone number digits as text",
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "text",
+                    models.CharField(
+                        help_text="Lowercased, Latin-transliterated name tokens",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "related_id",
+                    models.PositiveBigIntegerField(
+                        blank=True,
+                        help_text="Student of a parent, teacher of a group",
+                        null=True,
+                    ),
+                ),
+                ("is_archived", models.BooleanField(default=False)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Qidiruv yozuvi",
+                "verbose_name_plural": "Qidiruv yozuvlari",
+                "indexes": [
+                    models.Index(fields=["text"], name="core_search_text_c76f61_idx"),
+                    models.Index(fields=["phone"], name="core_search_phone_37090d_idx"),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("kind", "object_id"), name="unique_search_entry"
+                    )
+                ],
+            },
+        ),
+    ]
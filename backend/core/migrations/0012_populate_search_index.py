@@ -0,0 +1,159 @@
+import re
+import unicodedata
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+# Frozen copy of core.search.normalize / phone_digits as of this migration,
+# so later changes to core.search do not change what it writes
+CYRILLIC_TO_LATIN = {
+    "а": "a",
+    "б": "b",
+    "в": "v",
+    "г": "g",
+    "д": "d",
+    "е": "e",
+    "ё": "yo",
+    "ж": "j",
+    "з": "z",
+    "и": "i",
+    "й": "y",
+    "к": "k",
+    "л": "l",
+    "м": "m",
+    "н": "n",
+    "о": "o",
+    "п": "p",
+    "р": "r",
+    "с": "s",
+    "т": "t",
+    "у": "u",
+    "ф": "f",
+    "х": "x",
+    "ц": "ts",
+    "ч": "ch",
+    "ш": "sh",
+    "щ": "sh",
+    "ъ": "",
+    "ы": "i",
+    "ь": "",
+    "э": "e",
+    "ю": "yu",
+    "я": "ya",
+    "ў": "o",
+    "қ": "q",
+    "ғ": "g",
+    "ҳ": "h",
+}
+APOSTROPHES = "'`ʻʼ‘’"
+NON_WORD = re.compile(r"[^0-9a-z]+")
+NON_DIGIT = re.compile(r"\D+")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = "".join(CYRILLIC_TO_LATIN.get(char, char) for char in text)
+    for apostrophe in APOSTROPHES:
+        text = text.replace(apostrophe, "")
+    return NON_WORD.sub(" ", text).strip()
+
+
+def phone_digits(value):
+    return NON_DIGIT.sub("", str(value or ""))
+
+
+# The pg_trgm extension is created by TrigramExtension below, which needs
+# a role allowed to CREATE EXTENSION unless the extension already exists
+TRIGRAM_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS core_searchentry_text_trgm "
+    "ON core_searchentry USING gin (text gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS core_searchentry_phone_trgm "
+    "ON core_searchentry USING gin (phone gin_trgm_ops)",
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # SQLite has no trigram indexes; core.search falls back to an in-process one
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for statement in TRIGRAM_INDEXES:
+        schema_editor.execute(statement)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS core_searchentry_text_trgm")
+    schema_editor.execute("DROP INDEX IF EXISTS core_searchentry_phone_trgm")
+
+
+def populate_search_index(apps, schema_editor):
+    SearchEntry = apps.get_model("core", "SearchEntry")
+    Student = apps.get_model("core", "Student")
+    Parent = apps.get_model("core", "Parent")
+    Group = apps.get_model("core", "Group")
+    User = apps.get_model("users", "User")
+
+    entries = []
+    for student in Student.objects.all().iterator():
+        entries.append(
+            SearchEntry(
+                kind="student",
+                object_id=student.pk,
+                name=student.full_name,
+                phone=phone_digits(student.phone_number),
+                text=normalize(student.full_name),
+                is_archived=student.is_archived,
+            )
+        )
+    for parent in Parent.objects.all().iterator():
+        entries.append(
+            SearchEntry(
+                kind="parent",
+                object_id=parent.pk,
+                name=parent.full_name,
+                phone=phone_digits(parent.phone_number),
+                text=normalize(parent.full_name),
+                related_id=parent.student_id,
+                is_archived=parent.is_archived,
+            )
+        )
+    for user in User.objects.filter(is_teacher=True).iterator():
+        entries.append(
+            SearchEntry(
+                kind="teacher",
+                object_id=user.pk,
+                name=user.full_name,
+                phone=phone_digits(user.phone_number),
+                text=normalize(user.full_name),
+                is_archived=not user.is_active,
+            )
+        )
+    for group in Group.objects.all().iterator():
+        entries.append(
+            SearchEntry(
+                kind="group",
+                object_id=group.pk,
+                name=group.name,
+                text=normalize(group.name),
+                related_id=group.teacher_id,
+                is_archived=group.is_archived,
+            )
+        )
+    SearchEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_searchentry"),
+        ("users", "0004_rename_is_staff_user_is_ceo_user_enrollment_date_and_more"),
+    ]
+
+    operations = [
+        # Skipped on other databases, and when pg_trgm is already installed
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+        migrations.RunPython(populate_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,178 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:04
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+
+# Frozen copy of core.search.normalize / search_key as of this migration,
+# so later changes to core.search do not change what it writes
+CYRILLIC_TO_LATIN = {
+    "а": "a",
+    "б": "b",
+    "в": "v",
+    "г": "g",
+    "д": "d",
+    "е": "e",
+    "ё": "yo",
+    "ж": "j",
+    "з": "z",
+    "и": "i",
+    "й": "y",
+    "к": "k",
+    "л": "l",
+    "м": "m",
+    "н": "n",
+    "о": "o",
+    "п": "p",
+    "р": "r",
+    "с": "s",
+    "т": "t",
+    "у": "u",
+    "ф": "f",
+    "х": "x",
+    "ц": "ts",
+    "ч": "ch",
+    "ш": "sh",
+    "щ": "sh",
+    "ъ": "",
+    "ы": "i",
+    "ь": "",
+    "э": "e",
+    "ю": "yu",
+    "я": "ya",
+    "ў": "o",
+    "қ": "q",
+    "ғ": "g",
+    "ҳ": "h",
+}
+
+# Turkish-style letters some people type for Uzbek Latin
+LATIN_VARIANTS = {
+    "ş": "sh",
+    "ç": "ch",
+    "ğ": "g",
+    "ö": "o",
+    "ü": "u",
+    "ı": "i",
+}
+
+CYRILLIC_VOWELS = set("аеёиоуэюяў")
+# Cyrillic letters read with a leading "y" at the start of a word or after a
+# vowel or a sign: Евгений -> Yevgeniy, Ганиев -> Ganiyev
+IOTATED = {"е": "ye"}
+
+APOSTROPHES = "'`ʻʼ‘’´"
+
+# Applied in order to a normalized word to build its phonetic key
+KEY_RULES = [
+    ("sh", "ş"),
+    ("ch", "ç"),
+    ("kh", "h"),
+    ("x", "h"),
+    ("q", "k"),
+    ("w", "v"),
+    ("dj", "j"),
+    ("ts", "s"),
+    ("ye", "e"),
+    ("yo", "o"),
+    ("yu", "u"),
+    ("ya", "a"),
+    ("iy", "i"),
+]
+REPEATED = re.compile(r"(.)\1+")
+NON_WORD = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text):
+    """
+    'Шохрух Ғаниев' and "shoxrux g'aniyev" -> 'shoxrux ganiyev'-like tokens:
+    lowercase, Cyrillic transliterated to Latin, apostrophes dropped,
+    everything else that is not a letter or digit becomes a single space.
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = transliterate(text)
+    for apostrophe in APOSTROPHES:
+        text = text.replace(apostrophe, "")
+    return NON_WORD.sub(" ", text).strip()
+
+
+def transliterate(text):
+    letters = []
+    previous = ""
+    for char in text:
+        if char in IOTATED and (
+            not previous.isalpha() or previous in CYRILLIC_VOWELS or previous in "ъь"
+        ):
+            letters.append(IOTATED[char])
+        else:
+            letters.append(
+                CYRILLIC_TO_LATIN.get(char) or LATIN_VARIANTS.get(char, char)
+            )
+        previous = char
+    return "".join(letters)
+
+
+def search_key(text):
+    """
+    Phonetic key of an already normalized text: spelling variants are folded
+    (sh/ş, x/h/kh, q/k, ye/e, iy/i, ...) and doubled letters collapsed.
+    """
+    words = []
+    for word in text.split():
+        for old, new in KEY_RULES:
+            word = word.replace(old, new)
+        words.append(REPEATED.sub(r"\1", word))
+    return " ".join(words)
+
+
+def fill_keys(apps, schema_editor):
+    # Normalization now reads Cyrillic "е" as "ye" where Uzbek Latin does
+    SearchEntry = apps.get_model("core", "SearchEntry")
+    entries = []
+    for entry in SearchEntry.objects.all().iterator():
+        entry.text = normalize(entry.name)
+        entry.key = search_key(entry.text)
+        entries.append(entry)
+    SearchEntry.objects.bulk_update(entries, ["text", "key"], batch_size=1000)
+
+
+def create_key_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS core_searchentry_key_trgm "
+        "ON core_searchentry USING gin (key gin_trgm_ops)"
+    )
+
+
+def drop_key_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS core_searchentry_key_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_populate_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="searchentry",
+            name="key",
+            field=models.CharField(
+                blank=True,
+                help_text="Phonetic key of `text` for fuzzy matching",
+                max_length=255,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="searchentry",
+            index=models.Index(fields=["key"], name="core_search_key_cd7eb3_idx"),
+        ),
+        migrations.RunPython(fill_keys, migrations.RunPython.noop),
+        migrations.RunPython(create_key_trigram_index, drop_key_trigram_index),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_searchentry_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LessonOccurrence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(help_text="Date of the lesson")),
+                ("start_time", models.TimeField()),
+                ("end_time", models.TimeField()),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[
+                            ("regular", "Odatiy"),
+                            ("extra", "Qo'shimcha"),
+                            ("rescheduled", "Ko'chirilgan"),
+                        ],
+                        default="regular",
+                        max_length=12,
+                    ),
+                ),
+                (
+                    "group",
+                    models.ForeignKey(
+                        help_text="Group the lesson belongs to",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="lessons",
+                        to="core.group",
+                    ),
+                ),
+                (
+                    "override",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Override that produced a rescheduled or extra lesson",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="core.groupscheduleoverride",
+                    ),
+                ),
+                (
+                    "room",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="lessons",
+                        to="core.room",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Dars",
+                "verbose_name_plural": "Darslar",
+                "ordering": ["date", "start_time"],
+                "indexes": [
+                    models.Index(fields=["date"], name="core_lesson_date_fe888f_idx"),
+                    models.Index(
+                        fields=["room", "date"], name="core_lesson_room_id_9ad949_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("group", "date"), name="unique_lesson_per_group_day"
+                    )
+                ],
+            },
+        ),
+    ]
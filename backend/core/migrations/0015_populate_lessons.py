@@ -0,0 +1,106 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import migrations
+from django.utils import timezone
+
+
+# Frozen copy of the calendar rules of core.schedule.LessonCalendar and
+# core.lessons.sync_lessons as of this migration, so later changes to them do
+# not change what it writes
+def weekday_dates(weekdays, start, end):
+    dates = []
+    for weekday in {int(day) for day in weekdays}:
+        current = start + timedelta(days=(weekday - start.isoweekday()) % 7)
+        while current <= end:
+            dates.append(current)
+            current += timedelta(days=7)
+    return dates
+
+
+def group_lessons(group, holidays, overrides):
+    """
+    {date: (start_time, end_time, source, override_id)} of every lesson of
+    the group, up to the day it was archived.
+    """
+    default_times = (group.course_start_time, group.course_end_time)
+    lessons = {
+        day: (*default_times, "regular", None)
+        for day in weekday_dates(group.weekdays, group.start_date, group.end_date)
+        if day not in holidays
+    }
+    regular = set(lessons)
+    for override in overrides:
+        if override.original_date not in regular and override.new_date is None:
+            continue
+        times = (
+            override.new_start_time or group.course_start_time,
+            override.new_end_time or group.course_end_time,
+        )
+        if override.is_cancelled and override.original_date in lessons:
+            del lessons[override.original_date]
+        elif not override.is_extra and not override.is_cancelled:
+            lessons.pop(override.original_date, None)
+            if override.new_date is not None:
+                lessons[override.new_date] = (*times, "rescheduled", override.pk)
+        elif override.is_extra and override.new_date is not None:
+            lessons[override.new_date] = (*times, "extra", override.pk)
+
+    if group.is_archived and group.archived_at is not None:
+        last_day = timezone.localdate(group.archived_at)
+        lessons = {day: lesson for day, lesson in lessons.items() if day <= last_day}
+    return lessons
+
+
+def populate_lessons(apps, schema_editor, batch_size=200):
+    Group = apps.get_model("core", "Group")
+    GroupScheduleOverride = apps.get_model("core", "GroupScheduleOverride")
+    Holiday = apps.get_model("core", "Holiday")
+    LessonOccurrence = apps.get_model("core", "LessonOccurrence")
+
+    holidays = set(Holiday.objects.values_list("date", flat=True))
+
+    def write(groups):
+        overrides = defaultdict(list)
+        queryset = GroupScheduleOverride.objects.filter(group__in=groups)
+        for override in queryset.order_by("pk"):
+            overrides[override.group_id].append(override)
+        rows = [
+            LessonOccurrence(
+                group_id=group.pk,
+                date=day,
+                start_time=start_time,
+                end_time=end_time,
+                room_id=group.room_id,
+                source=source,
+                override_id=override_id,
+            )
+            for group in groups
+            for day, (start_time, end_time, source, override_id) in group_lessons(
+                group, holidays, overrides[group.pk]
+            ).items()
+        ]
+        # Groups already materialized by `rebuild_lessons` keep their rows
+        LessonOccurrence.objects.bulk_create(
+            rows, batch_size=1000, ignore_conflicts=True
+        )
+
+    batch = []
+    for group in Group.objects.order_by("pk").iterator(chunk_size=batch_size):
+        batch.append(group)
+        if len(batch) >= batch_size:
+            write(batch)
+            batch = []
+    if batch:
+        write(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_lessonoccurrence"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_lessons, migrations.RunPython.noop),
+    ]
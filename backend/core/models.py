@@ -1,12 +1,13 @@
 from __future__ import annotations
-from django.db import models
+from django.db import models, router, transaction
 from users.models import User
 from django.utils import timezone
-from django.db.models import Sum, Q
 from colorfield.fields import ColorField
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from datetime import date, timedelta
+from .schedule import LessonCalendar, regular_lesson_days
+from .occupancy import conflicts_as_messages, override_conflicts
 
 WEEKDAY_DIGIT_VALIDATOR = RegexValidator(
     regex=r"^[1-7]{1,7}$",
@@ -28,6 +29,39 @@ class BaseModel(models.Model):
         ordering = ["-created_at"]
 
 
+# Denormalized balance columns maintained by finance.ledger
+LEDGER_FIELDS = ("total_credits", "total_debits", "balance")
+
+
+class LedgerMixin:
+    """
+    Keeps the ledger columns out of ordinary saves of existing rows.
+    finance.ledger changes them with F() deltas, so writing back the totals
+    of an instance loaded earlier would undo concurrent payments.
+    Pass `update_fields` explicitly to write them.
+    """
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.attname
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in LEDGER_FIELDS
+            ]
+        # Signals that move ledger totals run in the same transaction
+        with transaction.atomic(
+            using=kwargs.get("using") or router.db_for_write(type(self))
+        ):
+            super().save(*args, **kwargs)
+
+
 class Branch(BaseModel):
     name = models.CharField(max_length=100, unique=True, help_text="Name of the branch")
     address = models.TextField(help_text="Physical address of the branch")
@@ -67,7 +101,7 @@ class Room(BaseModel):
         return f"{self.name} ({self.branch.name})"
 
 
-class Student(BaseModel):
+class Student(LedgerMixin, BaseModel):
     full_name = models.CharField(max_length=100, db_index=True)
     phone_number = models.BigIntegerField(
         help_text="Student's phone number", unique=True
@@ -90,11 +124,23 @@ class Student(BaseModel):
     )
     comment = models.TextField(blank=True, help_text="Notes about the student")
 
+    # Denormalized balance across all enrollments, maintained by finance.ledger
+    total_credits = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, editable=False
+    )
+    total_debits = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, editable=False
+    )
+    balance = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, editable=False
+    )
+
     class Meta:
         indexes = [
             models.Index(fields=["full_name"]),
             models.Index(fields=["phone_number"]),
             models.Index(fields=["branch"]),
+            models.Index(fields=["balance"]),
         ]
         verbose_name = "O'quvchi"
         verbose_name_plural = "O'quvchilar"
@@ -188,21 +234,29 @@ class Group(BaseModel):
 
     @property
     def current_price(self):
-        today = timezone.now().date()
-        return (
-            self.price_history.filter(start_date__lte=today)
-            .order_by("-start_date")
-            .first()
-            .price
-        )
+        # Annotated by finance.pricing.annotate_current_price on list querysets
+        if "_current_price" in self.__dict__:
+            return self._current_price
+        return self.get_price_on(timezone.now().date())
+
+    @current_price.setter
+    def current_price(self, value):
+        self._current_price = value
 
     def get_price_on(self, date):
-        return (
-            self.price_history.filter(start_date__lte=date)
-            .order_by("-start_date")
-            .first()
-            .price
-        )
+        # Resolve from prefetched price_history (no query) when available
+        prefetched = getattr(self, "_prefetched_objects_cache", {}).get("price_history")
+        if prefetched is not None:
+            prices = [p for p in prefetched if p.start_date <= date]
+            latest = max(prices, key=lambda p: p.start_date, default=None)
+        else:
+            latest = (
+                self.price_history.filter(start_date__lte=date)
+                .order_by("-start_date")
+                .first()
+            )
+        # None before the first price, on both paths
+        return latest.price if latest is not None else None
 
     def regular_lesson_days(self, start_date_range, end_date_range):
         """
@@ -211,29 +265,7 @@ class Group(BaseModel):
         :param end_date_range: The end of the date range to check (inclusive).
         :return: A sorted list of `datetime.date` objects representing the regular lesson days.
         """
-
-        # Convert group weekdays string '135' to a set of integers {1, 3, 5}
-        # Note: Django's weekday() is Monday=0, Sunday=6. ISO weekday is Monday=1, Sunday=7.
-        # We will use ISO weekday for clarity.
-        scheduled_weekdays = {int(day) for day in self.weekdays}
-
-        # Determine the effective date range for calculation, which is the intersection
-        # of the group's lifetime and the requested date range.
-        effective_start = max(self.start_date, start_date_range)
-        effective_end = min(self.end_date, end_date_range)
-
-        # Use a set for lesson_dates for efficient addition and removal
-        lesson_dates = set()
-
-        # Iterate day by day through the effective range
-        current_date = effective_start
-        while current_date <= effective_end:
-            # isoweekday(): Monday is 1 and Sunday is 7
-            if current_date.isoweekday() in scheduled_weekdays:
-                lesson_dates.add(current_date)
-            current_date += timedelta(days=1)
-
-        return sorted(list(lesson_dates))
+        return regular_lesson_days(self, start_date_range, end_date_range)
 
     def actual_lesson_days(self, start_date_range, end_date_range):
         """
@@ -245,58 +277,14 @@ class Group(BaseModel):
         3. Public holidays.
         4. Schedule overrides (cancellations, reschedules, and extra lessons).
 
+        Use `core.schedule.LessonCalendar` directly to compute many groups at once.
+
         :param start_date_range: The beginning of the date range to check (inclusive).
         :param end_date_range: The end of the date range to check (inclusive).
         :return: A sorted list of `datetime.date` objects representing the actual lesson days.
         """
-        effective_start = max(self.start_date, start_date_range)
-        effective_end = min(self.end_date, end_date_range)
-
-        # --- Step 1: Generate the base set of potential lesson days ---
-        # These are the days that fall on the group's schedule within the requested range.
-        lesson_dates: set = set(
-            self.regular_lesson_days(start_date_range, end_date_range)
-        )
-        # --- Step 2: Subtract holidays ---
-        # Get all holiday dates within the effective range from the database.
-        # .values_list('date', flat=True) is very efficient.
-        holidays_in_range = Holiday.objects.filter(
-            date__range=(effective_start, effective_end)
-        ).values_list("date", flat=True)
-
-        # Remove any lesson date that falls on a holiday
-        lesson_dates.difference_update(holidays_in_range)
-
-        # --- Step 3: Apply schedule overrides ---
-        # Get all relevant overrides for this group from the database.
-        overrides = self.schedule_overrides.filter(
-            # Find overrides that affect the calculated lesson dates
-            Q(original_date__in=lesson_dates)
-            |
-            # Or overrides that add a new lesson into our target range
-            Q(new_date__range=(start_date_range, end_date_range))
-        )
-
-        for override in overrides:
-            # If a lesson was cancelled, remove its original date
-            if override.is_cancelled and override.original_date in lesson_dates:
-                lesson_dates.remove(override.original_date)
-
-            # If a lesson was rescheduled, remove the original and add the new one
-            elif not override.is_extra and not override.is_cancelled:
-                if override.original_date in lesson_dates:
-                    lesson_dates.remove(override.original_date)
-                # Only add the new date if it falls within our target range
-                if start_date_range <= override.new_date <= end_date_range:
-                    lesson_dates.add(override.new_date)
-
-            # If it's an extra lesson, just add the new date
-            elif override.is_extra:
-                if start_date_range <= override.new_date <= end_date_range:
-                    lesson_dates.add(override.new_date)
-
-        # --- Step 4: Return the final, sorted list of dates ---
-        return sorted(list(lesson_dates))
+        calendar = LessonCalendar([self], start_date_range, end_date_range)
+        return calendar.actual_days(self)
 
     class Meta:
         indexes = [
@@ -320,7 +308,7 @@ class Group(BaseModel):
             raise ValidationError("Weekdays must be digits 1-7 only.")
 
 
-class StudentGroup(BaseModel):
+class StudentGroup(LedgerMixin, BaseModel):
     student = models.ForeignKey(
         "Student",
         on_delete=models.CASCADE,
@@ -342,6 +330,21 @@ class StudentGroup(BaseModel):
         help_text="Custom price for this student (leave blank to use group price)",
     )
 
+    # Denormalized balance for this enrollment, maintained by finance.ledger
+    total_credits = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, editable=False
+    )
+    total_debits = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, editable=False
+    )
+    balance = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        help_text="total_credits - total_debits",
+    )
+
     class Meta:
         unique_together = ("student", "group")
         verbose_name = "Student Group"
@@ -349,6 +352,7 @@ class StudentGroup(BaseModel):
         indexes = [
             models.Index(fields=["group"]),
             models.Index(fields=["student"]),
+            models.Index(fields=["balance"]),
         ]
 
     def __str__(self):
@@ -359,20 +363,12 @@ class StudentGroup(BaseModel):
         """
         Return student-specific price if set; else default group current price
         """
-        return self.price if self.price is not None else self.group.current_price
-
-    @property
-    def balance(self):
-        """
-        Calculates the real-time balance for this specific student-group enrollment.
-        """
-        aggregation = self.transactions.aggregate(
-            total_debits=Sum("amount", filter=Q(transaction_type="DEBIT"), default=0.0),
-            total_credits=Sum(
-                "amount", filter=Q(transaction_type="CREDIT"), default=0.0
-            ),
-        )
-        return aggregation["total_credits"] - aggregation["total_debits"]
+        if self.price is not None:
+            return self.price
+        # Annotated by finance.pricing.annotate_group_price on list querysets
+        if hasattr(self, "group_current_price"):
+            return self.group_current_price
+        return self.group.current_price
 
 
 class Attendance(models.Model):
@@ -501,3 +497,121 @@ class GroupScheduleOverride(models.Model):
                 raise ValidationError(
                     "Rescheduled lessons must have start and end time."
                 )
+
+        # The new lesson must not double-book the room or the teacher
+        if self.group_id and self.new_date:
+            room_conflicts, teacher_conflicts = override_conflicts(self)
+            messages = conflicts_as_messages(room_conflicts, "Xona")
+            messages += conflicts_as_messages(teacher_conflicts, "O'qituvchi")
+            if messages:
+                raise ValidationError(messages)
+
+
+class LessonOccurrence(models.Model):
+    """
+    One actual lesson of a group, materialized from core.schedule.LessonCalendar
+    and kept up to date by core.lessons (see core.signals).
+    """
+
+    class Source(models.TextChoices):
+        REGULAR = "regular", "Odatiy"
+        EXTRA = "extra", "Qo'shimcha"
+        RESCHEDULED = "rescheduled", "Ko'chirilgan"
+
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        related_name="lessons",
+        help_text="Group the lesson belongs to",
+    )
+    date = models.DateField(help_text="Date of the lesson")
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    room = models.ForeignKey(
+        Room,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="lessons",
+    )
+    source = models.CharField(
+        max_length=12, choices=Source.choices, default=Source.REGULAR
+    )
+    override = models.ForeignKey(
+        GroupScheduleOverride,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        help_text="Override that produced a rescheduled or extra lesson",
+    )
+
+    class Meta:
+        verbose_name = "Dars"
+        verbose_name_plural = "Darslar"
+        ordering = ["date", "start_time"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["group", "date"], name="unique_lesson_per_group_day"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["date"]),
+            models.Index(fields=["room", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.group.name}: {self.date} {self.start_time}-{self.end_time}"
+
+
+class SearchEntry(models.Model):
+    """
+    Normalized, searchable text of a student, parent, teacher or group.
+    Kept in sync by signals (core.signals) and queried by core.search.
+    """
+
+    class Kind(models.TextChoices):
+        STUDENT = "student", "O'quvchi"
+        PARENT = "parent", "Ota-ona"
+        TEACHER = "teacher", "O'qituvchi"
+        GROUP = "group", "Guruh"
+
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    object_id = models.PositiveBigIntegerField()
+    name = models.CharField(max_length=150, help_text="Display name")
+    phone = models.CharField(
+        max_length=20, blank=True, help_text="Phone number digits as text"
+    )
+    text = models.CharField(
+        max_length=255,
+        help_text="Lowercased, Latin-transliterated name tokens",
+    )
+    key = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="Phonetic key of `text` for fuzzy matching",
+    )
+    related_id = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Student of a parent, teacher of a group",
+    )
+    is_archived = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Qidiruv yozuvi"
+        verbose_name_plural = "Qidiruv yozuvlari"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "object_id"], name="unique_search_entry"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["text"]),
+            models.Index(fields=["key"]),
+            models.Index(fields=["phone"]),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.name}"
@@ -0,0 +1,449 @@
+"""
+Occupancy index for rooms and teachers (any resource a group occupies).
+
+A group occupies its resource on every one of its weekdays, between
+course_start_time and course_end_time, for its whole date range. Rescheduled
+and extra lessons (GroupScheduleOverride with a new_date) occupy it once, at
+the override's time.
+
+The index keeps, per (resource, weekday), the recurring slots sorted by
+start time and the one-off lessons sorted by date, so a conflict query is a
+couple of bisects plus the conflicts it reports.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+from datetime import time, timedelta
+
+from django.db.models import Q
+
+from .schedule import parse_weekdays, weekday_dates
+
+
+# A recurring weekly slot of a group.
+Slot = namedtuple(
+    "Slot",
+    [
+        "group_id",
+        "group_name",
+        "weekday",
+        "start",
+        "end",
+        "start_date",
+        "end_date",
+    ],
+)
+
+# A single dated lesson coming from a schedule override.
+OneOff = namedtuple(
+    "OneOff",
+    ["group_id", "group_name", "date", "start", "end", "override_id"],
+)
+
+Conflict = namedtuple(
+    "Conflict",
+    [
+        "group_id",
+        "group_name",
+        "weekday",
+        "date",
+        "start_time",
+        "end_time",
+        "override_id",
+    ],
+)
+
+
+WEEKDAY_NAMES = {
+    1: "Dushanba",
+    2: "Seshanba",
+    3: "Chorshanba",
+    4: "Payshanba",
+    5: "Juma",
+    6: "Shanba",
+    7: "Yakshanba",
+}
+
+
+def to_minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def from_minutes(minutes):
+    return time(minutes // 60, minutes % 60)
+
+
+def shares_weekday(weekday, start_a, end_a, start_b, end_b):
+    """
+    True if the two date ranges overlap on at least one day with this weekday.
+    """
+    start, end = max(start_a, start_b), min(end_a, end_b)
+    if start > end:
+        return False
+    return bool(weekday_dates({weekday}, start, min(end, start + timedelta(days=6))))
+
+
+class _Bucket:
+    """
+    Recurring slots of one (resource, weekday), sorted by start minute.
+    Slots longer than `max_length` cannot exist, so every slot overlapping
+    [start, end) starts in [start - max_length, end).
+    """
+
+    def __init__(self):
+        self.slots = []
+        self.starts = []
+        self.max_length = 0
+
+    def add(self, slot):
+        self.slots.append(slot)
+        self.max_length = max(self.max_length, slot.end - slot.start)
+
+    def freeze(self):
+        self.slots.sort(key=lambda slot: slot.start)
+        self.starts = [slot.start for slot in self.slots]
+
+    def overlapping(self, start, end):
+        low = bisect_right(self.starts, start - self.max_length)
+        high = bisect_left(self.starts, end)
+        for slot in self.slots[low:high]:
+            if slot.end > start and slot.start < end:
+                yield slot
+
+
+class OccupancyIndex:
+    """
+    Recurring and one-off occupancy of resources identified by `key`
+    (e.g. room id). Build it with `add_group` / `add_override`, or with one of
+    the `for_*` constructors, then query it.
+    """
+
+    def __init__(self, key_attr="room_id"):
+        self.key_attr = key_attr
+        self._weekly = defaultdict(_Bucket)
+        # (key, weekday) -> one-off lessons sorted by date
+        self._one_offs = defaultdict(list)
+        self._frozen = True
+
+    # --- building -------------------------------------------------------
+
+    def add_group(self, group, key=None):
+        key = getattr(group, self.key_attr) if key is None else key
+        if key is None:
+            return
+        for weekday in parse_weekdays(group.weekdays):
+            self._weekly[(key, weekday)].add(
+                Slot(
+                    group_id=group.pk,
+                    group_name=group.name,
+                    weekday=weekday,
+                    start=to_minutes(group.course_start_time),
+                    end=to_minutes(group.course_end_time),
+                    start_date=group.start_date,
+                    end_date=group.end_date,
+                )
+            )
+        self._frozen = False
+
+    def add_override(self, override, group, key=None):
+        """
+        Adds the lesson created by a reschedule/extra override.
+        Cancellations free a slot and are ignored (the index stays conservative).
+        """
+        if override.new_date is None or (
+            override.is_cancelled and not override.is_extra
+        ):
+            return
+        key = getattr(group, self.key_attr) if key is None else key
+        if key is None:
+            return
+        start_time = override.new_start_time or group.course_start_time
+        end_time = override.new_end_time or group.course_end_time
+        self._one_offs[(key, override.new_date.isoweekday())].append(
+            OneOff(
+                group_id=group.pk,
+                group_name=group.name,
+                date=override.new_date,
+                start=to_minutes(start_time),
+                end=to_minutes(end_time),
+                override_id=override.pk,
+            )
+        )
+        self._frozen = False
+
+    def _freeze(self):
+        if self._frozen:
+            return
+        for bucket in self._weekly.values():
+            bucket.freeze()
+        for lessons in self._one_offs.values():
+            lessons.sort(key=lambda lesson: lesson.date)
+        self._frozen = True
+
+    @classmethod
+    def build_many(cls, groups, start_date, end_date, key_attrs):
+        """
+        Builds one index per attribute in `key_attrs` (e.g. room_id and
+        teacher_id) from a Group queryset with two queries in total: one for the
+        groups alive in [start_date, end_date] and one for their overrides.
+        """
+        from .models import GroupScheduleOverride
+
+        indexes = {key_attr: cls(key_attr) for key_attr in key_attrs}
+        groups = list(
+            groups.filter(
+                is_archived=False, start_date__lte=end_date, end_date__gte=start_date
+            )
+        )
+        for group in groups:
+            for index in indexes.values():
+                index.add_group(group)
+
+        if groups:
+            by_id = {group.pk: group for group in groups}
+            overrides = GroupScheduleOverride.objects.filter(
+                group_id__in=by_id,
+                new_date__range=(start_date, end_date),
+            )
+            for override in overrides:
+                for index in indexes.values():
+                    index.add_override(override, by_id[override.group_id])
+        return indexes
+
+    @classmethod
+    def from_queryset(cls, groups, start_date, end_date, key_attr="room_id"):
+        return cls.build_many(groups, start_date, end_date, [key_attr])[key_attr]
+
+    @classmethod
+    def for_rooms(cls, start_date, end_date, rooms=None):
+        from .models import Group
+
+        groups = Group.objects.filter(room__isnull=False)
+        if rooms is not None:
+            groups = groups.filter(room__in=rooms)
+        return cls.from_queryset(groups, start_date, end_date, key_attr="room_id")
+
+    @classmethod
+    def for_teachers(cls, start_date, end_date, teachers=None):
+        from .models import Group
+
+        groups = Group.objects.all()
+        if teachers is not None:
+            groups = groups.filter(teacher__in=teachers)
+        return cls.from_queryset(groups, start_date, end_date, key_attr="teacher_id")
+
+    @classmethod
+    def for_room_and_teacher(cls, start_date, end_date, room=None, teacher=None):
+        """
+        Returns (room_index, teacher_index) for one room and one teacher,
+        built from the same two queries.
+        """
+        from .models import Group
+
+        query = Q(pk__in=[])
+        if room:
+            query |= Q(room=room)
+        if teacher:
+            query |= Q(teacher=teacher)
+        indexes = cls.build_many(
+            Group.objects.filter(query), start_date, end_date, ["room_id", "teacher_id"]
+        )
+        return indexes["room_id"], indexes["teacher_id"]
+
+    # --- queries --------------------------------------------------------
+
+    def conflicts(
+        self,
+        key,
+        weekdays,
+        start_time,
+        end_time,
+        start_date,
+        end_date,
+        exclude_group=None,
+    ):
+        """
+        Returns every Conflict between the schedule (weekdays, [start_time,
+        end_time), [start_date, end_date]) and what is already booked on `key`.
+        """
+        self._freeze()
+        start, end = to_minutes(start_time), to_minutes(end_time)
+        found = []
+        for weekday in sorted(parse_weekdays(weekdays)):
+            bucket = self._weekly.get((key, weekday))
+            if bucket is not None:
+                for slot in bucket.overlapping(start, end):
+                    if slot.group_id == exclude_group:
+                        continue
+                    if not shares_weekday(
+                        weekday, slot.start_date, slot.end_date, start_date, end_date
+                    ):
+                        continue
+                    found.append(
+                        Conflict(
+                            group_id=slot.group_id,
+                            group_name=slot.group_name,
+                            weekday=weekday,
+                            date=None,
+                            start_time=from_minutes(slot.start),
+                            end_time=from_minutes(slot.end),
+                            override_id=None,
+                        )
+                    )
+
+            lessons = self._one_offs.get((key, weekday), [])
+            low = bisect_left(lessons, start_date, key=lambda lesson: lesson.date)
+            high = bisect_right(lessons, end_date, key=lambda lesson: lesson.date)
+            for lesson in lessons[low:high]:
+                if lesson.group_id == exclude_group:
+                    continue
+                if lesson.end > start and lesson.start < end:
+                    found.append(
+                        Conflict(
+                            group_id=lesson.group_id,
+                            group_name=lesson.group_name,
+                            weekday=weekday,
+                            date=lesson.date,
+                            start_time=from_minutes(lesson.start),
+                            end_time=from_minutes(lesson.end),
+                            override_id=lesson.override_id,
+                        )
+                    )
+        return found
+
+    def date_conflicts(self, key, on_date, start_time, end_time, exclude_group=None):
+        """
+        Conflicts of a single dated lesson (e.g. a new override) on `key`.
+        """
+        return self.conflicts(
+            key,
+            str(on_date.isoweekday()),
+            start_time,
+            end_time,
+            on_date,
+            on_date,
+            exclude_group=exclude_group,
+        )
+
+    def busy_intervals(self, key, weekday, start_date, end_date):
+        """
+        Merged busy [start, end) minute intervals of `key` on this weekday
+        for any day in the date range.
+        """
+        self._freeze()
+        intervals = []
+        bucket = self._weekly.get((key, weekday))
+        if bucket is not None:
+            intervals.extend(
+                (slot.start, slot.end)
+                for slot in bucket.slots
+                if shares_weekday(
+                    weekday, slot.start_date, slot.end_date, start_date, end_date
+                )
+            )
+        intervals.extend(
+            (lesson.start, lesson.end)
+            for lesson in self._one_offs.get((key, weekday), [])
+            if start_date <= lesson.date <= end_date
+        )
+
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def free_slots(
+        self,
+        key,
+        weekdays,
+        start_date,
+        end_date,
+        day_start=time(8, 0),
+        day_end=time(21, 0),
+        min_duration=60,
+    ):
+        """
+        Returns [(start_time, end_time), ...] windows of at least
+        `min_duration` minutes that are free on every one of `weekdays`.
+        """
+        free = [(to_minutes(day_start), to_minutes(day_end))]
+        for weekday in parse_weekdays(weekdays):
+            busy = self.busy_intervals(key, weekday, start_date, end_date)
+            remaining = []
+            for free_start, free_end in free:
+                cursor = free_start
+                for busy_start, busy_end in busy:
+                    if busy_end <= cursor or busy_start >= free_end:
+                        continue
+                    if busy_start > cursor:
+                        remaining.append((cursor, busy_start))
+                    cursor = max(cursor, busy_end)
+                if cursor < free_end:
+                    remaining.append((cursor, free_end))
+            free = remaining
+
+        return [
+            (from_minutes(start), from_minutes(end))
+            for start, end in free
+            if end - start >= min_duration
+        ]
+
+
+def conflicts_as_messages(conflicts, label):
+    """
+    Human readable (Uzbek) messages for a list of conflicts.
+    `label` names the busy resource, e.g. "Xona" or "O'qituvchi".
+    """
+    messages = []
+    for conflict in conflicts:
+        when = (
+            conflict.date.isoformat()
+            if conflict.date
+            else WEEKDAY_NAMES[conflict.weekday]
+        )
+        messages.append(
+            f"{label} band! {when} {conflict.start_time:%H:%M}-{conflict.end_time:%H:%M} "
+            f"vaqtida '{conflict.group_name}' guruhi mavjud."
+        )
+    return messages
+
+
+def conflicts_as_data(conflicts):
+    return [conflict._asdict() for conflict in conflicts]
+
+
+def override_conflicts(override):
+    """
+    Returns (room_conflicts, teacher_conflicts) of the lesson an override
+    creates (reschedule/extra) against everything else booked that day.
+    """
+    if override.new_date is None or (override.is_cancelled and not override.is_extra):
+        return [], []
+
+    group = override.group
+    start_time = override.new_start_time or group.course_start_time
+    end_time = override.new_end_time or group.course_end_time
+    room_index, teacher_index = OccupancyIndex.for_room_and_teacher(
+        override.new_date, override.new_date, group.room_id, group.teacher_id
+    )
+
+    room_conflicts = []
+    if group.room_id:
+        room_conflicts = room_index.date_conflicts(
+            group.room_id,
+            override.new_date,
+            start_time,
+            end_time,
+            exclude_group=group.pk,
+        )
+    teacher_conflicts = teacher_index.date_conflicts(
+        group.teacher_id,
+        override.new_date,
+        start_time,
+        end_time,
+        exclude_group=group.pk,
+    )
+    return room_conflicts, teacher_conflicts
@@ -0,0 +1,310 @@
+"""
+Per-request profiling.
+
+`ProfilingMiddleware` profiles a sample of requests (PERF_SAMPLE_RATE) and
+records for each one:
+
+- the view name, method, status and wall time;
+- the number of SQL queries and the time spent in them, measured with
+  `connection.execute_wrapper` on every database alias;
+- the slowest statements, as fingerprints (SQL with literals and parameter
+  lists collapsed, see `fingerprint`);
+- the time spent producing `serializer.data`;
+- the response size in bytes.
+
+Each profile is logged as one JSON line on the "core.perf" logger, can be
+returned as a Server-Timing header (PERF_SERVER_TIMING) and is added to a
+bounded in-memory summary per view (`summary`, served by
+/api/ops/perf/). The summary belongs to the worker process that served the
+requests.
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import random
+import re
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from rest_framework.serializers import BaseSerializer
+
+
+logger = logging.getLogger("core.perf")
+
+# Recent wall times kept per view for the percentiles of the summary
+WINDOW = 500
+# Views and statements tracked in the summary; the least used are dropped
+MAX_VIEWS = 200
+MAX_STATEMENTS = 200
+
+_current = contextvars.ContextVar("perf_profile", default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_LIST = re.compile(r"\((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)")
+_ROW_LIST = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """
+    Normalizes a statement so that executions differing only in literals,
+    parameters or the length of IN / VALUES lists share one fingerprint.
+    Returns (id, normalized_sql), where id is a short stable hash.
+    """
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PARAM_LIST.sub("(...)", sql)
+    sql = _ROW_LIST.sub("(...)", sql)
+    sql = _SPACE.sub(" ", sql).strip()
+    return hashlib.md5(sql.encode()).hexdigest()[:12], sql
+
+
+class RequestProfile:
+    """
+    Figures collected while one request is served.
+    """
+
+    def __init__(self, keep_statements):
+        self.keep_statements = keep_statements
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+        # (seconds, sql) of the slowest statements, at most keep_statements
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(time.perf_counter() - started, sql)
+
+    def record(self, elapsed, sql):
+        self.queries += 1
+        self.sql_seconds += elapsed
+        if len(self.slowest) < self.keep_statements:
+            self.slowest.append((elapsed, sql))
+        elif self.slowest and elapsed > self.slowest[-1][0]:
+            self.slowest[-1] = (elapsed, sql)
+        else:
+            return
+        self.slowest.sort(key=lambda item: item[0], reverse=True)
+
+    def statements(self):
+        result = []
+        for seconds, sql in self.slowest:
+            fid, normalized = fingerprint(sql)
+            result.append({"fingerprint": fid, "sql": normalized, "ms": _ms(seconds)})
+        return result
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def _timed_data(data):
+    """
+    Wraps BaseSerializer.data so that the outermost evaluation during a
+    profiled request adds its duration to the profile.
+    """
+
+    def wrapper(serializer):
+        profile = _current.get()
+        if profile is None:
+            return data.fget(serializer)
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            profile.serializer_depth -= 1
+            if not profile.serializer_depth:
+                profile.serializer_seconds += time.perf_counter() - started
+
+    wrapper.perf_timed = True
+    return property(wrapper)
+
+
+def install():
+    """
+    Times serializer output. Called once from CoreConfig.ready().
+    """
+    if not getattr(BaseSerializer.data.fget, "perf_timed", False):
+        BaseSerializer.data = _timed_data(BaseSerializer.data)
+
+
+class PerfSummary:
+    """
+    Thread-safe aggregate of request profiles, per view and per slow
+    statement fingerprint, bounded in memory.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = timezone.now()
+            self.views = {}
+            self.statements = {}
+
+    def add(self, record):
+        with self.lock:
+            view = self.views.get(record["view"])
+            if view is None:
+                if len(self.views) >= MAX_VIEWS:
+                    self._drop_least_used(self.views)
+                view = self.views[record["view"]] = {
+                    "requests": 0,
+                    "errors": 0,
+                    "wall_ms": deque(maxlen=WINDOW),
+                    "queries": 0,
+                    "max_queries": 0,
+                    "sql_ms": 0.0,
+                    "serializer_ms": 0.0,
+                    "bytes": 0,
+                }
+            view["requests"] += 1
+            view["errors"] += record["status"] >= 500
+            view["wall_ms"].append(record["wall_ms"])
+            view["queries"] += record["queries"]
+            view["max_queries"] = max(view["max_queries"], record["queries"])
+            view["sql_ms"] += record["sql_ms"]
+            view["serializer_ms"] += record["serializer_ms"]
+            view["bytes"] += record["bytes"] or 0
+
+            for statement in record["slowest"]:
+                entry = self.statements.get(statement["fingerprint"])
+                if entry is None:
+                    if len(self.statements) >= MAX_STATEMENTS:
+                        self._drop_least_used(self.statements)
+                    entry = self.statements[statement["fingerprint"]] = {
+                        "sql": statement["sql"],
+                        "requests": 0,
+                        "total_ms": 0.0,
+                        "max_ms": 0.0,
+                        "views": set(),
+                    }
+                entry["requests"] += 1
+                entry["total_ms"] += statement["ms"]
+                entry["max_ms"] = max(entry["max_ms"], statement["ms"])
+                entry["views"].add(record["view"])
+
+    @staticmethod
+    def _drop_least_used(entries):
+        del entries[min(entries, key=lambda key: entries[key]["requests"])]
+
+    def snapshot(self, limit=20):
+        """
+        Views sorted by total wall time and the statements that were
+        among the slowest of their request, sorted by total time.
+        """
+        with self.lock:
+            views = []
+            for name, view in self.views.items():
+                count = view["requests"]
+                walls = sorted(view["wall_ms"])
+                views.append(
+                    {
+                        "view": name,
+                        "requests": count,
+                        "errors": view["errors"],
+                        "wall_ms_p50": round(statistics.median(walls), 2),
+                        "wall_ms_p95": walls[int(0.95 * (len(walls) - 1))],
+                        "wall_ms_max": walls[-1],
+                        "queries_avg": round(view["queries"] / count, 1),
+                        "queries_max": view["max_queries"],
+                        "sql_ms_avg": round(view["sql_ms"] / count, 2),
+                        "serializer_ms_avg": round(view["serializer_ms"] / count, 2),
+                        "bytes_avg": round(view["bytes"] / count),
+                        "_total": sum(walls) / len(walls) * count,
+                    }
+                )
+            statements = [
+                {
+                    "fingerprint": fid,
+                    "sql": entry["sql"],
+                    "requests": entry["requests"],
+                    "total_ms": round(entry["total_ms"], 2),
+                    "avg_ms": round(entry["total_ms"] / entry["requests"], 2),
+                    "max_ms": entry["max_ms"],
+                    "views": sorted(entry["views"]),
+                }
+                for fid, entry in self.statements.items()
+            ]
+            started_at = self.started_at
+
+        views.sort(key=lambda view: view.pop("_total"), reverse=True)
+        statements.sort(key=lambda statement: statement["total_ms"], reverse=True)
+        return {
+            "since": started_at,
+            "sample_rate": settings.PERF_SAMPLE_RATE,
+            "views": views[:limit],
+            "statements": statements[:limit],
+        }
+
+
+summary = PerfSummary()
+
+
+class ProfilingMiddleware:
+    """
+    Profiles PERF_SAMPLE_RATE of the requests (0 disables it, 1 profiles
+    every request). Should come first in MIDDLEWARE, so the wall time covers
+    the other middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.PERF_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return self.get_response(request)
+
+        profile = RequestProfile(settings.PERF_SLOWEST_STATEMENTS)
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        wall = time.perf_counter() - started
+
+        match = request.resolver_match
+        record = {
+            "view": match.view_name if match else "<unresolved>",
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "wall_ms": _ms(wall),
+            "queries": profile.queries,
+            "sql_ms": _ms(profile.sql_seconds),
+            "serializer_ms": _ms(profile.serializer_seconds),
+            "bytes": None if response.streaming else len(response.content),
+            "slowest": profile.statements(),
+        }
+        logger.info(json.dumps(record))
+        summary.add(record)
+
+        if settings.PERF_SERVER_TIMING:
+            response["Server-Timing"] = (
+                f'db;dur={record["sql_ms"]};desc="{profile.queries} queries", '
+                f'ser;dur={record["serializer_ms"]}, '
+                f'total;dur={record["wall_ms"]}'
+            )
+        return response
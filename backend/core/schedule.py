@@ -0,0 +1,221 @@
+"""
+Lesson calendar engine.
+
+Computes regular and actual lesson dates for many groups at once:
+
+- regular dates are generated arithmetically per weekday (one step of 7 days
+  per lesson) instead of walking the range day by day;
+- holidays and schedule overrides for a whole batch of groups are fetched
+  with two queries and applied in memory.
+
+`Group.regular_lesson_days` / `Group.actual_lesson_days` delegate here, so the
+single-group and batch paths share the same rules.
+"""
+
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.db.models import Q
+
+
+WEEK = timedelta(days=7)
+
+# One concrete lesson of a group. `source` is "regular", "rescheduled" or "extra";
+# `override_id` points to the GroupScheduleOverride that produced it, if any.
+Lesson = namedtuple(
+    "Lesson", ["group_id", "date", "start_time", "end_time", "source", "override_id"]
+)
+
+
+def parse_weekdays(weekdays):
+    """
+    Converts a weekdays string like '135' to a set of ISO weekdays {1, 3, 5}.
+    """
+    return {int(day) for day in weekdays}
+
+
+def weekday_dates(weekdays, start, end):
+    """
+    Returns a sorted list of dates in [start, end] (inclusive) whose ISO
+    weekday is in `weekdays` (a string like '135' or an iterable of ints).
+    """
+    if start > end:
+        return []
+
+    if isinstance(weekdays, str):
+        weekdays = parse_weekdays(weekdays)
+
+    dates = []
+    start_weekday = start.isoweekday()
+    for weekday in weekdays:
+        # First occurrence of this weekday on or after `start`
+        current = start + timedelta(days=(weekday - start_weekday) % 7)
+        while current <= end:
+            dates.append(current)
+            current += WEEK
+    dates.sort()
+    return dates
+
+
+def regular_lesson_days(group, start_date_range, end_date_range):
+    """
+    Regular lesson dates of a group: its weekdays, clipped to the intersection
+    of the group's lifetime and the requested range.
+    """
+    effective_start = max(group.start_date, start_date_range)
+    effective_end = min(group.end_date, end_date_range)
+    return weekday_dates(group.weekdays, effective_start, effective_end)
+
+
+def apply_overrides(lessons, overrides, start_date_range, end_date_range):
+    """
+    Applies schedule overrides (in order) to a {date: Lesson} mapping, in place.
+    """
+    for override in overrides:
+        in_range = (
+            override.new_date is not None
+            and start_date_range <= override.new_date <= end_date_range
+        )
+
+        # If a lesson was cancelled, remove its original date
+        if override.is_cancelled and override.original_date in lessons:
+            del lessons[override.original_date]
+
+        # If a lesson was rescheduled, remove the original and add the new one
+        elif not override.is_extra and not override.is_cancelled:
+            lessons.pop(override.original_date, None)
+            # Only add the new date if it falls within our target range
+            if in_range:
+                lessons[override.new_date] = _override_lesson(override, "rescheduled")
+
+        # If it's an extra lesson, just add the new date
+        elif override.is_extra:
+            if in_range:
+                lessons[override.new_date] = _override_lesson(override, "extra")
+    return lessons
+
+
+def _override_lesson(override, source):
+    group = override.group
+    return Lesson(
+        group_id=override.group_id,
+        date=override.new_date,
+        start_time=override.new_start_time or group.course_start_time,
+        end_time=override.new_end_time or group.course_end_time,
+        source=source,
+        override_id=override.pk,
+    )
+
+
+def _affects(override, lesson_dates, start_date_range, end_date_range):
+    """
+    An override is relevant when it moves/cancels one of the calculated lesson
+    dates, or adds a lesson into the requested range.
+    """
+    if override.original_date in lesson_dates:
+        return True
+    return (
+        override.new_date is not None
+        and start_date_range <= override.new_date <= end_date_range
+    )
+
+
+class LessonCalendar:
+    """
+    Actual lesson dates for a batch of groups over one date range.
+
+    Holidays and overrides for every group are loaded with two queries when
+    the calendar is created; all per-group answers are computed in memory.
+    """
+
+    def __init__(self, groups, start_date_range, end_date_range):
+        from .models import Holiday, GroupScheduleOverride
+
+        self.groups = list(groups)
+        self.start = start_date_range
+        self.end = end_date_range
+
+        self._regular = {
+            group.pk: regular_lesson_days(group, self.start, self.end)
+            for group in self.groups
+        }
+
+        all_days = [days for days in self._regular.values() if days]
+        if all_days:
+            first = min(days[0] for days in all_days)
+            last = max(days[-1] for days in all_days)
+            self.holidays = set(
+                Holiday.objects.filter(date__range=(first, last)).values_list(
+                    "date", flat=True
+                )
+            )
+        else:
+            first = last = None
+            self.holidays = set()
+
+        self.overrides = defaultdict(list)
+        if self.groups:
+            in_range = Q(new_date__range=(self.start, self.end))
+            if first is not None:
+                in_range |= Q(original_date__range=(first, last))
+            queryset = GroupScheduleOverride.objects.filter(
+                in_range, group_id__in=[group.pk for group in self.groups]
+            ).order_by("pk")
+            groups_by_id = {group.pk: group for group in self.groups}
+            for override in queryset:
+                # Share the already loaded group instead of a lazy FK lookup
+                override.group = groups_by_id[override.group_id]
+                self.overrides[override.group_id].append(override)
+
+    def regular_days(self, group):
+        return list(self._regular[group.pk])
+
+    def applied_overrides(self, group):
+        """
+        Overrides that affect this group's lessons in the range, in order.
+        """
+        lesson_dates = set(self._regular[group.pk]) - self.holidays
+        return [
+            override
+            for override in self.overrides.get(group.pk, [])
+            if _affects(override, lesson_dates, self.start, self.end)
+        ]
+
+    def lessons(self, group):
+        """
+        Returns the actual lessons of a group, sorted by date, with start/end
+        times taken from the override for rescheduled and extra lessons.
+        """
+        lessons = {
+            day: Lesson(
+                group_id=group.pk,
+                date=day,
+                start_time=group.course_start_time,
+                end_time=group.course_end_time,
+                source="regular",
+                override_id=None,
+            )
+            for day in self._regular[group.pk]
+            if day not in self.holidays
+        }
+        apply_overrides(lessons, self.applied_overrides(group), self.start, self.end)
+        return [lessons[day] for day in sorted(lessons)]
+
+    def actual_days(self, group):
+        return [lesson.date for lesson in self.lessons(group)]
+
+    def as_dict(self):
+        """
+        Returns {group_id: [actual lesson dates]} for every group in the batch.
+        """
+        return {group.pk: self.actual_days(group) for group in self.groups}
+
+    def all_lessons(self):
+        """
+        Returns the lessons of every group in the batch, ordered by date and time.
+        """
+        lessons = [lesson for group in self.groups for lesson in self.lessons(group)]
+        lessons.sort(
+            key=lambda lesson: (lesson.date, lesson.start_time, lesson.group_id)
+        )
+        return lessons
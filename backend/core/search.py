@@ -0,0 +1,553 @@
+"""
+Search over students, parents, teachers and groups.
+
+Every searchable object has one SearchEntry row holding its name normalized
+to lowercase Latin tokens (Cyrillic is transliterated) and its phone number
+digits as text, so both can be matched by substring without casting numbers.
+
+Names also get a phonetic `key` (see `search_key`) that folds the spelling
+variants staff actually type, e.g. "Shoxrux" / "Shohruh" / "Шохрух" /
+"Şohruh" all have the key "şohruh". Candidates are selected on that key by
+the database when it can do it with an index (pg_trgm on PostgreSQL),
+otherwise by an in-process trigram index built from the SearchEntry table.
+Candidates are then ranked in Python the same way on every backend, with an
+edit distance on the keys for near matches.
+"""
+
+import re
+import unicodedata
+import uuid
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import SearchEntry
+
+
+CYRILLIC_TO_LATIN = {
+    "а": "a",
+    "б": "b",
+    "в": "v",
+    "г": "g",
+    "д": "d",
+    "е": "e",
+    "ё": "yo",
+    "ж": "j",
+    "з": "z",
+    "и": "i",
+    "й": "y",
+    "к": "k",
+    "л": "l",
+    "м": "m",
+    "н": "n",
+    "о": "o",
+    "п": "p",
+    "р": "r",
+    "с": "s",
+    "т": "t",
+    "у": "u",
+    "ф": "f",
+    "х": "x",
+    "ц": "ts",
+    "ч": "ch",
+    "ш": "sh",
+    "щ": "sh",
+    "ъ": "",
+    "ы": "i",
+    "ь": "",
+    "э": "e",
+    "ю": "yu",
+    "я": "ya",
+    "ў": "o",
+    "қ": "q",
+    "ғ": "g",
+    "ҳ": "h",
+}
+
+# Turkish-style letters some people type for Uzbek Latin
+LATIN_VARIANTS = {
+    "ş": "sh",
+    "ç": "ch",
+    "ğ": "g",
+    "ö": "o",
+    "ü": "u",
+    "ı": "i",
+}
+
+CYRILLIC_VOWELS = set("аеёиоуэюяў")
+# Cyrillic letters read with a leading "y" at the start of a word or after a
+# vowel or a sign: Евгений -> Yevgeniy, Ганиев -> Ganiyev
+IOTATED = {"е": "ye"}
+
+APOSTROPHES = "'`ʻʼ‘’´"
+
+# Applied in order to a normalized word to build its phonetic key
+KEY_RULES = [
+    ("sh", "ş"),
+    ("ch", "ç"),
+    ("kh", "h"),
+    ("x", "h"),
+    ("q", "k"),
+    ("w", "v"),
+    ("dj", "j"),
+    ("ts", "s"),
+    ("ye", "e"),
+    ("yo", "o"),
+    ("yu", "u"),
+    ("ya", "a"),
+    ("iy", "i"),
+]
+REPEATED = re.compile(r"(.)\1+")
+NON_WORD = re.compile(r"[^0-9a-z]+")
+NON_DIGIT = re.compile(r"\D+")
+
+KIND_ORDER = {kind: index for index, kind in enumerate(SearchEntry.Kind.values)}
+
+
+def normalize(text):
+    """
+    'Шохрух Ғаниев' and "shoxrux g'aniyev" -> 'shoxrux ganiyev'-like tokens:
+    lowercase, Cyrillic transliterated to Latin, apostrophes dropped,
+    everything else that is not a letter or digit becomes a single space.
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = transliterate(text)
+    for apostrophe in APOSTROPHES:
+        text = text.replace(apostrophe, "")
+    return NON_WORD.sub(" ", text).strip()
+
+
+def transliterate(text):
+    letters = []
+    previous = ""
+    for char in text:
+        if char in IOTATED and (
+            not previous.isalpha() or previous in CYRILLIC_VOWELS or previous in "ъь"
+        ):
+            letters.append(IOTATED[char])
+        elif char in CYRILLIC_TO_LATIN:
+            # ъ and ь map to "", which must not fall back to the letter itself
+            letters.append(CYRILLIC_TO_LATIN[char])
+        else:
+            letters.append(LATIN_VARIANTS.get(char, char))
+        previous = char
+    return "".join(letters)
+
+
+def search_key(text):
+    """
+    Phonetic key of an already normalized text: spelling variants are folded
+    (sh/ş, x/h/kh, q/k, ye/e, iy/i, ...) and doubled letters collapsed.
+    """
+    words = []
+    for word in text.split():
+        for old, new in KEY_RULES:
+            word = word.replace(old, new)
+        words.append(REPEATED.sub(r"\1", word))
+    return " ".join(words)
+
+
+def edit_distance(a, b, limit=None):
+    """
+    Optimal string alignment distance (Levenshtein plus transpositions).
+    Stops early and returns limit + 1 once the distance exceeds `limit`.
+    """
+    if a == b:
+        return 0
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            cost = char_a != char_b
+            current[j] = min(
+                previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost
+            )
+            if (
+                previous2 is not None
+                and i > 1
+                and j > 1
+                and char_a == b[j - 2]
+                and a[i - 2] == char_b
+            ):
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if limit is not None and min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def allowed_typos(word):
+    if len(word) <= 3:
+        return 0
+    if len(word) <= 5:
+        return 1
+    if len(word) <= 9:
+        return 2
+    return 3
+
+
+def fuzzy_similarity(query_key, entry_key, distances=None):
+    """
+    Average over query words of how close each is to its best entry word,
+    comparing against the entry word's prefix so partially typed words match.
+    `distances` memoizes word distances across the entries of one search,
+    where the same first names and surnames come up again and again.
+    """
+    if distances is None:
+        distances = {}
+    entry_words = entry_key.split()
+    query_words = query_key.split()
+    if not entry_words or not query_words:
+        return 0.0
+    total = 0.0
+    for query_word in query_words:
+        limit = allowed_typos(query_word)
+        best = limit + 1
+        for entry_word in entry_words:
+            candidate = entry_word[: len(query_word) + limit]
+            pair = (query_word, candidate)
+            if pair not in distances:
+                distances[pair] = edit_distance(query_word, candidate, limit)
+            best = min(best, distances[pair])
+        if best <= limit:
+            total += 1 - best / (len(query_word) + 1)
+    return total / len(query_words)
+
+
+def phone_digits(value):
+    return NON_DIGIT.sub("", str(value or ""))
+
+
+def trigrams(text):
+    """
+    Trigrams of every word, padded like pg_trgm ('  w', ' wo', ..., 'rd ').
+    """
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def digit_trigrams(digits):
+    return {digits[i : i + 3] for i in range(len(digits) - 2)}
+
+
+# --- index maintenance ---------------------------------------------------
+
+
+def student_entry(student):
+    return {
+        "name": student.full_name,
+        "phone": phone_digits(student.phone_number),
+        "text": normalize(student.full_name),
+        "key": search_key(normalize(student.full_name)),
+        "related_id": None,
+        "is_archived": student.is_archived,
+    }
+
+
+def parent_entry(parent):
+    return {
+        "name": parent.full_name,
+        "phone": phone_digits(parent.phone_number),
+        "text": normalize(parent.full_name),
+        "key": search_key(normalize(parent.full_name)),
+        "related_id": parent.student_id,
+        "is_archived": parent.is_archived,
+    }
+
+
+def teacher_entry(user):
+    return {
+        "name": user.full_name,
+        "phone": phone_digits(user.phone_number),
+        "text": normalize(user.full_name),
+        "key": search_key(normalize(user.full_name)),
+        "related_id": None,
+        "is_archived": not user.is_active,
+    }
+
+
+def group_entry(group):
+    return {
+        "name": group.name,
+        "phone": "",
+        "text": normalize(group.name),
+        "key": search_key(normalize(group.name)),
+        "related_id": group.teacher_id,
+        "is_archived": group.is_archived,
+    }
+
+
+def save_entry(kind, object_id, fields):
+    SearchEntry.objects.update_or_create(
+        kind=kind, object_id=object_id, defaults=fields
+    )
+    mark_changed()
+
+
+def delete_entry(kind, object_id):
+    SearchEntry.objects.filter(kind=kind, object_id=object_id).delete()
+    mark_changed()
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Recreates every SearchEntry from the source tables.
+    Returns the number of entries written.
+    """
+    from users.models import User
+    from .models import Group, Parent, Student
+
+    sources = [
+        (SearchEntry.Kind.STUDENT, Student.objects.all(), student_entry),
+        (SearchEntry.Kind.PARENT, Parent.objects.all(), parent_entry),
+        (
+            SearchEntry.Kind.TEACHER,
+            User.objects.filter(is_teacher=True),
+            teacher_entry,
+        ),
+        (SearchEntry.Kind.GROUP, Group.objects.all(), group_entry),
+    ]
+    total = 0
+    with transaction.atomic():
+        SearchEntry.objects.all().delete()
+        for kind, queryset, build in sources:
+            batch = []
+            for obj in queryset.iterator(chunk_size=batch_size):
+                batch.append(SearchEntry(kind=kind, object_id=obj.pk, **build(obj)))
+                if len(batch) >= batch_size:
+                    SearchEntry.objects.bulk_create(batch)
+                    total += len(batch)
+                    batch = []
+            SearchEntry.objects.bulk_create(batch)
+            total += len(batch)
+    mark_changed()
+    return total
+
+
+# --- in-process trigram index (fallback) ---------------------------------
+
+VERSION_KEY = "core:search-index-version"
+ENTRY_FIELDS = (
+    "id",
+    "kind",
+    "object_id",
+    "name",
+    "phone",
+    "text",
+    "key",
+    "related_id",
+    "is_archived",
+)
+_local_index = None
+# Candidates checked against a scope queryset per query
+SCOPE_CHUNK = 500
+
+
+def mark_changed():
+    """
+    Tells every process that its in-memory index is stale, once the current
+    transaction commits.
+    """
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex, None))
+
+
+class TrigramIndex:
+    """
+    Inverted indexes trigram -> entry ids over all SearchEntry rows (name keys
+    and phone digits), used where the database has no trigram index (SQLite).
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.entries = {}
+        # kind -> trigram -> entry ids, so a kind filter never scans other kinds
+        self.name_postings = defaultdict(lambda: defaultdict(set))
+        self.phone_postings = defaultdict(lambda: defaultdict(set))
+
+    @classmethod
+    def load(cls, version=None):
+        index = cls(version)
+        rows = SearchEntry.objects.values_list(*ENTRY_FIELDS)
+        for row in rows.iterator(chunk_size=2000):
+            index.add(dict(zip(ENTRY_FIELDS, row)))
+        return index
+
+    def add(self, entry):
+        self.entries[entry["id"]] = entry
+        names = self.name_postings[entry["kind"]]
+        for gram in trigrams(entry["key"]):
+            names[gram].add(entry["id"])
+        phones = self.phone_postings[entry["kind"]]
+        for gram in digit_trigrams(entry["phone"]):
+            phones[gram].add(entry["id"])
+
+    def candidates(
+        self, key, digits, limit, kinds=None, min_similarity=0.3, scope=None
+    ):
+        kinds = kinds or list(self.name_postings)
+        query_grams = trigrams(key)
+        needed = max(1, round(len(query_grams) * min_similarity))
+
+        # An entry sharing `needed` of the n query trigrams shares at least one
+        # of the n - needed + 1 rarest ones, so the most common trigrams
+        # (e.g. the "ov " of most surnames) are never scanned. Their hits are
+        # left out of the candidate order; the final ranking is done by `score`.
+        hits = Counter()
+        rare_count = len(query_grams) - needed + 1
+        for kind in kinds:
+            postings = self.name_postings.get(kind, {})
+            ranked = sorted((postings.get(gram, ()) for gram in query_grams), key=len)
+            # Counter.update counts a whole posting set at C speed
+            for posting in ranked[:rare_count]:
+                hits.update(posting)
+        needed = min(needed, rare_count)
+
+        if digits:
+            # Every trigram of the digits must be present, then check the order
+            bonus = len(query_grams) + 1
+            for kind in kinds:
+                postings = self.phone_postings.get(kind, {})
+                sets = [postings.get(gram, set()) for gram in digit_trigrams(digits)]
+                for entry_id in set.intersection(*sets) if sets else ():
+                    if digits in self.entries[entry_id]["phone"]:
+                        hits[entry_id] += bonus
+
+        if scope is None:
+            return [
+                self.entries[entry_id]
+                for entry_id, count in hits.most_common(limit)
+                if count >= needed
+            ]
+
+        # Scope before the limit, so matches outside it never crowd it out:
+        # the database is asked which hits it holds, best first, a chunk at
+        # a time, until `limit` are found
+        ranked = [
+            self.entries[entry_id]
+            for entry_id, count in hits.most_common()
+            if count >= needed
+        ]
+        found = []
+        for offset in range(0, len(ranked), SCOPE_CHUNK):
+            chunk = ranked[offset : offset + SCOPE_CHUNK]
+            in_scope = set(
+                scope.order_by()
+                .filter(pk__in=[entry["object_id"] for entry in chunk])
+                .values_list("pk", flat=True)
+            )
+            found.extend(entry for entry in chunk if entry["object_id"] in in_scope)
+            if limit is not None and len(found) >= limit:
+                break
+        return found[:limit]
+
+
+def get_local_index():
+    global _local_index
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(VERSION_KEY, version, None)
+    if _local_index is None or _local_index.version != version:
+        _local_index = TrigramIndex.load(version)
+    return _local_index
+
+
+# --- querying --------------------------------------------------------------
+
+
+def database_candidates(key, digits, limit, kinds=None, scope=None):
+    """
+    PostgreSQL: LIKE and word-similarity on `key` are served by the pg_trgm
+    GIN index, phone substrings by the trigram index on `phone`.
+    """
+    from django.contrib.postgres.search import TrigramWordSimilarity
+    from django.db.models import Q
+
+    condition = Q(pk__in=[])
+    if key:
+        condition |= Q(key__contains=key) | Q(key__trigram_word_similar=key)
+    if digits:
+        condition |= Q(phone__contains=digits)
+    queryset = SearchEntry.objects.filter(condition)
+    if kinds:
+        queryset = queryset.filter(kind__in=kinds)
+    if scope is not None:
+        queryset = queryset.filter(object_id__in=scope.order_by().values("pk"))
+    if key:
+        queryset = queryset.annotate(
+            similarity=TrigramWordSimilarity(key, "key")
+        ).order_by("-similarity")
+    return list(queryset.values(*ENTRY_FIELDS)[:limit])
+
+
+def uses_database_trigrams():
+    return connection.vendor == "postgresql"
+
+
+def score(text, key, digits, entry, distances=None):
+    """
+    Relevance in [0, 1]: name prefix > word prefix > substring (as typed,
+    then on the phonetic key) > edit-distance near match; phone matches score
+    by position. Archived rows rank lower.
+    """
+    best = 0.0
+    if text:
+        if entry["text"].startswith(text):
+            best = 1.0
+        elif any(word.startswith(text) for word in entry["text"].split()):
+            best = 0.9
+        elif entry["key"].startswith(key):
+            best = 0.85
+        elif any(word.startswith(key) for word in entry["key"].split()):
+            best = 0.8
+        elif text in entry["text"] or key in entry["key"]:
+            best = 0.75
+        else:
+            best = 0.7 * fuzzy_similarity(key, entry["key"], distances)
+    if digits and digits in entry["phone"]:
+        best = max(best, 0.95 if entry["phone"].endswith(digits) else 0.85)
+    if entry["is_archived"]:
+        best *= 0.8
+    return best
+
+
+def search(query, limit=20, kinds=None, candidate_limit=200, scope=None):
+    """
+    Returns up to `limit` ranked SearchEntry dicts (with a `score` key) for a
+    free-text query; digits in the query are matched against phone numbers.
+    `scope` is a queryset of the objects of one kind the candidates must
+    belong to, applied before `candidate_limit`.
+    """
+    text = normalize(query)
+    digits = phone_digits(query)
+    if len(digits) < 3:
+        digits = ""
+    if len(text) < 2 and not digits:
+        return []
+
+    key = search_key(text)
+    if uses_database_trigrams():
+        found = database_candidates(key, digits, candidate_limit, kinds, scope)
+    else:
+        found = get_local_index().candidates(
+            key, digits, candidate_limit, kinds, scope=scope
+        )
+
+    results = []
+    distances = {}
+    for entry in found:
+        entry_score = score(text, key, digits, entry, distances)
+        if entry_score > 0:
+            results.append({**entry, "score": round(entry_score, 3)})
+
+    results.sort(
+        key=lambda entry: (-entry["score"], KIND_ORDER[entry["kind"]], entry["name"])
+    )
+    return results[:limit]
@@ -20,6 +20,19 @@ from django.utils import timezone
 from datetime import timedelta
 
 
+def validate_weekdays(value):
+    """
+    Ensures weekdays only contains unique digits from 1 to 7.
+    """
+    if not value.isdigit() or not all(day in "1234567" for day in value):
+        raise serializers.ValidationError(
+            "Hafta kunlari faqat 1-7 oralig'idagi raqamlar bo'lishi kerak."
+        )
+    if len(set(value)) != len(value):
+        raise serializers.ValidationError("Hafta kunlari takrorlanmasligi kerak.")
+    return value
+
+
 class BranchSerializer(serializers.ModelSerializer):
     """
     Serializer for the Branch model.
@@ -278,16 +291,48 @@ class GroupSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
     def validate_weekdays(self, value):
-        """
-        Ensures weekdays only contains unique digits from 1 to 7.
-        """
-        if not value.isdigit() or not all(day in "1234567" for day in value):
+        return validate_weekdays(value)
+
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the room/teacher availability endpoints.
+    """
+
+    weekdays = serializers.CharField(max_length=7)
+    course_start_time = serializers.TimeField(required=False)
+    course_end_time = serializers.TimeField(required=False)
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    branch = serializers.IntegerField(required=False)
+    room = serializers.IntegerField(required=False)
+    teacher = serializers.ListField(child=serializers.IntegerField(), required=False)
+    exclude_group = serializers.IntegerField(required=False)
+    min_duration = serializers.IntegerField(required=False, default=60, min_value=1)
+
+    def validate_weekdays(self, value):
+        return validate_weekdays(value)
+
+    def validate(self, data):
+        if data["start_date"] > data["end_date"]:
+            raise serializers.ValidationError(
+                {
+                    "end_date": "Kursning tugash sanasi boshlanish sanasidan oldin bo'lishi mumkin emas."
+                }
+            )
+        start_time = data.get("course_start_time")
+        end_time = data.get("course_end_time")
+        if (start_time is None) != (end_time is None):
+            raise serializers.ValidationError(
+                "course_start_time va course_end_time birga kiritilishi kerak."
+            )
+        if start_time and start_time >= end_time:
             raise serializers.ValidationError(
-                "Hafta kunlari faqat 1-7 oralig'idagi raqamlar bo'lishi kerak."
+                {
+                    "course_end_time": "Darsning tugash vaqti boshlanish vaqtidan keyin bo'lishi kerak."
+                }
             )
-        if len(set(value)) != len(value):
-            raise serializers.ValidationError("Hafta kunlari takrorlanmasligi kerak.")
-        return value
+        return data
 
 
 class ParentCreateSerializer(serializers.ModelSerializer):
@@ -635,6 +680,54 @@ class AttendanceSerializer(serializers.ModelSerializer):
         ]
 
 
+class AttendanceAnalyticsQuerySerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the attendance analytics endpoint.
+    Defaults to the last 7 days.
+    """
+
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(
+        choices=["group", "teacher", "branch"], default="group"
+    )
+    period = serializers.ChoiceField(
+        choices=["week", "month"], required=False, allow_null=True, default=None
+    )
+    threshold = serializers.IntegerField(default=3, min_value=1)
+    branch = serializers.IntegerField(required=False)
+    teacher = serializers.IntegerField(required=False)
+    group = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        today = timezone.localdate()
+        data.setdefault("end_date", today)
+        data.setdefault("start_date", data["end_date"] - timedelta(days=6))
+        if data["start_date"] > data["end_date"]:
+            raise serializers.ValidationError(
+                {
+                    "end_date": "Tugash sanasi boshlanish sanasidan oldin bo'lishi mumkin emas."
+                }
+            )
+        if (data["end_date"] - data["start_date"]).days > 366:
+            raise serializers.ValidationError(
+                {"start_date": "Oraliq 1 yildan oshmasligi kerak."}
+            )
+        return data
+
+
+class AttendanceCellSerializer(serializers.Serializer):
+    """
+    One cell of the bulk attendance payload.
+    `is_present: null` removes the mark.
+    """
+
+    student_group_id = serializers.IntegerField()
+    date = serializers.DateField()
+    is_present = serializers.BooleanField(allow_null=True)
+    comment = serializers.CharField(required=False, allow_blank=True, default="")
+
+
 class ParentDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Parent
@@ -0,0 +1,181 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from finance.models import Transaction
+from users.models import User
+from . import lessons, search
+from .models import (
+    Group,
+    GroupScheduleOverride,
+    Holiday,
+    Parent,
+    SearchEntry,
+    Student,
+    StudentGroup,
+)
+from .stats import invalidate_dashboard_stats
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=StudentGroup)
+@receiver(post_delete, sender=StudentGroup)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_dashboard_snapshot(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate_dashboard_stats()
+
+
+# --- search index --------------------------------------------------------
+
+
+@receiver(post_save, sender=Student)
+def index_student(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.save_entry(
+            SearchEntry.Kind.STUDENT, instance.pk, search.student_entry(instance)
+        )
+
+
+@receiver(post_save, sender=Parent)
+def index_parent(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.save_entry(
+            SearchEntry.Kind.PARENT, instance.pk, search.parent_entry(instance)
+        )
+
+
+@receiver(post_save, sender=User)
+def index_teacher(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.is_teacher:
+        search.save_entry(
+            SearchEntry.Kind.TEACHER, instance.pk, search.teacher_entry(instance)
+        )
+    else:
+        search.delete_entry(SearchEntry.Kind.TEACHER, instance.pk)
+
+
+@receiver(post_save, sender=Group)
+def index_group(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.save_entry(
+            SearchEntry.Kind.GROUP, instance.pk, search.group_entry(instance)
+        )
+
+
+SEARCH_KINDS = {
+    Student: SearchEntry.Kind.STUDENT,
+    Parent: SearchEntry.Kind.PARENT,
+    User: SearchEntry.Kind.TEACHER,
+    Group: SearchEntry.Kind.GROUP,
+}
+
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Parent)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Group)
+def unindex_object(sender, instance, **kwargs):
+    search.delete_entry(SEARCH_KINDS[sender], instance.pk)
+
+
+# --- materialized lessons ------------------------------------------------
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_schedule(sender, instance, raw=False, **kwargs):
+    instance._previous_schedule = None
+    if instance.pk and not raw:
+        instance._previous_schedule = (
+            Group.objects.filter(pk=instance.pk)
+            .values_list(*lessons.SCHEDULE_FIELDS)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Group)
+def sync_group_lessons(sender, instance, created, raw=False, **kwargs):
+    # Fixtures (raw) are materialized with `rebuild_lessons` instead.
+    if raw:
+        return
+    previous = getattr(instance, "_previous_schedule", None)
+    if created or previous != lessons.schedule_of(instance):
+        lessons.sync_lessons([instance])
+
+
+@receiver(pre_save, sender=Holiday)
+def remember_holiday_date(sender, instance, raw=False, **kwargs):
+    instance._previous_date = None
+    if instance.pk and not raw:
+        instance._previous_date = (
+            Holiday.objects.filter(pk=instance.pk)
+            .values_list("date", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Holiday)
+def sync_holiday_lessons(sender, instance, raw=False, **kwargs):
+    if not raw:
+        lessons.sync_dates({instance.date, getattr(instance, "_previous_date", None)})
+
+
+@receiver(post_delete, sender=Holiday)
+def sync_deleted_holiday_lessons(sender, instance, **kwargs):
+    lessons.sync_dates({instance.date})
+
+
+OVERRIDE_FIELDS = ("group_id", "original_date", "new_date")
+
+
+@receiver(pre_save, sender=GroupScheduleOverride)
+def remember_override_dates(sender, instance, raw=False, **kwargs):
+    instance._previous_dates = None
+    if instance.pk and not raw:
+        instance._previous_dates = (
+            GroupScheduleOverride.objects.filter(pk=instance.pk)
+            .values_list(*OVERRIDE_FIELDS)
+            .first()
+        )
+
+
+def _sync_override(entries):
+    """
+    Syncs each group between the earliest and latest date its override
+    entries (group_id, original_date, new_date) touch.
+    """
+    windows = {}
+    for group_id, *dates in entries:
+        dates = [day for day in dates if day is not None]
+        if dates:
+            windows.setdefault(group_id, []).extend(dates)
+    for group in Group.objects.filter(pk__in=windows):
+        dates = windows[group.pk]
+        lessons.sync_lessons([group], min(dates), max(dates))
+
+
+@receiver(post_save, sender=GroupScheduleOverride)
+def sync_override_lessons(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    entries = [tuple(getattr(instance, field) for field in OVERRIDE_FIELDS)]
+    previous = getattr(instance, "_previous_dates", None)
+    if previous is not None:
+        entries.append(previous)
+    _sync_override(entries)
+
+
+@receiver(post_delete, sender=GroupScheduleOverride)
+def sync_deleted_override_lessons(sender, instance, origin=None, **kwargs):
+    # The lessons of a deleted group are removed by the cascade
+    origin_model = getattr(origin, "model", type(origin))
+    if origin_model is Group:
+        return
+    _sync_override([tuple(getattr(instance, field) for field in OVERRIDE_FIELDS)])
@@ -0,0 +1,311 @@
+"""
+Slow query fingerprints.
+
+`SlowQueryLog` is a `connection.execute_wrapper` that groups every statement
+by fingerprint (core.perf.fingerprint) and keeps for each one:
+
+- a rolling latency histogram: `SLOTS` slots of `slot_seconds`, each with a
+  count per bucket of `BUCKETS_MS`, so old traffic ages out;
+- the place in the project code that first ran it, to tell which ORM
+  pattern produced it;
+- the EXPLAIN output of its first execution slower than `explain_ms`
+  (refreshed once per window), captured for SELECTs only. With `analyze`,
+  PostgreSQL runs EXPLAIN (ANALYZE, BUFFERS), which executes the statement
+  again, so it is only used for read-only SELECTs (see `is_read_only`);
+  locking reads and calls to sequences or advisory locks get a plain
+  EXPLAIN. The EXPLAIN runs in a savepoint that is always rolled back.
+
+At most `max_fingerprints` are tracked; a new one evicts the fingerprint with
+the least time in the window.
+
+`slow_query_log` is attached to every database connection when
+SLOW_QUERY_LOG is on and served by /api/ops/slow-queries/. The
+`slow_queries` command captures a run of its own (a management command or
+the API benchmark) and exports it.
+"""
+
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from . import perf
+from .perf import fingerprint
+
+
+# Upper bounds of the histogram buckets; the last bucket is unbounded
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+SLOTS = 12
+
+ORDERINGS = ("total", "count", "max", "p95")
+
+# Clauses and functions that make a SELECT lock rows or change state
+_NOT_READ_ONLY = re.compile(
+    r"\bFOR\s+(UPDATE|SHARE|NO\s+KEY\s+UPDATE|KEY\s+SHARE)\b"
+    r"|\b(NEXTVAL|SETVAL|PG_(TRY_)?ADVISORY_\w+)\s*\(",
+    re.IGNORECASE,
+)
+
+
+def is_read_only(sql):
+    """
+    Whether a statement is a SELECT that can safely be executed again.
+    """
+    return sql.lstrip().upper().startswith("SELECT") and not _NOT_READ_ONLY.search(sql)
+
+
+class QueryStats:
+    def __init__(self, sql, caller):
+        self.sql = sql
+        self.caller = caller
+        self.calls = 0
+        # [slot id, bucket counts, total ms, max ms], oldest first
+        self.slots = deque(maxlen=SLOTS)
+        self.plan = None
+        self.plan_ms = None
+        self.plan_slot = None
+
+    def add(self, slot, ms):
+        self.calls += 1
+        if not self.slots or self.slots[-1][0] != slot:
+            self.slots.append([slot, [0] * (len(BUCKETS_MS) + 1), 0.0, 0.0])
+        current = self.slots[-1]
+        current[1][bisect_left(BUCKETS_MS, ms)] += 1
+        current[2] += ms
+        current[3] = max(current[3], ms)
+
+    def window(self, slot):
+        """
+        (bucket counts, total ms, max ms) over the slots still in the window.
+        """
+        counts = [0] * (len(BUCKETS_MS) + 1)
+        total = peak = 0.0
+        for slot_id, slot_counts, slot_total, slot_max in self.slots:
+            if slot_id > slot - SLOTS:
+                counts = [a + b for a, b in zip(counts, slot_counts)]
+                total += slot_total
+                peak = max(peak, slot_max)
+        return counts, total, peak
+
+
+def _percentile(counts, share):
+    """
+    Upper bound in ms of the bucket holding the `share` percentile, None
+    for the unbounded bucket.
+    """
+    rank = share * sum(counts)
+    seen = 0
+    for index, count in enumerate(counts):
+        seen += count
+        if count and seen >= rank:
+            return BUCKETS_MS[index] if index < len(BUCKETS_MS) else None
+    return None
+
+
+# Wrappers around the code that runs queries, never the callers to report
+_SKIPPED_FILES = {__file__, perf.__file__}
+
+
+def _caller():
+    """
+    "path:line in function" of the innermost frame in the project code.
+    """
+    base = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(base)
+            and "site-packages" not in filename
+            and filename not in _SKIPPED_FILES
+        ):
+            return (
+                f"{filename[len(base) + 1:]}:{frame.f_lineno} "
+                f"in {frame.f_code.co_name}"
+            )
+        frame = frame.f_back
+    return None
+
+
+class SlowQueryLog:
+    """
+    Thread-safe, bounded aggregate of statement latencies per fingerprint.
+    Attach an instance with `connection.execute_wrapper(log)` or `capture()`.
+    """
+
+    def __init__(
+        self, slot_seconds=300, max_fingerprints=500, explain_ms=None, analyze=False
+    ):
+        self.slot_seconds = slot_seconds
+        self.max_fingerprints = max_fingerprints
+        self.explain_ms = explain_ms
+        self.analyze = analyze
+        self.lock = threading.Lock()
+        # Set while the log runs its own EXPLAIN statements
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = timezone.now()
+            self.stats = {}
+
+    def _slot(self):
+        return int(time.time() // self.slot_seconds)
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(self.local, "busy", False):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        ms = (time.perf_counter() - started) * 1000
+        stats = self.record(sql, ms)
+        if self._wants_plan(stats, ms, many):
+            self.explain(context["connection"], stats, sql, params, ms)
+        return result
+
+    def _wants_plan(self, stats, ms, many):
+        if self.explain_ms is None or many or ms < self.explain_ms:
+            return False
+        return stats.plan_slot is None or stats.plan_slot <= self._slot() - SLOTS
+
+    def record(self, sql, ms):
+        fid, normalized = fingerprint(sql)
+        slot = self._slot()
+        with self.lock:
+            stats = self.stats.get(fid)
+            if stats is None:
+                if len(self.stats) >= self.max_fingerprints:
+                    self._evict(slot)
+                stats = self.stats[fid] = QueryStats(normalized, _caller())
+            stats.add(slot, ms)
+        return stats
+
+    def _evict(self, slot):
+        del self.stats[min(self.stats, key=lambda fid: self.stats[fid].window(slot)[1])]
+
+    def explain(self, connection, stats, sql, params, ms):
+        """
+        Stores the plan of a slow SELECT. Runs in a savepoint that is rolled
+        back, so the EXPLAIN can neither break nor change the caller's
+        transaction.
+        """
+        if not sql.lstrip().upper().startswith("SELECT"):
+            return
+        prefix = connection.ops.explain_query_prefix()
+        if self.analyze and is_read_only(sql):
+            try:
+                prefix = connection.ops.explain_query_prefix(analyze=True, buffers=True)
+            except ValueError:
+                # EXPLAIN ANALYZE is not supported by this database
+                pass
+        self.local.busy = True
+        try:
+            with transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute(f"{prefix} {sql}", params)
+                    rows = cursor.fetchall()
+                transaction.set_rollback(True, using=connection.alias)
+            plan = "\n".join(
+                " ".join(str(value) for value in row if isinstance(value, str))
+                for row in rows
+            )
+        except Exception as error:
+            plan = f"EXPLAIN failed: {error}"
+        finally:
+            self.local.busy = False
+        with self.lock:
+            stats.plan = plan
+            stats.plan_ms = round(ms, 2)
+            stats.plan_slot = self._slot()
+
+    @contextmanager
+    def capture(self):
+        """
+        Attaches the log to every database connection for the block.
+        """
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def attach(self, sender, connection, **kwargs):
+        """
+        connection_created receiver that keeps the log on a connection.
+        """
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def snapshot(self, limit=20, order_by="total"):
+        """
+        The fingerprints of the window, heaviest first by `order_by`
+        (one of ORDERINGS). Percentiles are bucket upper bounds in ms.
+        """
+        slot = self._slot()
+        rows = []
+        with self.lock:
+            for fid, stats in self.stats.items():
+                counts, total, peak = stats.window(slot)
+                count = sum(counts)
+                if not count:
+                    continue
+                rows.append(
+                    {
+                        "fingerprint": fid,
+                        "sql": stats.sql,
+                        "caller": stats.caller,
+                        "count": count,
+                        "calls": stats.calls,
+                        "total_ms": round(total, 2),
+                        "avg_ms": round(total / count, 2),
+                        "max_ms": round(peak, 2),
+                        "p50_ms": _percentile(counts, 0.5),
+                        "p95_ms": _percentile(counts, 0.95),
+                        "histogram": dict(
+                            zip(
+                                [f"<={bound}" for bound in BUCKETS_MS] + ["more"],
+                                counts,
+                            )
+                        ),
+                        "plan": stats.plan,
+                        "plan_ms": stats.plan_ms,
+                    }
+                )
+            started_at = self.started_at
+
+        key = {
+            "total": lambda row: row["total_ms"],
+            "count": lambda row: row["count"],
+            "max": lambda row: row["max_ms"],
+            "p95": lambda row: (row["p95_ms"] is None, row["p95_ms"] or 0),
+        }[order_by]
+        rows.sort(key=key, reverse=True)
+        return {
+            "since": started_at,
+            "window_seconds": self.slot_seconds * SLOTS,
+            "fingerprints": len(rows),
+            "queries": rows[:limit],
+        }
+
+
+slow_query_log = SlowQueryLog()
+
+
+def install():
+    """
+    Attaches `slow_query_log` to every new connection when SLOW_QUERY_LOG
+    is on. Called once from CoreConfig.ready().
+    """
+    if not settings.SLOW_QUERY_LOG:
+        return
+    slow_query_log.explain_ms = settings.SLOW_QUERY_EXPLAIN_MS
+    slow_query_log.analyze = settings.SLOW_QUERY_EXPLAIN_ANALYZE
+    connection_created.connect(slow_query_log.attach, weak=False)
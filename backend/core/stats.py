@@ -0,0 +1,95 @@
+"""
+Dashboard statistics snapshot.
+
+The figures are computed once and kept in Django's cache until a change to
+students, enrollments, groups, transactions or staff invalidates them
+(see core.signals), or until DASHBOARD_STATS_TTL seconds pass. The key
+contains the date, so date-relative figures are recomputed every day.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q, Sum
+from django.utils import timezone
+
+from users.models import User
+from .models import Group, Student, StudentGroup
+
+
+CACHE_KEY = "core:dashboard-stats:{date}"
+
+
+def compute_dashboard_stats(today):
+    """
+    Computes every figure with conditional aggregation: one query per model
+    (Student, Group, User), whatever the amount of data.
+    """
+    due_date_start = today - timedelta(days=30)
+    due_date_end = today - timedelta(days=23)
+    due_soon = Exists(
+        StudentGroup.objects.filter(
+            student=OuterRef("pk"),
+            is_archived=False,
+            group__is_archived=False,
+            group__end_date__gte=today,
+            transactions__category="MONTHLY_FEE",
+            transactions__created_at__date__range=(due_date_start, due_date_end),
+        )
+    )
+
+    # Balances are read from the denormalized ledger columns (finance.ledger)
+    active = Q(is_archived=False)
+    debtor = active & Q(balance__lt=0)
+    students = Student.objects.aggregate(
+        active=Count("pk", filter=active),
+        archived=Count("pk", filter=Q(is_archived=True)),
+        debtors=Count("pk", filter=debtor),
+        total_debt=Sum("balance", filter=debtor),
+        due_soon=Count("pk", filter=active & Q(due_soon)),
+    )
+    groups = Group.objects.aggregate(active=Count("pk", filter=Q(is_archived=False)))
+    staff = User.objects.aggregate(
+        teachers=Count("pk", filter=Q(is_teacher=True, is_active=True)),
+        admins=Count("pk", filter=Q(is_admin=True, is_active=True)),
+    )
+
+    # NOTE: Replace these with your actual business logic and models
+    # This is example logic.
+    return {
+        "active_leads": 0,  # Lead.objects.filter(status='active').count()
+        "groups": groups["active"],
+        "remaining_debts": abs(students["total_debt"] or 0),
+        "debtors": students["debtors"],
+        "payment_due_soon": students["due_soon"],
+        "active_students": students["active"],
+        "attrition_students": students["archived"],
+        "teachers": staff["teachers"],
+        "admins": staff["admins"],
+    }
+
+
+def get_dashboard_stats(refresh=False):
+    """
+    Returns (stats, computed_at), from the cache when a snapshot exists.
+    """
+    now = timezone.now()
+    today = timezone.localdate(now)
+    key = CACHE_KEY.format(date=today.isoformat())
+
+    snapshot = None if refresh else cache.get(key)
+    if snapshot is None:
+        snapshot = {"stats": compute_dashboard_stats(today), "computed_at": now}
+        cache.set(key, snapshot, settings.DASHBOARD_STATS_TTL)
+    return snapshot["stats"], snapshot["computed_at"]
+
+
+def invalidate_dashboard_stats():
+    """
+    Drops today's snapshot once the current transaction commits, so a reader
+    can not cache figures from before the change.
+    """
+    key = CACHE_KEY.format(date=timezone.localdate().isoformat())
+    transaction.on_commit(lambda: cache.delete(key))
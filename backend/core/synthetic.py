@@ -0,0 +1,737 @@
+"""
+Synthetic data for benchmarks and load tests.
+
+`SyntheticData` fills the database with a school that looks like production:
+branches and rooms, teachers, groups on schedules that never double-book a
+room or a teacher, price histories, students with parents, enrollments (some
+with a custom price, some archived), holidays, cancelled/rescheduled/extra
+lessons, months of monthly fees billed with the rules of
+`create_monthly_fees`, payments and attendance.
+
+Everything is derived from `seed`, so two runs against the same starting
+database produce the same rows. Rows are written with chunked `bulk_create`,
+which bypasses model signals, so `generate` finishes by rebuilding the
+derived tables (lessons, balances, finance rollup, search index).
+"""
+
+import random
+from bisect import bisect_left
+from functools import lru_cache
+from time import perf_counter
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import NamedTuple
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from finance.ledger import recompute_balances
+from finance.management.commands.create_monthly_fees import (
+    calculate_charge,
+    get_billing_day,
+    month_names,
+)
+from finance.models import GroupPrice, PaymentType, Transaction
+from finance.pricing import PriceTimeline
+from finance.rollup import rebuild_rollup
+from users.models import User
+from .lessons import rebuild_lessons
+from .models import (
+    Attendance,
+    Branch,
+    Group,
+    GroupScheduleOverride,
+    Holiday,
+    Parent,
+    Room,
+    Student,
+    StudentGroup,
+)
+from .schedule import LessonCalendar, weekday_dates
+from .search import rebuild_index
+from .stats import invalidate_dashboard_stats
+
+
+FIRST_NAMES = (
+    "Aziz",
+    "Bekzod",
+    "Dilnoza",
+    "Farrux",
+    "Gulnora",
+    "Jasur",
+    "Kamola",
+    "Laylo",
+    "Madina",
+    "Nodir",
+    "Otabek",
+    "Sardor",
+    "Shahzod",
+    "Umida",
+    "Xurshid",
+    "Zarina",
+)
+LAST_NAMES = (
+    "Abdullayev",
+    "Ergashev",
+    "Karimov",
+    "Mirzayev",
+    "Nazarov",
+    "Qodirov",
+    "Rahimov",
+    "Saidov",
+    "Tursunov",
+    "Yusupov",
+)
+SUBJECTS = ("Matematika", "Ingliz tili", "Fizika", "Kimyo", "IT", "Rus tili")
+WEEKDAYS = ("135", "246")
+# (start, end) of the lesson slots of a room, for each weekday pattern
+SLOTS = tuple((time(hour), time(hour + 1, 30)) for hour in range(8, 20, 2))
+PRICES = tuple(Decimal(price) for price in (300000, 350000, 400000, 500000))
+PRICE_STEP = Decimal(50000)
+# (month, day, name) of the yearly holidays
+HOLIDAYS = (
+    (1, 1, "Yangi yil"),
+    (3, 8, "Xotin-qizlar kuni"),
+    (3, 21, "Navro'z"),
+    (5, 9, "Xotira va qadrlash kuni"),
+    (9, 1, "Mustaqillik kuni"),
+    (10, 1, "O'qituvchilar kuni"),
+    (12, 8, "Konstitutsiya kuni"),
+)
+
+PHONE_BASE = 998500000000
+
+
+class Inserter:
+    """
+    Multi-row INSERTs of plain value tuples, for the high-volume tables.
+
+    Building model instances and preparing every field dominates the cost of
+    `bulk_create` for millions of rows; here values are passed in column
+    order and only dates, datetimes and decimals are adapted for the backend.
+    Defaults and auto_now fields are not applied.
+    """
+
+    def __init__(self, model, fields, batch_size=5000):
+        self.fields = [model._meta.get_field(name) for name in fields]
+        ops = connection.ops
+        self.adapters = []
+        for field in self.fields:
+            internal = field.get_internal_type()
+            # Generated timestamps repeat a lot, adapting them is not free
+            if internal == "DateTimeField":
+                self.adapters.append(lru_cache(65536)(ops.adapt_datetimefield_value))
+            elif internal == "DateField":
+                self.adapters.append(lru_cache(4096)(ops.adapt_datefield_value))
+            elif internal == "DecimalField":
+                self.adapters.append(ops.adapt_decimalfield_value)
+            else:
+                self.adapters.append(None)
+
+        self.batch_size = ops.bulk_batch_size(self.fields, range(batch_size))
+        columns = ", ".join(ops.quote_name(field.column) for field in self.fields)
+        self.sql = (
+            f"INSERT INTO {ops.quote_name(model._meta.db_table)} ({columns}) VALUES "
+        )
+        self.placeholder = "(" + ", ".join(["%s"] * len(self.fields)) + ")"
+        self.rows = []
+        self.count = 0
+
+    def add(self, *values):
+        self.rows.append(values)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        params = []
+        adapters = self.adapters
+        for row in self.rows:
+            params.extend(
+                value if adapt is None or value is None else adapt(value)
+                for adapt, value in zip(adapters, row)
+            )
+        sql = self.sql + ", ".join([self.placeholder] * len(self.rows))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+        self.count += len(self.rows)
+        self.rows = []
+
+
+class Enrollment(NamedTuple):
+    pk: int
+    group_id: int
+    joined_at: date
+    price: Decimal
+    left_on: date
+
+
+class Writer:
+    """
+    Buffers unsaved objects per model and bulk-creates them in chunks.
+    """
+
+    def __init__(self, batch_size=5000):
+        self.batch_size = batch_size
+        self.pending = {}
+        self.counts = {}
+
+    def add(self, obj):
+        model = type(obj)
+        batch = self.pending.setdefault(model, [])
+        batch.append(obj)
+        if len(batch) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model=None):
+        models = [model] if model else list(self.pending)
+        for model in models:
+            batch = self.pending.pop(model, [])
+            if batch:
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+                label = model._meta.label
+                self.counts[label] = self.counts.get(label, 0) + len(batch)
+
+
+class SyntheticData:
+    """
+    Deterministic synthetic school. Volumes are given per run; `months` is
+    how far back groups, fees and payments go from `today`, and
+    `attendance_months` how far back attendance is marked (all months when
+    None, none when 0).
+    """
+
+    def __init__(
+        self,
+        seed=0,
+        branches=2,
+        rooms=4,
+        teachers=8,
+        groups=20,
+        students=200,
+        months=3,
+        attendance_months=None,
+        today=None,
+        batch_size=5000,
+        stdout=None,
+    ):
+        self.random = random.Random(seed)
+        self.branches = branches
+        self.rooms = rooms
+        self.teachers = teachers
+        self.groups = groups
+        self.students = students
+        self.months = months
+        self.today = today or timezone.localdate()
+        self.start = (self.today - relativedelta(months=months)).replace(day=1)
+        if attendance_months is None:
+            self.attendance_start = self.start
+        elif attendance_months > 0:
+            self.attendance_start = (
+                self.today - relativedelta(months=attendance_months)
+            ).replace(day=1)
+        else:
+            self.attendance_start = None
+        self.batch_size = batch_size
+        self.writer = Writer(batch_size)
+        self.stdout = stdout
+        self.tz = timezone.get_current_timezone()
+
+        phones = [
+            model.objects.aggregate(last=Max("phone_number"))["last"] or 0
+            for model in (User, Student)
+        ]
+        self.next_phone = max(PHONE_BASE, *phones) + 1
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def phone(self):
+        self.next_phone += 1
+        return self.next_phone
+
+    def name(self):
+        return f"{self.random.choice(FIRST_NAMES)} {self.random.choice(LAST_NAMES)}"
+
+    def moment(self, day, hour=None):
+        hour = self.random.randint(9, 19) if hour is None else hour
+        return datetime.combine(
+            day, time(hour, self.random.randint(0, 59)), tzinfo=self.tz
+        )
+
+    def generate(self):
+        """
+        Writes everything and rebuilds the derived tables.
+        Returns {model label: rows created}.
+        """
+        steps = [
+            ("staff", self.make_staff),
+            ("branches", self.make_branches),
+            ("groups", self.make_groups),
+            ("holidays", self.make_holidays),
+            ("overrides", self.make_overrides),
+            ("students", self.make_students),
+            ("enrollments", self.make_enrollments),
+            ("transactions", self.make_transactions),
+        ]
+        if self.attendance_start is not None:
+            steps.append(("attendance", self.make_attendance))
+        steps += [
+            (
+                "lessons",
+                lambda: rebuild_lessons(
+                    Group.objects.filter(pk__in=[g.pk for g in self.group_list])
+                ),
+            ),
+            ("balances", recompute_balances),
+            ("finance rollup", rebuild_rollup),
+            ("search index", rebuild_index),
+        ]
+
+        with transaction.atomic():
+            for name, step in steps:
+                started = perf_counter()
+                step()
+                self.writer.flush()
+                self.log(f"  [{name}] {perf_counter() - started:.1f} s")
+        invalidate_dashboard_stats()
+        return dict(self.writer.counts)
+
+    def make_staff(self):
+        password = make_password("benchmark")
+        staff = [
+            User(
+                phone_number=self.phone(),
+                full_name=self.name(),
+                password=password,
+                is_ceo=True,
+            )
+        ]
+        staff += [
+            User(
+                phone_number=self.phone(),
+                full_name=self.name(),
+                password=password,
+                is_admin=True,
+            )
+            for _ in range(2)
+        ]
+        for index in range(self.teachers):
+            salaried = index % 4 == 0
+            staff.append(
+                User(
+                    phone_number=self.phone(),
+                    full_name=self.name(),
+                    password=password,
+                    is_teacher=True,
+                    salary=Decimal(5000000) if salaried else None,
+                    percentage=(
+                        None if salaried else Decimal(self.random.choice((40, 50, 60)))
+                    ),
+                )
+            )
+        User.objects.bulk_create(staff)
+        self.writer.counts["users.User"] = len(staff)
+
+        created = User.objects.filter(
+            phone_number__in=[user.phone_number for user in staff]
+        )
+        self.ceo = created.filter(is_ceo=True).first()
+        self.admin_ids = list(
+            created.filter(is_admin=True).order_by("pk").values_list("pk", flat=True)
+        )
+        self.teacher_ids = list(
+            created.filter(is_teacher=True).order_by("pk").values_list("pk", flat=True)
+        )
+        self.payment_type_ids = [
+            PaymentType.objects.get_or_create(name=name)[0].pk
+            for name in ("Naqd", "Click", "Payme")
+        ]
+        self.log(f"{len(staff)} users")
+
+    def make_branches(self):
+        offset = Branch.objects.count()
+        Branch.objects.bulk_create(
+            [
+                Branch(name=f"Filial {offset + n + 1}", address="Toshkent")
+                for n in range(self.branches)
+            ]
+        )
+        self.branch_ids = list(
+            Branch.objects.order_by("pk").values_list("pk", flat=True)[offset:]
+        )
+        Room.objects.bulk_create(
+            [
+                Room(name=str(n + 1), branch_id=branch_id, capacity=20)
+                for branch_id in self.branch_ids
+                for n in range(self.rooms)
+            ]
+        )
+        self.room_branches = dict(
+            Room.objects.filter(branch_id__in=self.branch_ids)
+            .order_by("pk")
+            .values_list("pk", "branch_id")
+        )
+        self.writer.counts["core.Branch"] = self.branches
+        self.writer.counts["core.Room"] = len(self.room_branches)
+
+    def slots(self):
+        """
+        Yields (room_id, weekdays, start, end, teacher_id) without double
+        booking a room or a teacher.
+        """
+        rooms = list(self.room_branches)
+        per_slot = min(len(rooms), len(self.teacher_ids))
+        block = 0
+        for weekdays in WEEKDAYS:
+            for start, end in SLOTS:
+                for index in range(per_slot):
+                    teacher = self.teacher_ids[(block + index) % len(self.teacher_ids)]
+                    yield rooms[index], weekdays, start, end, teacher
+                block += 1
+
+    def make_groups(self):
+        groups = []
+        for index, (room_id, weekdays, start, end, teacher_id) in enumerate(
+            self.slots()
+        ):
+            if index >= self.groups:
+                break
+            start_date = self.start + relativedelta(months=self.random.randint(0, 1))
+            groups.append(
+                Group(
+                    name=f"{self.random.choice(SUBJECTS)}-{index + 1}",
+                    teacher_id=teacher_id,
+                    branch_id=self.room_branches[room_id],
+                    room_id=room_id,
+                    start_date=start_date,
+                    end_date=self.today
+                    + relativedelta(months=self.random.randint(1, 6)),
+                    course_start_time=start,
+                    course_end_time=end,
+                    weekdays=weekdays,
+                    color="#34D399",
+                    text_color="#ffffff",
+                )
+            )
+        self.group_list = Group.objects.bulk_create(groups)
+        if len(self.group_list) < self.groups:
+            self.log(
+                f"Only {len(self.group_list)} groups fit the rooms and teachers; "
+                "add branches, rooms or teachers for more."
+            )
+
+        # Prices rise by a step every few months
+        rows = []
+        for group in self.group_list:
+            price = self.random.choice(PRICES)
+            start_date = group.start_date
+            while start_date <= self.today:
+                rows.append((group.pk, start_date, price))
+                self.writer.add(
+                    GroupPrice(group=group, price=price, start_date=start_date)
+                )
+                start_date += relativedelta(months=self.random.randint(3, 9))
+                price += PRICE_STEP
+        self.prices = PriceTimeline(rows)
+        self.writer.flush(GroupPrice)
+        self.writer.counts["core.Group"] = len(self.group_list)
+        self.log(f"{len(self.group_list)} groups")
+
+    def make_holidays(self):
+        last = max((group.end_date for group in self.group_list), default=self.today)
+        holidays = [
+            Holiday(date=day, name=name)
+            for year in range(self.start.year, last.year + 1)
+            for month, day_of_month, name in HOLIDAYS
+            if self.start <= (day := date(year, month, day_of_month)) <= last
+        ]
+        # Dates are unique; keep holidays an earlier run already stored
+        Holiday.objects.bulk_create(holidays, ignore_conflicts=True)
+        self.holidays = set(Holiday.objects.values_list("date", flat=True))
+        self.writer.counts["core.Holiday"] = len(holidays)
+
+    def make_overrides(self):
+        """
+        Cancels, reschedules and adds lessons of the Mon/Wed/Fri groups.
+        Moved and extra lessons go to a Sunday at the group's own time and
+        room, which no other group uses, so they never double-book.
+        """
+        yesterday = self.today - timedelta(days=1)
+        for group in self.group_list:
+            if group.weekdays != WEEKDAYS[0]:
+                continue
+            lessons = [
+                day
+                for day in weekday_dates(
+                    group.weekdays, group.start_date, min(group.end_date, yesterday)
+                )
+                if day not in self.holidays
+            ]
+            by_month = {}
+            for day in lessons:
+                by_month.setdefault(day.replace(day=1), []).append(day)
+
+            sundays = set()
+            for days in by_month.values():
+                roll = self.random.random()
+                day = self.random.choice(days)
+                sunday = day + timedelta(days=7 - day.isoweekday())
+                if roll < 0.3:
+                    override = GroupScheduleOverride(
+                        group=group,
+                        original_date=day,
+                        is_cancelled=True,
+                        reason="Ustoz kasal",
+                    )
+                elif roll < 0.5 and sunday not in sundays:
+                    sundays.add(sunday)
+                    override = GroupScheduleOverride(
+                        group=group,
+                        original_date=day,
+                        new_date=sunday,
+                        reason="Ko'chirildi",
+                    )
+                elif roll < 0.6 and sunday not in sundays:
+                    sundays.add(sunday)
+                    override = GroupScheduleOverride(
+                        group=group,
+                        new_date=sunday,
+                        is_extra=True,
+                        reason="Qo'shimcha dars",
+                    )
+                else:
+                    continue
+                self.writer.add(override)
+        self.writer.flush(GroupScheduleOverride)
+
+    def make_students(self):
+        branches = self.branch_ids
+        first_phone = self.next_phone + 1
+        for _ in range(self.students):
+            self.writer.add(
+                Student(
+                    full_name=self.name(),
+                    phone_number=self.phone(),
+                    branch_id=self.random.choice(branches),
+                    gender=self.random.choice(("male", "female")),
+                    birth_date=date(self.random.randint(2005, 2018), 1, 1)
+                    + timedelta(days=self.random.randint(0, 364)),
+                )
+            )
+        self.writer.flush(Student)
+        self.student_ids = list(
+            Student.objects.filter(phone_number__range=(first_phone, self.next_phone))
+            .order_by("pk")
+            .values_list("pk", "branch_id", "full_name")
+        )
+
+        for student_id, _, full_name in self.student_ids:
+            family = full_name.split()[-1]
+            for gender in self.random.choice(((), ("female",), ("male", "female"))):
+                self.writer.add(
+                    Parent(
+                        student_id=student_id,
+                        full_name=f"{self.random.choice(FIRST_NAMES)} {family}",
+                        phone_number=self.random.randint(998900000000, 998999999999),
+                        gender=gender,
+                    )
+                )
+        self.writer.flush(Parent)
+        self.log(f"{len(self.student_ids)} students")
+
+    def make_enrollments(self):
+        by_branch = {}
+        for group in self.group_list:
+            by_branch.setdefault(group.branch_id, []).append(group)
+
+        for student_id, branch_id, _ in self.student_ids:
+            groups = by_branch.get(branch_id) or self.group_list
+            if not groups:
+                break
+            count = min(len(groups), self.random.choice((1, 1, 1, 2, 2, 3)))
+            for group in self.random.sample(groups, count):
+                latest = min(group.end_date, self.today)
+                span = max((latest - group.start_date).days, 0)
+                joined_at = group.start_date + timedelta(
+                    days=self.random.randint(0, span // 2)
+                )
+                enrollment = StudentGroup(
+                    student_id=student_id, group=group, joined_at=joined_at
+                )
+                roll = self.random.random()
+                if roll < 0.05:
+                    # A discount agreed with the student
+                    price = self.prices.price_on(group.pk, joined_at)
+                    enrollment.price = max(price - PRICE_STEP, PRICE_STEP)
+                elif roll < 0.15 and latest > joined_at:
+                    left_on = joined_at + timedelta(
+                        days=self.random.randint(1, (latest - joined_at).days)
+                    )
+                    enrollment.is_archived = True
+                    enrollment.archived_at = datetime.combine(
+                        left_on, time(18), tzinfo=self.tz
+                    )
+                self.writer.add(enrollment)
+        self.writer.flush(StudentGroup)
+
+        self.enrollments = [
+            Enrollment(
+                pk,
+                group_id,
+                joined_at,
+                price,
+                timezone.localdate(archived_at) if archived_at else None,
+            )
+            for pk, group_id, joined_at, price, archived_at in StudentGroup.objects.filter(
+                group__in=self.group_list
+            )
+            .order_by("pk")
+            .values_list("pk", "group_id", "joined_at", "price", "archived_at")
+        ]
+        self.log(f"{len(self.enrollments)} enrollments")
+
+    def make_transactions(self):
+        """
+        Bills every month like `create_monthly_fees` (on the billing day, the
+        first month pro-rated) and pays most of the bills within the month.
+        """
+        self.transactions = Inserter(
+            Transaction,
+            (
+                "student_group",
+                "transaction_type",
+                "category",
+                "amount",
+                "payment_type",
+                "receiver",
+                "comment",
+                "created_at",
+                "updated_at",
+                "created_by",
+            ),
+            self.batch_size,
+        )
+        months = []
+        month = min(
+            (group.start_date for group in self.group_list), default=self.today
+        ).replace(day=1)
+        while month <= self.today:
+            months.append(month)
+            month += relativedelta(months=1)
+        months.append(month)
+
+        for enrollment in self.enrollments:
+            last = min(enrollment.left_on or self.today, self.today)
+            index = bisect_left(months, enrollment.joined_at.replace(day=1))
+            for first_day, month in zip(months[index:], months[index + 1 :]):
+                if first_day > last:
+                    break
+                billing_day = get_billing_day(enrollment, first_day)
+                # The daily billing run never reaches a billing day past the
+                # month's end (late joiners), so that month is not billed
+                if billing_day > (month - timedelta(days=1)).day:
+                    continue
+                run_date = first_day.replace(day=billing_day)
+                if run_date > last:
+                    continue
+
+                price = enrollment.price or self.prices.price_on(
+                    enrollment.group_id, run_date
+                )
+                amount, comment = calculate_charge(
+                    enrollment, price, run_date, month_names[run_date.month - 1]
+                )
+                charged = self.moment(run_date, hour=6)
+                self.add_transaction(
+                    enrollment.pk, "DEBIT", "MONTHLY_FEE", amount, charged, comment
+                )
+
+                roll = self.random.random()
+                if roll < 0.8:
+                    paid_amount = amount
+                elif roll < 0.9:
+                    paid_amount = int(round(Decimal(amount) / 2, -3))
+                else:
+                    continue
+                days = (min(month - timedelta(days=1), self.today) - run_date).days
+                self.add_transaction(
+                    enrollment.pk,
+                    "CREDIT",
+                    "PAYMENT",
+                    paid_amount,
+                    self.moment(
+                        run_date + timedelta(days=self.random.randint(0, days))
+                    ),
+                    payment_type_id=self.random.choice(self.payment_type_ids),
+                    receiver_id=self.random.choice(self.admin_ids),
+                )
+        self.transactions.flush()
+        self.writer.counts["finance.Transaction"] = self.transactions.count
+        self.log(f"{self.transactions.count} transactions")
+
+    def add_transaction(
+        self,
+        student_group_id,
+        transaction_type,
+        category,
+        amount,
+        at,
+        comment="",
+        payment_type_id=None,
+        receiver_id=None,
+    ):
+        self.transactions.add(
+            student_group_id,
+            transaction_type,
+            category,
+            Decimal(amount),
+            payment_type_id,
+            receiver_id,
+            comment,
+            at,
+            at,
+            self.ceo.pk,
+        )
+
+    def make_attendance(self):
+        marks = Inserter(
+            Attendance,
+            (
+                "student_group",
+                "date",
+                "is_present",
+                "comment",
+                "created_at",
+                "updated_at",
+            ),
+            self.batch_size,
+        )
+        now = timezone.now()
+        yesterday = self.today - timedelta(days=1)
+        lessons = LessonCalendar(
+            self.group_list, self.attendance_start, yesterday
+        ).as_dict()
+        for enrollment in self.enrollments:
+            first = max(enrollment.joined_at, self.attendance_start)
+            last = enrollment.left_on or yesterday
+            # Some students are much less regular than others
+            rate = self.random.choice((0.95, 0.9, 0.9, 0.8, 0.5))
+            for day in lessons.get(enrollment.group_id, []):
+                if first <= day <= last:
+                    marks.add(
+                        enrollment.pk,
+                        day,
+                        self.random.random() < rate,
+                        "",
+                        now,
+                        now,
+                    )
+        marks.flush()
+        self.writer.counts["core.Attendance"] = marks.count
+        self.log(f"{marks.count} attendance marks")
@@ -1,3 +1,1625 @@
-from django.test import TestCase
+import json
+from importlib import import_module
+from collections import defaultdict
+import random
+from unittest import mock
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from finance.models import Transaction
+from users.models import User
+from .attendance import AttendanceAnalytics
+from .filters import TransliteratedSearchFilter
+from .benchmark import discover_endpoints, load_baseline, regressions, run_benchmark
+from .lessons import rebuild_lessons
+from .occupancy import OccupancyIndex
+from .perf import fingerprint, summary
+from .slowqueries import SlowQueryLog, is_read_only, slow_query_log
+from .models import (
+    Attendance,
+    Branch,
+    Group,
+    Holiday,
+    GroupScheduleOverride,
+    LessonOccurrence,
+    Room,
+    Student,
+    StudentGroup,
+)
+from .schedule import LessonCalendar, weekday_dates
+from .search import normalize, search_key
+from .synthetic import SyntheticData
+
+
+def legacy_regular_lesson_days(group, start_date_range, end_date_range):
+    """The original day-by-day implementation, kept as the reference."""
+    scheduled_weekdays = {int(day) for day in group.weekdays}
+    effective_start = max(group.start_date, start_date_range)
+    effective_end = min(group.end_date, end_date_range)
+    lesson_dates = set()
+    current_date = effective_start
+    while current_date <= effective_end:
+        if current_date.isoweekday() in scheduled_weekdays:
+            lesson_dates.add(current_date)
+        current_date += timedelta(days=1)
+    return sorted(lesson_dates)
+
+
+def legacy_actual_lesson_days(group, start_date_range, end_date_range):
+    """The original per-group implementation, kept as the reference."""
+    effective_start = max(group.start_date, start_date_range)
+    effective_end = min(group.end_date, end_date_range)
+    lesson_dates = set(
+        legacy_regular_lesson_days(group, start_date_range, end_date_range)
+    )
+    lesson_dates.difference_update(
+        Holiday.objects.filter(
+            date__range=(effective_start, effective_end)
+        ).values_list("date", flat=True)
+    )
+    overrides = group.schedule_overrides.filter(
+        Q(original_date__in=lesson_dates)
+        | Q(new_date__range=(start_date_range, end_date_range))
+    ).order_by("pk")
+    for override in overrides:
+        if override.is_cancelled and override.original_date in lesson_dates:
+            lesson_dates.remove(override.original_date)
+        elif not override.is_extra and not override.is_cancelled:
+            if override.original_date in lesson_dates:
+                lesson_dates.remove(override.original_date)
+            if start_date_range <= override.new_date <= end_date_range:
+                lesson_dates.add(override.new_date)
+        elif override.is_extra:
+            if start_date_range <= override.new_date <= end_date_range:
+                lesson_dates.add(override.new_date)
+    return sorted(lesson_dates)
+
+
+class LessonCalendarTests(TestCase):
+    """
+    Property-style checks: the calendar engine must match the original
+    day-by-day implementation for random schedules, ranges and overrides.
+    """
+
+    SEED = 20250801
+    YEAR_START = date(2025, 1, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rng = random.Random(cls.SEED)
+        cls.teacher = User.objects.create_user(998900000001, "Teacher", is_teacher=True)
+        cls.branch = Branch.objects.create(name="Main", address="-")
+
+        for offset in cls.rng.sample(range(365), 20):
+            Holiday.objects.create(
+                date=cls.YEAR_START + timedelta(days=offset), name="Holiday"
+            )
+
+        cls.groups = [cls._random_group(index) for index in range(25)]
+
+    @classmethod
+    def _random_day(cls):
+        return cls.YEAR_START + timedelta(days=cls.rng.randrange(365))
+
+    @classmethod
+    def _random_group(cls, index):
+        rng = cls.rng
+        weekdays = "".join(sorted(rng.sample("1234567", rng.randint(1, 7))))
+        start = cls._random_day()
+        end = start + timedelta(days=rng.randint(0, 200))
+        group = Group.objects.create(
+            name=f"Group {index}",
+            teacher=cls.teacher,
+            branch=cls.branch,
+            start_date=start,
+            end_date=end,
+            course_start_time=time(9),
+            course_end_time=time(10),
+            weekdays=weekdays,
+            color="#000000",
+            text_color="#ffffff",
+        )
+
+        regular = legacy_regular_lesson_days(group, start, end)
+        for _ in range(rng.randint(0, 8)):
+            kind = rng.choice(["cancel", "reschedule", "extra"])
+            original = rng.choice(regular) if regular else None
+            if kind == "extra" or original is None:
+                GroupScheduleOverride.objects.create(
+                    group=group,
+                    new_date=cls._random_day(),
+                    new_start_time=time(15),
+                    new_end_time=time(16),
+                    is_extra=True,
+                )
+            elif kind == "cancel":
+                GroupScheduleOverride.objects.create(
+                    group=group, original_date=original, is_cancelled=True
+                )
+            else:
+                GroupScheduleOverride.objects.create(
+                    group=group,
+                    original_date=original,
+                    new_date=original + timedelta(days=rng.randint(-10, 10)),
+                    new_start_time=time(15),
+                    new_end_time=time(16),
+                )
+        return group
+
+    def _random_ranges(self, count=30):
+        for _ in range(count):
+            start = self._random_day() - timedelta(days=30)
+            yield start, start + timedelta(days=self.rng.randint(0, 120))
+
+    def test_weekday_dates_matches_day_by_day_walk(self):
+        for _ in range(200):
+            weekdays = "".join(self.rng.sample("1234567", self.rng.randint(1, 7)))
+            start = self._random_day()
+            end = start + timedelta(days=self.rng.randint(-3, 90))
+            expected = [
+                start + timedelta(days=i)
+                for i in range((end - start).days + 1)
+                if str((start + timedelta(days=i)).isoweekday()) in weekdays
+            ]
+            self.assertEqual(weekday_dates(weekdays, start, end), expected)
+
+    def test_regular_lesson_days_matches_legacy(self):
+        for start, end in self._random_ranges():
+            for group in self.groups:
+                self.assertEqual(
+                    group.regular_lesson_days(start, end),
+                    legacy_regular_lesson_days(group, start, end),
+                )
+
+    def test_actual_lesson_days_matches_legacy(self):
+        for start, end in self._random_ranges(10):
+            for group in self.groups:
+                self.assertEqual(
+                    group.actual_lesson_days(start, end),
+                    legacy_actual_lesson_days(group, start, end),
+                    msg=f"{group.name} {group.weekdays} {start}..{end}",
+                )
+
+    def test_batch_calendar_matches_legacy(self):
+        for start, end in self._random_ranges(10):
+            calendar = LessonCalendar(self.groups, start, end)
+            for group in self.groups:
+                self.assertEqual(
+                    calendar.actual_days(group),
+                    legacy_actual_lesson_days(group, start, end),
+                )
+
+    def test_archived_group_has_no_lessons_after_archive_date(self):
+        group = max(
+            self.groups,
+            key=lambda g: len(g.actual_lesson_days(g.start_date, g.end_date)),
+        )
+        days = legacy_actual_lesson_days(group, group.start_date, group.end_date)
+        archived_on = days[len(days) // 2]
+
+        def stored():
+            return list(
+                LessonOccurrence.objects.filter(group=group)
+                .order_by("date")
+                .values_list("date", flat=True)
+            )
+
+        group.is_archived = True
+        group.archived_at = timezone.make_aware(datetime.combine(archived_on, time(18)))
+        group.save()
+        self.assertEqual(stored(), [day for day in days if day <= archived_on])
+
+        group.is_archived = False
+        group.archived_at = None
+        group.save()
+        self.assertEqual(stored(), days)
+
+    def _stored(self, group):
+        return list(
+            LessonOccurrence.objects.filter(group=group)
+            .order_by("date")
+            .values_list("date", "start_time", "end_time", "source", "override_id")
+        )
+
+    def assertInSync(self, groups=None):
+        # Nothing to create, update or delete: the table matches the calendar
+        groups = Group.objects.all() if groups is None else groups
+        self.assertEqual(rebuild_lessons(groups), (0, 0, 0))
+
+    def test_stored_lessons_follow_schedule_changes(self):
+        self.assertInSync()
+        group = self.groups[0]
+        room = Room.objects.create(name="A", branch=self.branch, capacity=10)
+
+        group.weekdays = "246" if group.weekdays != "246" else "135"
+        group.course_start_time = time(11)
+        group.course_end_time = time(12, 30)
+        group.room = room
+        group.save()
+
+        self.assertInSync()
+        lessons = self._stored(group)
+        self.assertTrue(lessons)
+        self.assertEqual(
+            {
+                day.isoweekday()
+                for day, _, _, source, _ in lessons
+                if source == "regular"
+            },
+            {int(day) for day in group.weekdays},
+        )
+        self.assertEqual(
+            set(LessonOccurrence.objects.filter(group=group).values_list("room_id")),
+            {(room.pk,)},
+        )
+
+    def test_stored_lessons_follow_overrides(self):
+        group = self.groups[1]
+        days = [day for day, *_ in self._stored(group)]
+        original = days[len(days) // 2]
+        moved_to = max(days) + timedelta(days=1)
+
+        override = GroupScheduleOverride.objects.create(
+            group=group,
+            original_date=original,
+            new_date=moved_to,
+            new_start_time=time(17),
+            new_end_time=time(18),
+        )
+        self.assertInSync()
+        lessons = {day: lesson for day, *lesson in self._stored(group)}
+        self.assertNotIn(original, lessons)
+        self.assertEqual(
+            lessons[moved_to], [time(17), time(18), "rescheduled", override.pk]
+        )
+
+        override.delete()
+        self.assertInSync()
+        self.assertEqual([day for day, *_ in self._stored(group)], days)
+
+    def test_migration_backfills_the_calendar(self):
+        populate = import_module("core.migrations.0015_populate_lessons")
+        # An archived group, archived without signals, and a fresh table
+        group = self.groups[2]
+        days = [day for day, *_ in self._stored(group)]
+        Group.objects.filter(pk=group.pk).update(
+            is_archived=True,
+            archived_at=timezone.make_aware(
+                datetime.combine(days[len(days) // 2], time(18))
+            ),
+        )
+        LessonOccurrence.objects.all().delete()
+
+        populate.populate_lessons(django_apps, None, batch_size=7)
+
+        self.assertInSync()
+        self.assertEqual(
+            [day for day, *_ in self._stored(group)], days[: len(days) // 2 + 1]
+        )
+
+    def test_batch_calendar_uses_two_queries(self):
+        with self.assertNumQueries(2):
+            calendar = LessonCalendar(self.groups, date(2025, 1, 1), date(2025, 12, 31))
+            calendar.as_dict()
+
+
+class AttendanceAnalyticsTests(TestCase):
+    """
+    Only marks on lessons a student was expected at are counted.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create_user(998900000030, "T", is_teacher=True)
+        branch = Branch.objects.create(name="Main", address="-")
+        cls.group = Group.objects.create(
+            name="Group",
+            teacher=teacher,
+            branch=branch,
+            start_date=date(2025, 1, 6),
+            end_date=date(2025, 6, 30),
+            course_start_time=time(9),
+            course_end_time=time(10),
+            weekdays="135",
+            color="#000000",
+            text_color="#ffffff",
+        )
+        student = Student.objects.create(
+            full_name="Student", phone_number=998930000300, branch=branch
+        )
+        cls.enrollment = StudentGroup.objects.create(
+            student=student, group=cls.group, joined_at=date(2025, 1, 20)
+        )
+
+    def _mark(self, day, is_present):
+        Attendance.objects.create(
+            student_group=self.enrollment,
+            date=date(2025, 1, day),
+            is_present=is_present,
+        )
+
+    def test_student_who_joined_mid_period(self):
+        # Marks before joining (e.g. trial lessons) and on a day without a
+        # lesson (Tuesday the 21st) are not counted
+        for day in (6, 8, 10, 13):
+            self._mark(day, False)
+        for day, is_present in ((20, True), (21, True), (22, True), (24, False)):
+            self._mark(day, is_present)
+
+        report = AttendanceAnalytics(
+            Group.objects.select_related("teacher", "branch"),
+            date(2025, 1, 1),
+            date(2025, 1, 31),
+            period="week",
+            threshold=2,
+            today=date(2025, 2, 1),
+        ).report()
+
+        # Lessons from the 20th: 20, 22, 24, 27, 29 and 31
+        self.assertEqual(
+            report["totals"],
+            {"expected": 6, "present": 2, "absent": 1, "unmarked": 3, "rate": 0.3333},
+        )
+        self.assertEqual(
+            [(row["period"], row["unmarked"]) for row in report["rows"][0]["series"]],
+            [(date(2025, 1, 20), 0), (date(2025, 1, 27), 3)],
+        )
+        self.assertEqual(report["at_risk"], [])
+
+    def test_group_archived_mid_period(self):
+        # The group has no lessons after the day it was archived, so the marks
+        # left on the 24th and 27th are neither expected nor counted
+        self.group.is_archived = True
+        self.group.archived_at = timezone.make_aware(datetime(2025, 1, 22, 18))
+        self.group.save()
+        for day, is_present in ((20, True), (22, False), (24, False), (27, False)):
+            self._mark(day, is_present)
+
+        report = AttendanceAnalytics(
+            Group.objects.select_related("teacher", "branch"),
+            date(2025, 1, 1),
+            date(2025, 1, 31),
+            threshold=2,
+            today=date(2025, 2, 1),
+        ).report()
+
+        self.assertEqual(
+            report["totals"],
+            {"expected": 2, "present": 1, "absent": 1, "unmarked": 0, "rate": 0.5},
+        )
+        # The group's own lessons: from the 6th up to the 22nd
+        self.assertEqual(report["rows"][0]["lessons"], 8)
+        self.assertEqual(report["at_risk"], [])
+
+
+class DashboardStatsTests(TestCase):
+    """
+    The dashboard must cost a fixed number of queries however much data
+    there is, and be served from the snapshot until something changes.
+    """
+
+    QUERIES = 3  # Student, Group and User aggregates
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ceo = User.objects.create_user(998900000010, "CEO", is_ceo=True)
+        cls.teacher = User.objects.create_user(998900000011, "T", is_teacher=True)
+        cls.branch = Branch.objects.create(name="Main", address="-")
+        cls.phone = 998910000000
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.ceo)
+
+    def _add_students(self, count, balance=0, is_archived=False):
+        students = []
+        for _ in range(count):
+            DashboardStatsTests.phone += 1
+            students.append(
+                Student(
+                    full_name="Student",
+                    phone_number=self.phone,
+                    branch=self.branch,
+                    balance=balance,
+                    is_archived=is_archived,
+                )
+            )
+        Student.objects.bulk_create(students)
+
+    def _get(self, refresh=True):
+        params = {"refresh": "true"} if refresh else {}
+        return self.client.get("/api/core/dashboard-stats/", params).json()
+
+    def test_query_count_does_not_grow_with_data(self):
+        for _ in range(3):
+            self._add_students(20, balance=-100000)
+            self._add_students(10, balance=50000)
+            self._add_students(5, is_archived=True, balance=-1)
+            with self.assertNumQueries(self.QUERIES):
+                self._get()
+
+    def test_figures(self):
+        self._add_students(4, balance=-150000)
+        self._add_students(3, balance=20000)
+        self._add_students(2, balance=-500, is_archived=True)
+
+        data = self._get()
+        self.assertEqual(data["active_students"], 7)
+        self.assertEqual(data["attrition_students"], 2)
+        self.assertEqual(data["debtors"], 4)
+        self.assertEqual(data["remaining_debts"], 600000)
+        self.assertEqual(data["teachers"], 1)
+        self.assertEqual(data["admins"], 0)
+
+    def test_snapshot_is_cached_and_invalidated(self):
+        self._add_students(2)
+        first = self._get(refresh=False)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._get(refresh=False), first)
+
+        # A model save drops the snapshot (after commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.create(
+                full_name="New", phone_number=998920000000, branch=self.branch
+            )
+        self.assertEqual(self._get(refresh=False)["active_students"], 3)
+
+
+class StudentBalanceTests(TestCase):
+    """
+    Students enrolled in several groups of the same teacher must be listed
+    once, with the balance of all their enrollments, at a fixed query cost.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ceo = User.objects.create_user(998900000020, "CEO", is_ceo=True)
+        cls.teacher = User.objects.create_user(998900000021, "T", is_teacher=True)
+        cls.other = User.objects.create_user(998900000022, "T2", is_teacher=True)
+        cls.branch = Branch.objects.create(name="Main", address="-")
+        cls.phone = 998930000000
+
+    def setUp(self):
+        self.client = APIClient()
+        # Index changes are published on commit, which tests never reach
+        cache.clear()
+
+    def _group(self, teacher, index):
+        return Group.objects.create(
+            name=f"Group {index}",
+            teacher=teacher,
+            branch=self.branch,
+            start_date=date(2025, 1, 6),
+            end_date=date(2025, 6, 30),
+            course_start_time=time(9),
+            course_end_time=time(10),
+            weekdays="135",
+            color="#000000",
+            text_color="#ffffff",
+        )
+
+    def _student(self, *groups, debit=0, credit=0, full_name="Student"):
+        StudentBalanceTests.phone += 1
+        student = Student.objects.create(
+            full_name=full_name, phone_number=self.phone, branch=self.branch
+        )
+        for group in groups:
+            membership = StudentGroup.objects.create(
+                student=student, group=group, joined_at=group.start_date
+            )
+            for transaction_type, amount in (("DEBIT", debit), ("CREDIT", credit)):
+                if amount:
+                    Transaction.objects.create(
+                        student_group=membership,
+                        transaction_type=transaction_type,
+                        category=(
+                            "MONTHLY_FEE" if transaction_type == "DEBIT" else "PAYMENT"
+                        ),
+                        amount=amount,
+                    )
+        return student
+
+    def _list(self, user, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get("/api/core/students/", {"page_size": 50, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def test_student_in_several_groups_is_listed_once(self):
+        first, second = self._group(self.teacher, 1), self._group(self.teacher, 2)
+        student = self._student(first, second, debit=300000, credit=100000)
+
+        for rows in (
+            self._list(self.teacher),
+            self._list(self.ceo),
+            self._list(self.ceo, teacher_id=self.teacher.pk),
+        ):
+            self.assertEqual([row["id"] for row in rows], [student.pk])
+            self.assertEqual(len(rows[0]["groups"]), 2)
+            self.assertEqual(Decimal(rows[0]["balance"]), Decimal("-400000"))
+
+    def test_teacher_sees_only_own_students(self):
+        mine, theirs = self._group(self.teacher, 1), self._group(self.other, 2)
+        shared = self._student(mine, theirs, debit=50000)
+        self._student(theirs)
+
+        rows = self._list(self.teacher)
+        self.assertEqual([row["id"] for row in rows], [shared.pk])
+        # The balance still covers every enrollment of the student
+        self.assertEqual(Decimal(rows[0]["balance"]), Decimal("-100000"))
+
+    def test_search_is_scoped_before_ranking(self):
+        mine, theirs = self._group(self.teacher, 1), self._group(self.other, 2)
+        for _ in range(210):
+            self._student(theirs, full_name="Azizbek Karimov")
+        own = self._student(mine, full_name="Azizbek Karimova")
+        query = {"search": "Azizbek Karimov", "page_size": 300}
+
+        # The other teacher's exact matches fill the global top 200, yet
+        # must not crowd the teacher's own student out of their list, also
+        # when the scope is checked over several chunks
+        with mock.patch("core.search.SCOPE_CHUNK", 50):
+            rows = self._list(self.teacher, **query)
+        self.assertEqual([row["id"] for row in rows], [own.pk])
+        self.assertEqual(
+            len(self._list(self.ceo, **query)), TransliteratedSearchFilter.max_matches
+        )
+
+    def test_search_matches_spelling_variants_and_typos(self):
+        group = self._group(self.teacher, 1)
+        maruf = self._student(group, full_name="Маъруф Раҳимов")
+        shohruh = self._student(group, full_name="Shoxrux G'aniyev")
+        self._student(group, full_name="Dilnoza Yusupova")
+
+        for query, expected in (
+            ("Ma'ruf", [maruf]),
+            ("Maruf Rahimov", [maruf]),
+            ("Маъруф", [maruf]),
+            ("Шохрух Ғаниев", [shohruh]),
+            ("Shohruh Ganiev", [shohruh]),
+            ("Shoxrux G‘aniyev", [shohruh]),
+            # One typo in each word
+            ("Shoxrix Ganiyeb", [shohruh]),
+        ):
+            rows = self._list(self.teacher, search=query)
+            self.assertEqual(
+                [row["id"] for row in rows], [s.pk for s in expected], query
+            )
+
+    def test_search_results_are_in_rank_order(self):
+        group = self._group(self.teacher, 1)
+        word = self._student(group, full_name="Aziz Karimov")
+        prefix = self._student(group, full_name="Karimov Aziz")
+        fuzzy = self._student(group, full_name="Karimav Bobur")
+
+        # Unpaginated lists keep the ranking: name prefix, word prefix, typo
+        self.client.force_authenticate(self.teacher)
+        response = self.client.get("/api/core/students/", {"search": "Karimov"})
+        self.assertEqual(
+            [row["id"] for row in response.json()], [prefix.pk, word.pk, fuzzy.pk]
+        )
+
+    def test_query_count_does_not_grow_with_groups(self):
+        counts = []
+        for index in range(3):
+            groups = [self._group(self.teacher, f"{index}-{n}") for n in range(3)]
+            for _ in range(5):
+                self._student(*groups, debit=10000)
+            self.client.force_authenticate(self.teacher)
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get("/api/core/students/", {"page_size": 50})
+            counts.append(len(queries))
+        self.assertEqual(len(set(counts)), 1, counts)
+
+
+class ScheduleViewTests(TestCase):
+    """
+    The schedule lists the lessons of every group in the range, including
+    groups archived after it started, up to their archive day.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(998900000040, "T", is_teacher=True)
+        cls.branch = Branch.objects.create(name="Main", address="-")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def _group(self, name, archived_on=None):
+        group = Group.objects.create(
+            name=name,
+            teacher=self.teacher,
+            branch=self.branch,
+            start_date=date(2025, 1, 6),
+            end_date=date(2025, 6, 30),
+            course_start_time=time(9),
+            course_end_time=time(10),
+            weekdays="135",
+            color="#000000",
+            text_color="#ffffff",
+        )
+        if archived_on is not None:
+            group.is_archived = True
+            group.archived_at = timezone.make_aware(
+                datetime.combine(archived_on, time(18))
+            )
+            group.save()
+        return group
+
+    def _get(self, **params):
+        params = {"start_date": "2025-02-01", "end_date": "2025-02-14", **params}
+        return self.client.get("/api/core/schedule/", params)
+
+    def test_groups_archived_during_the_range_keep_their_lessons(self):
+        active = self._group("Active")
+        archived = self._group("Archived", archived_on=date(2025, 2, 7))
+        self._group("Closed", archived_on=date(2025, 1, 31))
+
+        data = self._get().json()
+
+        self.assertEqual(
+            sorted(group["id"] for group in data["groups"]),
+            [active.pk, archived.pk],
+        )
+        lessons = defaultdict(list)
+        for lesson in data["lessons"]:
+            lessons[lesson["group_id"]].append(lesson["date"])
+        # Mondays, Wednesdays and Fridays; none after the 7th for the archived one
+        self.assertEqual(
+            [day[-2:] for day in lessons[active.pk]],
+            ["03", "05", "07", "10", "12", "14"],
+        )
+        self.assertEqual([day[-2:] for day in lessons[archived.pk]], ["03", "05", "07"])
+
+    def test_filters(self):
+        group = self._group("Group")
+        other = User.objects.create_user(998900000041, "T2", is_teacher=True)
+
+        data = self._get(teacher=self.teacher.pk).json()
+        self.assertEqual([row["id"] for row in data["groups"]], [group.pk])
+        self.assertEqual(self._get(teacher=other.pk).json()["groups"], [])
+
+    def test_invalid_filter_is_rejected(self):
+        self._group("Group")
+
+        response = self._get(teacher="abc")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("teacher", response.json())
+
+
+class GroupAttendanceViewTests(TestCase):
+    """
+    The monthly attendance grid of a group: the bulk upsert/delete and the
+    compact layout.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(998900000050, "T", is_teacher=True)
+        branch = Branch.objects.create(name="Main", address="-")
+        # Lessons on Mondays, Wednesdays and Fridays from March 3rd
+        cls.group = Group.objects.create(
+            name="Group",
+            teacher=cls.teacher,
+            branch=branch,
+            start_date=date(2025, 3, 3),
+            end_date=date(2025, 6, 30),
+            course_start_time=time(9),
+            course_end_time=time(10),
+            weekdays="135",
+            color="#000000",
+            text_color="#ffffff",
+        )
+        cls.students = [
+            Student.objects.create(
+                full_name=name, phone_number=998930000500 + index, branch=branch
+            )
+            for index, name in enumerate(["Zafar", "Anvar", "Bekzod"])
+        ]
+        cls.zafar, cls.anvar, cls.bekzod = [
+            StudentGroup.objects.create(
+                student=student, group=cls.group, joined_at=date(2025, 3, 3)
+            )
+            for student in cls.students
+        ]
+        # Bekzod joined on the 10th and left on the 21st
+        cls.bekzod.joined_at = date(2025, 3, 10)
+        cls.bekzod.is_archived = True
+        cls.bekzod.archived_at = timezone.make_aware(datetime(2025, 3, 21, 18))
+        cls.bekzod.save()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+        self.url = f"/api/core/groups/{self.group.pk}/attendance/"
+
+    def _post(self, *cells):
+        return self.client.post(self.url, {"cells": list(cells)}, format="json")
+
+    def _cell(self, enrollment, day, is_present, comment=""):
+        return {
+            "student_group_id": enrollment.pk,
+            "date": f"2025-03-{day:02d}",
+            "is_present": is_present,
+            "comment": comment,
+        }
+
+    def _marks(self):
+        return set(
+            Attendance.objects.values_list(
+                "student_group_id", "date__day", "is_present", "comment"
+            )
+        )
+
+    def test_bulk_upsert(self):
+        Attendance.objects.create(
+            student_group=self.zafar, date=date(2025, 3, 3), is_present=True
+        )
+
+        response = self._post(
+            self._cell(self.zafar, 3, False, "Kasal"),
+            self._cell(self.anvar, 3, True),
+            self._cell(self.anvar, 5, False),
+            # The last cell wins
+            self._cell(self.anvar, 5, True),
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["saved"], data["deleted"], data["errors"]), (3, 0, 0))
+        self.assertEqual(
+            self._marks(),
+            {
+                (self.zafar.pk, 3, False, "Kasal"),
+                (self.anvar.pk, 3, True, ""),
+                (self.anvar.pk, 5, True, ""),
+            },
+        )
+
+    def test_bulk_delete_counts_existing_marks(self):
+        Attendance.objects.create(
+            student_group=self.zafar, date=date(2025, 3, 3), is_present=True
+        )
+        Attendance.objects.create(
+            student_group=self.anvar, date=date(2025, 3, 5), is_present=True
+        )
+
+        response = self._post(
+            self._cell(self.zafar, 3, None),
+            # Never marked
+            self._cell(self.anvar, 3, None),
+            self._cell(self.anvar, 5, True),
+        )
+
+        data = response.json()
+        self.assertEqual((data["saved"], data["deleted"], data["errors"]), (1, 1, 0))
+        self.assertEqual(self._marks(), {(self.anvar.pk, 5, True, "")})
+
+    def test_bulk_cells_are_validated(self):
+        other = Group.objects.create(
+            name="Other",
+            teacher=self.teacher,
+            branch=self.group.branch,
+            start_date=date(2025, 3, 3),
+            end_date=date(2025, 6, 30),
+            course_start_time=time(11),
+            course_end_time=time(12),
+            weekdays="135",
+            color="#000000",
+            text_color="#ffffff",
+        )
+        stranger = StudentGroup.objects.create(
+            student=self.students[0], group=other, joined_at=date(2025, 3, 3)
+        )
+
+        response = self._post(
+            self._cell(stranger, 3, True),
+            # Tuesday
+            self._cell(self.anvar, 4, True),
+            # Before joining and after leaving
+            self._cell(self.bekzod, 7, True),
+            self._cell(self.bekzod, 24, False),
+            self._cell(self.bekzod, 10, True),
+        )
+
+        data = response.json()
+        self.assertEqual((data["saved"], data["deleted"], data["errors"]), (1, 0, 4))
+        self.assertEqual(
+            [row[2] for row in data["results"]],
+            [
+                "O'quvchi bu guruhga tegishli emas.",
+                "Bu sanada dars yo'q.",
+                "O'quvchi bu sanada guruhda o'qimagan.",
+                "O'quvchi bu sanada guruhda o'qimagan.",
+                "saved",
+            ],
+        )
+        self.assertEqual(self._marks(), {(self.bekzod.pk, 10, True, "")})
+
+    def test_bulk_cells_after_the_group_was_archived(self):
+        self.group.is_archived = True
+        self.group.archived_at = timezone.make_aware(datetime(2025, 3, 12, 18))
+        self.group.save()
+
+        data = self._post(
+            self._cell(self.anvar, 12, True), self._cell(self.anvar, 14, True)
+        ).json()
+
+        self.assertEqual(
+            [row[2] for row in data["results"]], ["saved", "Bu sanada dars yo'q."]
+        )
+
+    def test_empty_payload_is_rejected(self):
+        self.assertEqual(self._post().status_code, 400)
+
+    def _compact(self, month=3):
+        response = self.client.get(
+            self.url, {"year": 2025, "month": month, "layout": "compact"}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_compact_layout(self):
+        Holiday.objects.create(date=date(2025, 3, 21), name="Navro'z")
+        for enrollment, day, is_present, comment in (
+            (self.anvar, date(2025, 3, 3), True, ""),
+            (self.zafar, date(2025, 3, 5), False, "Kasal"),
+            (self.bekzod, date(2025, 3, 10), True, ""),
+            # Not a lesson day, and a day of another month
+            (self.anvar, date(2025, 3, 4), True, "Tuesday"),
+            (self.anvar, date(2025, 4, 30), False, ""),
+        ):
+            Attendance.objects.create(
+                student_group=enrollment,
+                date=day,
+                is_present=is_present,
+                comment=comment,
+            )
+
+        data = self._compact()
+
+        # Mondays, Wednesdays and Fridays, except the holiday
+        self.assertEqual(
+            [int(day[-2:]) for day in data["lesson_days"]],
+            [3, 5, 7, 10, 12, 14, 17, 19, 24, 26, 28, 31],
+        )
+        # Rows ordered by student name
+        self.assertEqual(
+            [row[:3] for row in data["enrollments"]],
+            [
+                [self.anvar.pk, self.students[1].pk, "Anvar"],
+                [self.bekzod.pk, self.students[2].pk, "Bekzod"],
+                [self.zafar.pk, self.students[0].pk, "Zafar"],
+            ],
+        )
+        self.assertEqual(len(data["enrollment_columns"]), len(data["enrollments"][0]))
+        self.assertEqual(data["codes"], {"unmarked": 0, "present": 1, "absent": 2})
+        self.assertEqual(
+            data["attendance"],
+            [
+                [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+                [0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0],
+                [0, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+            ],
+        )
+        self.assertEqual(data["comments"], {"2:1": "Kasal"})
+
+    def test_compact_layout_without_marks_or_enrollments(self):
+        data = self._compact()
+        self.assertEqual(len(data["enrollments"]), 3)
+        self.assertEqual(data["attendance"], [[0] * 13] * 3)
+        self.assertEqual(data["comments"], {})
+
+        # Before the group started: no lessons, and nobody had joined yet
+        data = self._compact(month=2)
+        self.assertEqual(data["lesson_days"], [])
+        self.assertEqual(data["enrollments"], [])
+        self.assertEqual(data["attendance"], [])
+
+
+class BookingTestCase(TestCase):
+    """
+    Two rooms and two teachers, with one group booked in room A.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ceo = User.objects.create_user(998900000060, "CEO", is_ceo=True)
+        cls.teacher = User.objects.create_user(998900000061, "T1", is_teacher=True)
+        cls.other_teacher = User.objects.create_user(
+            998900000062, "T2", is_teacher=True
+        )
+        cls.branch = Branch.objects.create(name="Main", address="-")
+        cls.room = Room.objects.create(name="A", branch=cls.branch, capacity=10)
+        cls.other_room = Room.objects.create(name="B", branch=cls.branch, capacity=10)
+        # Mondays, Wednesdays and Fridays 09:00-10:30 from Monday, September 1st
+        cls.booked = cls._group("Booked")
+
+    @classmethod
+    def _group(cls, name, **fields):
+        values = {
+            "teacher": cls.teacher,
+            "branch": cls.branch,
+            "room": cls.room,
+            "start_date": date(2025, 9, 1),
+            "end_date": date(2025, 12, 31),
+            "course_start_time": time(9),
+            "course_end_time": time(10, 30),
+            "weekdays": "135",
+            "color": "#000000",
+            "text_color": "#ffffff",
+            **fields,
+        }
+        return Group.objects.create(name=name, **values)
+
+
+class OccupancyTests(BookingTestCase):
+    """
+    Room and teacher conflicts of group schedules and schedule overrides
+    (core.occupancy).
+    """
+
+    def _room_conflicts(self, weekdays, start, end, start_date=None, end_date=None):
+        start_date = start_date or date(2025, 9, 1)
+        end_date = end_date or date(2025, 12, 31)
+        index = OccupancyIndex.for_rooms(start_date, end_date)
+        return index.conflicts(self.room.pk, weekdays, start, end, start_date, end_date)
+
+    def test_overlapping_and_adjacent_times(self):
+        overlapping = self._room_conflicts("1", time(10), time(11))
+        self.assertEqual(
+            [(c.group_id, c.weekday, c.start_time, c.end_time) for c in overlapping],
+            [(self.booked.pk, 1, time(9), time(10, 30))],
+        )
+        # Enclosing and enclosed lessons overlap too
+        self.assertEqual(len(self._room_conflicts("5", time(8), time(12))), 1)
+        self.assertEqual(len(self._room_conflicts("3", time(9, 30), time(10))), 1)
+        # Back to back lessons do not
+        self.assertEqual(self._room_conflicts("135", time(10, 30), time(12)), [])
+        self.assertEqual(self._room_conflicts("135", time(8), time(9)), [])
+        # Nor do other weekdays
+        self.assertEqual(self._room_conflicts("246", time(9), time(10, 30)), [])
+
+    def test_date_ranges(self):
+        # Starts the day after the booked group ends
+        self.assertEqual(
+            self._room_conflicts(
+                "1", time(9), time(10), date(2026, 1, 1), date(2026, 3, 31)
+            ),
+            [],
+        )
+        # Both ranges hold December 31st, but it is a Wednesday
+        index = OccupancyIndex.for_rooms(date(2025, 12, 31), date(2026, 3, 31))
+        self.assertEqual(
+            index.conflicts(
+                self.room.pk,
+                "15",
+                time(9),
+                time(10),
+                date(2025, 12, 31),
+                date(2026, 3, 31),
+            ),
+            [],
+        )
+        self.assertEqual(
+            len(
+                index.conflicts(
+                    self.room.pk,
+                    "3",
+                    time(9),
+                    time(10),
+                    date(2025, 12, 31),
+                    date(2026, 3, 31),
+                )
+            ),
+            1,
+        )
+
+    def test_archived_groups_free_their_room(self):
+        self.booked.is_archived = True
+        self.booked.archived_at = timezone.now()
+        self.booked.save()
+
+        self.assertEqual(self._room_conflicts("135", time(9), time(10, 30)), [])
+
+    def test_overrides_occupy_their_date_only(self):
+        other = self._group(
+            "Other", room=self.other_room, teacher=self.other_teacher, weekdays="246"
+        )
+        # Saturday lesson of the other group moved into room A's free Tuesday
+        override = GroupScheduleOverride.objects.create(
+            group=other,
+            is_extra=True,
+            new_date=date(2025, 9, 9),
+            new_start_time=time(14),
+            new_end_time=time(15),
+        )
+        GroupScheduleOverride.objects.create(
+            group=other, is_cancelled=True, original_date=date(2025, 9, 2)
+        )
+
+        index = OccupancyIndex.for_rooms(date(2025, 9, 1), date(2025, 12, 31))
+        conflicts = index.conflicts(
+            self.other_room.pk,
+            "2",
+            time(14, 30),
+            time(16),
+            date(2025, 9, 1),
+            date(2025, 12, 31),
+        )
+        self.assertEqual(
+            [(c.group_id, c.date, c.override_id) for c in conflicts],
+            [(other.pk, date(2025, 9, 9), override.pk)],
+        )
+        # A single date away from the extra lesson is free
+        self.assertEqual(
+            index.date_conflicts(
+                self.other_room.pk, date(2025, 9, 16), time(14), time(15)
+            ),
+            [],
+        )
+
+    def test_group_create_and_update_report_every_conflict(self):
+        client = APIClient()
+        client.force_authenticate(self.ceo)
+        payload = {
+            "name": "New",
+            "teacher": self.teacher.pk,
+            "branch": self.branch.pk,
+            "room": self.room.pk,
+            "start_date": "2025-10-01",
+            "end_date": "2025-12-31",
+            "course_start_time": "10:00",
+            "course_end_time": "11:00",
+            "weekdays": "15",
+            "color": "#000000",
+            "text_color": "#ffffff",
+            "price": "300000",
+        }
+
+        response = client.post("/api/core/groups/", payload, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(),
+            [
+                "Xona band! Dushanba 09:00-10:30 vaqtida 'Booked' guruhi mavjud.",
+                "Xona band! Juma 09:00-10:30 vaqtida 'Booked' guruhi mavjud.",
+                "O'qituvchi band! Dushanba 09:00-10:30 vaqtida 'Booked' guruhi "
+                "mavjud.",
+                "O'qituvchi band! Juma 09:00-10:30 vaqtida 'Booked' guruhi mavjud.",
+            ],
+        )
+
+        payload.update(
+            room=self.other_room.pk,
+            teacher=self.other_teacher.pk,
+        )
+        response = client.post("/api/core/groups/", payload, format="json")
+        self.assertEqual(response.status_code, 201)
+
+        # A group does not conflict with itself when it is moved
+        response = client.patch(
+            f"/api/core/groups/{self.booked.pk}/",
+            {"course_start_time": "08:30"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_override_clean(self):
+        other = self._group(
+            "Other", room=self.other_room, teacher=self.other_teacher, weekdays="246"
+        )
+
+        def override(**fields):
+            return GroupScheduleOverride(group=other, **fields)
+
+        # Missing fields of each kind
+        invalid = [
+            override(is_extra=True, new_date=date(2025, 9, 9)),
+            override(
+                is_extra=True,
+                original_date=date(2025, 9, 2),
+                new_date=date(2025, 9, 9),
+                new_start_time=time(14),
+                new_end_time=time(15),
+            ),
+            override(is_cancelled=True),
+            override(
+                is_cancelled=True,
+                original_date=date(2025, 9, 2),
+                new_date=date(2025, 9, 9),
+            ),
+            override(original_date=date(2025, 9, 2)),
+            override(original_date=date(2025, 9, 2), new_date=date(2025, 9, 9)),
+        ]
+        for item in invalid:
+            with self.assertRaises(ValidationError):
+                item.clean()
+
+        override(is_cancelled=True, original_date=date(2025, 9, 2)).clean()
+        override(
+            original_date=date(2025, 9, 2),
+            new_date=date(2025, 9, 3),
+            new_start_time=time(11),
+            new_end_time=time(12),
+        ).clean()
+
+        # Moving the lesson into the booked room's time is a room conflict only
+        other.room = self.room
+        other.save()
+        with self.assertRaises(ValidationError) as caught:
+            override(
+                original_date=date(2025, 9, 2),
+                new_date=date(2025, 9, 3),
+                new_start_time=time(10),
+                new_end_time=time(11),
+            ).clean()
+        self.assertEqual(
+            caught.exception.messages,
+            ["Xona band! Chorshanba 09:00-10:30 vaqtida 'Booked' guruhi mavjud."],
+        )
+        # And a lesson moved onto the teacher's own lesson elsewhere
+        other.room = self.other_room
+        other.teacher = self.teacher
+        other.save()
+        with self.assertRaises(ValidationError) as caught:
+            override(
+                is_extra=True,
+                new_date=date(2025, 9, 5),
+                new_start_time=time(10),
+                new_end_time=time(11),
+            ).clean()
+        self.assertEqual(
+            caught.exception.messages,
+            ["O'qituvchi band! Juma 09:00-10:30 vaqtida 'Booked' guruhi mavjud."],
+        )
+
+
+class AvailabilityTests(BookingTestCase):
+    """
+    Free rooms, free time windows and query validation of the room/teacher
+    availability endpoints.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def _get(self, action, **params):
+        params = {
+            "weekdays": "135",
+            "start_date": "2025-09-01",
+            "end_date": "2025-12-31",
+            **params,
+        }
+        return self.client.get(f"/api/core/groups/{action}/", params)
+
+    def test_free_and_busy_rooms(self):
+        data = self._get(
+            "room_availability", course_start_time="10:00", course_end_time="11:00"
+        ).json()
+
+        self.assertEqual(
+            [room["id"] for room in data["free_rooms"]], [self.other_room.pk]
+        )
+        self.assertEqual([room["id"] for room in data["busy_rooms"]], [self.room.pk])
+        self.assertEqual(
+            [c["group_id"] for c in data["busy_rooms"][0]["conflicts"]],
+            [self.booked.pk] * 3,
+        )
+        self.assertNotIn("free_slots", data)
+
+        # The booked group itself may keep its room
+        data = self._get(
+            "room_availability",
+            course_start_time="10:00",
+            course_end_time="11:00",
+            exclude_group=self.booked.pk,
+        ).json()
+        self.assertEqual(data["busy_rooms"], [])
+
+    def test_room_free_slots(self):
+        data = self._get("room_availability", room=self.room.pk).json()
+        self.assertEqual(
+            data["free_slots"],
+            [
+                {"start_time": "08:00:00", "end_time": "09:00:00"},
+                {"start_time": "10:30:00", "end_time": "21:00:00"},
+            ],
+        )
+
+        # Too short a window is dropped; other weekdays are free all day
+        data = self._get("room_availability", room=self.room.pk, min_duration=61).json()
+        self.assertEqual(
+            data["free_slots"], [{"start_time": "10:30:00", "end_time": "21:00:00"}]
+        )
+        data = self._get("room_availability", room=self.room.pk, weekdays="2").json()
+        self.assertEqual(
+            data["free_slots"], [{"start_time": "08:00:00", "end_time": "21:00:00"}]
+        )
+
+    def test_teacher_free_slots_and_conflicts(self):
+        self._group(
+            "Evening",
+            room=self.other_room,
+            weekdays="1",
+            course_start_time=time(18),
+            course_end_time=time(19, 30),
+        )
+
+        data = self._get(
+            "teacher_availability",
+            teacher=[self.teacher.pk, self.other_teacher.pk],
+            course_start_time="18:30",
+            course_end_time="19:00",
+        ).json()
+
+        teachers = {row["id"]: row for row in data["teachers"]}
+        self.assertEqual(
+            teachers[self.teacher.pk]["free_slots"],
+            [
+                {"start_time": "08:00:00", "end_time": "09:00:00"},
+                {"start_time": "10:30:00", "end_time": "18:00:00"},
+                {"start_time": "19:30:00", "end_time": "21:00:00"},
+            ],
+        )
+        self.assertFalse(teachers[self.teacher.pk]["is_free"])
+        self.assertEqual(len(teachers[self.teacher.pk]["conflicts"]), 1)
+        self.assertTrue(teachers[self.other_teacher.pk]["is_free"])
+        self.assertEqual(
+            teachers[self.other_teacher.pk]["free_slots"],
+            [{"start_time": "08:00:00", "end_time": "21:00:00"}],
+        )
+
+    def test_invalid_queries_are_rejected(self):
+        invalid = [
+            {"weekdays": ""},
+            {"weekdays": "18"},
+            {"start_date": "2026-01-01"},
+            {"end_date": "31.12.2025"},
+            {"course_start_time": "10:00"},
+            {"course_start_time": "11:00", "course_end_time": "10:00"},
+            {"min_duration": 0},
+            {"room": "A"},
+        ]
+        for params in invalid:
+            for action in ("room_availability", "teacher_availability"):
+                with self.subTest(action=action, **params):
+                    self.assertEqual(self._get(action, **params).status_code, 400)
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Walking the student list by cursor visits every row once, in
+    (full_name, id) order, in both directions, even with tied names.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ceo = User.objects.create_user(998900000070, "CEO", is_ceo=True)
+        cls.branch = Branch.objects.create(name="Main", address="-")
+        cls.phone = 998930000700
+        for name in ["Bobur"] * 3 + ["Ali"] * 4 + ["Aziz"] * 2:
+            cls._student(name)
+
+    @classmethod
+    def _student(cls, name):
+        cls.phone += 1
+        return Student.objects.create(
+            full_name=name, phone_number=cls.phone, branch=cls.branch
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.ceo)
+
+    def _expected(self):
+        return list(Student.objects.order_by("full_name", "id").values_list("pk"))
+
+    def _get(self, url="/api/core/students/", **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def _ids(self, page):
+        return [(row["id"],) for row in page["results"]]
+
+    def _walk(self, page, link):
+        pages = [self._ids(page)]
+        while page[link]:
+            page = self._get(page[link])
+            pages.append(self._ids(page))
+        return pages, page
+
+    def test_forward_walk(self):
+        first = self._get(page_size=4)
+        self.assertIsNone(first["previous"])
+
+        pages, last = self._walk(first, "next")
+
+        self.assertEqual([len(ids) for ids in pages], [4, 4, 1])
+        self.assertEqual([pk for ids in pages for pk in ids], self._expected())
+        self.assertIsNone(last["next"])
+        self.assertIsNotNone(last["previous"])
+
+    def test_backward_walk(self):
+        _, last = self._walk(self._get(page_size=4), "next")
+
+        pages, first = self._walk(last, "previous")
+
+        # Each page keeps the ascending order; pages come back last to first
+        self.assertEqual(
+            [pk for ids in reversed(pages) for pk in ids], self._expected()
+        )
+        self.assertEqual(self._ids(first), self._expected()[:4])
+        self.assertIsNone(first["previous"])
+        self.assertIsNotNone(first["next"])
+
+    def test_cursor_is_stable_while_rows_change(self):
+        first = self._get(page_size=4)
+        seen = self._ids(first)
+        # Rows added or removed behind the cursor do not shift what follows
+        Student.objects.filter(pk=seen[0][0]).delete()
+        added = [self._student("Ali"), self._student("Aaron")]
+
+        pages, _ = self._walk(self._get(first["next"]), "next")
+
+        rest = [pk for ids in pages for pk in ids]
+        expected = self._expected()
+        self.assertEqual(rest, expected[expected.index(seen[-1]) + 1 :])
+        self.assertIn((added[0].pk,), rest)
+        self.assertNotIn((added[1].pk,), rest)
+
+    def test_plain_list_without_cursor_or_page_size(self):
+        data = self._get()
+        self.assertIsInstance(data, list)
+        self.assertEqual(len(data), 9)
+        names = [row["full_name"] for row in data]
+        self.assertEqual(names, sorted(names))
+
+        # An invalid page size falls back to the default one
+        data = self._get(page_size=0)
+        self.assertEqual(self._ids(data), self._expected())
+        self.assertIsNone(data["next"])
+
+    def test_invalid_cursor(self):
+        for cursor in ("???", "eyJ4IjogMX0=", "eyJwIjogWzFdfQ=="):
+            with self.subTest(cursor=cursor):
+                response = self.client.get("/api/core/students/", {"cursor": cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class SearchNormalizationTests(SimpleTestCase):
+    """
+    Cyrillic and Latin spellings of a name normalize to the same text, and
+    their spelling variants to the same key.
+    """
+
+    def test_cyrillic_and_latin_spellings_match(self):
+        for cyrillic, latin, text in (
+            ("Маъруф", "Ma'ruf", "maruf"),
+            ("Раъно", "Ra’no", "rano"),
+            ("Саъдуллаев", "Sa`dullayev", "sadullayev"),
+            ("Ильёс", "Ilyos", "ilyos"),
+            ("Мадьяров", "Madyarov", "madyarov"),
+            ("Шохрух Ғаниев", "Shoxrux G'aniyev", "shoxrux ganiyev"),
+            ("Ўктам", "O‘ktam", "oktam"),
+        ):
+            self.assertEqual(normalize(cyrillic), text, cyrillic)
+            self.assertEqual(normalize(latin), text, latin)
+
+    def test_spelling_variants_share_a_key(self):
+        keys = {
+            search_key(normalize(name))
+            for name in ("Shoxrux", "Shohruh", "Шохрух", "Şohruh", "Shokhrukh")
+        }
+        self.assertEqual(keys, {"şohruh"})
+        self.assertEqual(
+            search_key(normalize("Маъруф")), search_key(normalize("Ma'ruf"))
+        )
+
+
+class ApiBenchmarkTests(TestCase):
+    """
+    Every GET endpoint must answer on synthetic data within its stored query
+    baseline, and its query count must not grow with the data.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        SyntheticData(seed=0, teachers=4, groups=8, students=40, months=2).generate()
+        cls.ceo = User.objects.filter(is_ceo=True).first()
+
+    def setUp(self):
+        cache.clear()
+
+    def _queries(self):
+        results = run_benchmark(self.ceo, repeat=1)
+        for result in results:
+            self.assertLess(result["status"], 400, result)
+        return {
+            result["name"]: (result["queries"], result["warm_queries"])
+            for result in results
+        }
+
+    def test_query_counts_within_baseline(self):
+        results = run_benchmark(self.ceo, repeat=1)
+        self.assertEqual(regressions(results, load_baseline()), [])
+
+    def test_cached_endpoints_are_measured_cold(self):
+        results = {result["name"]: result for result in run_benchmark(self.ceo)}
+        for name in ("dashboard-stats", "global-search"):
+            self.assertGreater(
+                results[name]["queries"], results[name]["warm_queries"], name
+            )
+
+    def test_every_endpoint_is_in_the_baseline(self):
+        names = {endpoint.name for endpoint in discover_endpoints(self.ceo)}
+        self.assertEqual(names - set(load_baseline()), set())
+
+    def test_query_counts_do_not_grow_with_data(self):
+        before = self._queries()
+        SyntheticData(seed=1, teachers=8, groups=16, students=120, months=2).generate()
+        self.assertEqual(self._queries(), before)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """
+    Sampled requests are profiled into the log, the Server-Timing header and
+    the per-view summary served to staff by /api/ops/perf/.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ceo = User.objects.create_user(998900000030, "CEO", is_ceo=True)
+        cls.teacher = User.objects.create_user(998900000031, "T", is_teacher=True)
+        cls.branch = Branch.objects.create(name="Main", address="-")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.ceo)
+        summary.reset()
+
+    def test_fingerprint_collapses_literals_and_lists(self):
+        first = fingerprint(
+            "SELECT * FROM t WHERE a = 1 AND b = 'x' AND c IN (%s, %s, %s)"
+        )
+        second = fingerprint(
+            "SELECT *  FROM t\nWHERE a = 25 AND b = 'it''s' AND c IN (%s)"
+        )
+        self.assertEqual(first, second)
+        self.assertEqual(
+            first[1], "SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)"
+        )
+        self.assertEqual(
+            fingerprint("INSERT INTO t VALUES (%s, %s), (%s, %s)")[1],
+            "INSERT INTO t VALUES (...)",
+        )
+
+    @override_settings(PERF_SAMPLE_RATE=1, PERF_SERVER_TIMING=True)
+    def test_profiled_request(self):
+        with self.assertLogs("core.perf") as logs:
+            response = self.client.get("/api/core/branches/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("db;dur=", response["Server-Timing"])
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "branch-list")
+        self.assertGreater(record["queries"], 0)
+        self.assertEqual(record["bytes"], len(response.content))
+        self.assertTrue(record["slowest"][0]["fingerprint"])
+
+        with self.assertLogs("core.perf"):
+            data = self.client.get("/api/ops/perf/").json()
+        (view,) = [row for row in data["views"] if row["view"] == "branch-list"]
+        self.assertEqual(view["requests"], 1)
+        self.assertTrue(data["statements"])
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_unsampled_request_is_not_profiled(self):
+        response = self.client.get("/api/core/branches/")
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(self.client.get("/api/ops/perf/").json()["views"], [])
+
+    def test_summary_is_staff_only(self):
+        self.client.force_authenticate(self.teacher)
+        self.assertEqual(self.client.get("/api/ops/perf/").status_code, 403)
+        self.assertEqual(self.client.delete("/api/ops/perf/").status_code, 403)
+
+
+class SlowQueryLogTests(TestCase):
+    """
+    Statements are aggregated per fingerprint in a bounded log, with plans
+    for slow SELECTs, and exported to staff by /api/ops/slow-queries/.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ceo = User.objects.create_user(998900000040, "CEO", is_ceo=True)
+        cls.teacher = User.objects.create_user(998900000041, "T", is_teacher=True)
+        cls.branch = Branch.objects.create(name="Main", address="-")
+
+    def _row(self, log, table):
+        (row,) = [
+            row
+            for row in log.snapshot(limit=100)["queries"]
+            if row["sql"].startswith("SELECT") and f'FROM "{table}"' in row["sql"]
+        ]
+        return row
+
+    def test_statements_are_grouped_by_fingerprint(self):
+        log = SlowQueryLog()
+        with log.capture():
+            for pk in (1, 2, 3):
+                list(Branch.objects.filter(pk=pk))
+        row = self._row(log, "core_branch")
+        self.assertEqual(row["count"], 3)
+        self.assertEqual(sum(row["histogram"].values()), 3)
+        self.assertTrue(row["caller"].startswith("core/tests.py:"))
+        self.assertIsNone(row["plan"])
+
+    def test_plan_is_captured_for_slow_selects_only(self):
+        log = SlowQueryLog(explain_ms=0)
+        with log.capture():
+            list(Branch.objects.filter(name="Main"))
+            Branch.objects.create(name="Second", address="-")
+        self.assertIn("core_branch", self._row(log, "core_branch")["plan"])
+        inserts = [
+            row
+            for row in log.snapshot(limit=100)["queries"]
+            if row["sql"].startswith("INSERT")
+        ]
+        self.assertIsNone(inserts[0]["plan"])
+
+    def test_analyze_is_limited_to_read_only_selects(self):
+        select = 'SELECT "id" FROM "core_branch" WHERE "name" = %s'
+        self.assertTrue(is_read_only(select))
+        for sql in (
+            f"{select} FOR UPDATE",
+            f"{select} FOR NO KEY UPDATE SKIP LOCKED",
+            f"{select} for share",
+            "SELECT nextval('core_branch_id_seq')",
+            "SELECT pg_advisory_xact_lock(%s)",
+            'UPDATE "core_branch" SET "name" = %s',
+        ):
+            self.assertFalse(is_read_only(sql), sql)
+
+    def test_fingerprints_are_bounded(self):
+        log = SlowQueryLog(max_fingerprints=2)
+        with log.capture():
+            list(Branch.objects.all())
+            list(Student.objects.all())
+            list(Group.objects.all())
+        self.assertEqual(log.snapshot()["fingerprints"], 2)
+
+    def test_endpoint_is_staff_only(self):
+        client = APIClient()
+        slow_query_log.reset()
+        with slow_query_log.capture():
+            list(Branch.objects.all())
+
+        client.force_authenticate(self.ceo)
+        response = client.get("/api/ops/slow-queries/", {"order": "count"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["queries"])
+        self.assertEqual(
+            client.get("/api/ops/slow-queries/", {"order": "x"}).status_code, 400
+        )
+
+        client.force_authenticate(self.teacher)
+        self.assertEqual(client.get("/api/ops/slow-queries/").status_code, 403)
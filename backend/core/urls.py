@@ -1,6 +1,7 @@
 # backend/core/urls.py
 from django.urls import path, include
 from .views import DashboardStatsView, GlobalSearchView, DailyAiStatsView
+from .views import AttendanceAnalyticsView
 
 from rest_framework.routers import DefaultRouter
 from .views import (
@@ -11,6 +12,7 @@ from .views import (
     BranchViewSet,
     RoomViewSet,
     StudentGroupViewSet,
+    ScheduleView,
 )
 
 router = DefaultRouter()
@@ -25,6 +27,12 @@ urlpatterns = [
     path("dashboard-stats/", DashboardStatsView.as_view(), name="dashboard-stats"),
     path("global-search/", GlobalSearchView.as_view(), name="global-search"),
     path("ai-daily-stats/", DailyAiStatsView.as_view(), name="ai-daily-stats"),
+    path("schedule/", ScheduleView.as_view(), name="schedule"),
+    path(
+        "attendance-analytics/",
+        AttendanceAnalyticsView.as_view(),
+        name="attendance-analytics",
+    ),
     path(
         "student-enrollments/",
         StudentEnrollmentListView.as_view(),
@@ -1,6 +1,7 @@
 # backend/core/views.py
 
 from calendar import monthrange
+from collections import defaultdict
 from django.utils import timezone
 from datetime import date, datetime, timedelta
 from django.db.models import Q, F
@@ -17,8 +18,18 @@ from django.db.models import Q, Sum, Count, F, Exists, OuterRef, ProtectedError
 from yaml import serialize
 
 from users.models import User
-from finance.models import Transaction
-from .filters import StudentFilter, GroupFilter
+from finance.models import DailyFinanceRollup, Transaction
+from finance.pricing import annotate_current_price, annotate_group_price
+from .filters import StudentFilter, GroupFilter, TransliteratedSearchFilter
+from .attendance import AttendanceAnalytics
+from .schedule import LessonCalendar
+from .lessons import last_lesson_day
+from .occupancy import OccupancyIndex, conflicts_as_data, conflicts_as_messages
+from .pagination import StudentCursorPagination, count_queryset
+from .search import search
+from .stats import get_dashboard_stats
+from .perf import summary as perf_summary
+from .slowqueries import ORDERINGS, slow_query_log
 from .models import (
     Branch,
     Group,
@@ -28,8 +39,13 @@ from .models import (
     Room,
     Holiday,
     GroupScheduleOverride,
+    SearchEntry,
+)
+from users.permissions import (
+    IsAuthenticatedOrAdminForUnsafe,
+    IsAdminUser,
+    IsStaffUser,
 )
-from users.permissions import IsAuthenticatedOrAdminForUnsafe, IsAdminUser
 from .serializers import (
     DashboardStatsSerializer,
     BranchSerializer,
@@ -46,9 +62,44 @@ from .serializers import (
     GroupDetailSerializer,
     StudentGroupListSerializer,
     AttendanceSerializer,
+    AttendanceCellSerializer,
+    AttendanceAnalyticsQuerySerializer,
+    AvailabilityQuerySerializer,
 )
 
 
+def get_date_range_from_params(request):
+    """
+    Parses a date range from request query parameters.
+    Accepts ?year=2025&month=8 OR ?start_date=2025-08-01&end_date=2025-08-31
+    """
+    year = request.query_params.get("year")
+    month = request.query_params.get("month")
+    start_date_str = request.query_params.get("start_date")
+    end_date_str = request.query_params.get("end_date")
+    if year and month:
+        try:
+            year, month = int(year), int(month)
+            # Get the first and last day of the given month and year
+            first_day = date(year, month, 1)
+            last_day_of_month = monthrange(year, month)[1]
+            last_day = date(year, month, last_day_of_month)
+            return first_day, last_day
+        except (ValueError, TypeError):
+            raise ValidationError("Yil va oy noto'g'ri formatda.")
+    elif start_date_str and end_date_str:
+        try:
+            start_date = date.fromisoformat(start_date_str)
+            end_date = date.fromisoformat(end_date_str)
+            return start_date, end_date
+        except ValueError:
+            raise ValidationError("Sana noto'g'ri formatda (YYYY-MM-DD).")
+    else:
+        raise ValidationError(
+            "Iltimos, 'year' va 'month' yoki 'start_date' va 'end_date' parametrlarini kiriting."
+        )
+
+
 class BranchViewSet(viewsets.ModelViewSet):
     """
     Branch View Set
@@ -210,108 +261,113 @@ class DashboardStatsView(APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request, *args, **kwargs):
-        today = timezone.now().date()
+        """
+        Served from a cached snapshot (core.stats); ?refresh=true recomputes it.
+        """
+        refresh = request.query_params.get("refresh", "false").lower() == "true"
+        stats_data, computed_at = get_dashboard_stats(refresh=refresh)
 
-        students_with_balance = Student.objects.filter(is_archived=False).annotate(
-            balance=Sum(
-                "group_memberships__transactions__amount",
-                filter=Q(group_memberships__transactions__transaction_type="CREDIT"),
-                default=0.0,
-            )
-            - Sum(
-                "group_memberships__transactions__amount",
-                filter=Q(group_memberships__transactions__transaction_type="DEBIT"),
-                default=0.0,
-            )
+        serializer = DashboardStatsSerializer(instance=stats_data)
+        return Response(
+            {
+                **serializer.data,
+                "computed_at": computed_at,
+                "snapshot_age": int((timezone.now() - computed_at).total_seconds()),
+            }
         )
 
-        due_date_start = today - timedelta(days=30)
-        due_date_end = today - timedelta(days=23)
-        due_soon_subquery = StudentGroup.objects.filter(
-            student=OuterRef("pk"),
-            is_archived=False,
-            group__is_archived=False,
-            group__end_date__gte=today,
-            transactions__category="MONTHLY_FEE",
-            transactions__created_at__date__range=(due_date_start, due_date_end),
-        )
-        payment_due_soon_count = (
-            Student.objects.filter(is_archived=False)
-            .annotate(is_due_soon=Exists(due_soon_subquery))
-            .filter(is_due_soon=True)
-            .count()
-        )
 
-        # --- 3. Aggregate All Statistics ---
-        total_debt_amount = (
-            students_with_balance.filter(balance__lt=0).aggregate(total=Sum("balance"))[
-                "total"
-            ]
-            or 0
-        )
+class PerfSummaryView(APIView):
+    """
+    Aggregated request profiles of this worker process (core.perf): the
+    slowest views and the statements that dominate them.
+    GET /api/ops/perf/[?limit=20]; DELETE clears the figures.
+    """
 
-        # NOTE: Replace these with your actual business logic and models
-        # This is example logic.
-        stats_data = {
-            "active_leads": 0,  # Lead.objects.filter(status='active').count()
-            "groups": Group.objects.filter(is_archived=False).count(),
-            "remaining_debts": abs(total_debt_amount),
-            "debtors": students_with_balance.filter(balance__lt=0).count(),
-            "payment_due_soon": payment_due_soon_count,
-            "active_students": Student.objects.filter(is_archived=False).count(),
-            "attrition_students": Student.objects.filter(is_archived=True).count(),
-            "teachers": User.objects.filter(is_teacher=True, is_active=True).count(),
-            "admins": User.objects.filter(is_admin=True, is_active=True).count(),
-        }
+    permission_classes = [IsStaffUser]
 
-        serializer = DashboardStatsSerializer(instance=stats_data)
-        return Response(serializer.data)
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValidationError({"limit": "Musbat butun son bo'lishi kerak."})
+        return Response(perf_summary.snapshot(limit=limit))
+
+    def delete(self, request, *args, **kwargs):
+        perf_summary.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SlowQueryView(APIView):
+    """
+    Statement fingerprints of this worker process with latency histograms
+    and captured EXPLAIN plans (core.slowqueries). Needs SLOW_QUERY_LOG.
+    GET /api/ops/slow-queries/[?limit=20][&order=total|count|max|p95];
+    DELETE clears the figures.
+    """
+
+    permission_classes = [IsStaffUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise ValidationError({"limit": "Musbat butun son bo'lishi kerak."})
+        order = request.query_params.get("order", "total")
+        if order not in ORDERINGS:
+            raise ValidationError(
+                {
+                    "order": f"Quyidagilardan biri bo'lishi kerak: {', '.join(ORDERINGS)}."
+                }
+            )
+        return Response(slow_query_log.snapshot(limit=limit, order_by=order))
+
+    def delete(self, request, *args, **kwargs):
+        slow_query_log.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class GlobalSearchView(APIView):
+    """
+    Ranked search over students, parents, teachers and groups (core.search).
+    GET /api/core/global-search/?q=shoxrux[&type=student&type=parent][&limit=20]
+    Names match in Latin or Cyrillic; digits in `q` match phone numbers.
+    """
+
     permission_classes = [IsAuthenticated]
+    max_limit = 50
 
     def get(self, request, *args, **kwargs):
         query = request.query_params.get("q", "")
         if not query or len(query) < 2:
             return Response([])
 
-        # Search for teachers/staff in the User model
-        teachers = User.objects.filter(
-            Q(is_teacher=True)
-            & (Q(full_name__icontains=query) | Q(phone_number__icontains=query)),
-        ).values("id", "full_name", "phone_number")[
-            :10
-        ]  # Limit results
-
-        # Search for students in the Student model
-        students = Student.objects.filter(
-            Q(full_name__icontains=query) | Q(phone_number__icontains=query)
-        ).values("id", "full_name", "phone_number")[
-            :10
-        ]  # Limit results
+        try:
+            limit = min(int(request.query_params.get("limit", 20)), self.max_limit)
+        except ValueError:
+            limit = 20
+        kinds = set(request.query_params.getlist("type")) or None
 
         # Format results with a type identifier for the frontend
         results = []
-        for teacher in teachers:
-            results.append(
-                {
-                    "id": teacher["id"],
-                    "type": "teacher",
-                    "name": teacher["full_name"],
-                    "phone": f"+{teacher['phone_number']}",
-                }
-            )
-
-        for student in students:
-            results.append(
-                {
-                    "id": student["id"],
-                    "type": "student",
-                    "name": student["full_name"],
-                    "phone": f"+{student['phone_number']}",
-                }
-            )
+        for entry in search(query, limit=limit, kinds=kinds):
+            item = {
+                "id": entry["object_id"],
+                "type": entry["kind"],
+                "name": entry["name"],
+                "phone": f"+{entry['phone']}" if entry["phone"] else None,
+                "is_archived": entry["is_archived"],
+                "score": entry["score"],
+            }
+            if entry["kind"] == SearchEntry.Kind.PARENT:
+                item["student_id"] = entry["related_id"]
+            elif entry["kind"] == SearchEntry.Kind.GROUP:
+                item["teacher_id"] = entry["related_id"]
+            results.append(item)
 
         return Response(results)
 
@@ -332,10 +388,10 @@ class DailyAiStatsView(APIView):
         else:
             target_date = timezone.now().date() - timedelta(days=1)
 
-        # --- FINANCE FIX: Calculate income from the Transaction model ---
+        # --- FINANCE FIX: Calculate income from the daily finance rollup ---
         total_income = (
-            Transaction.objects.filter(
-                created_at__date=target_date,
+            DailyFinanceRollup.objects.filter(
+                date=target_date,
                 category=Transaction.TransactionCategory.PAYMENT,
             ).aggregate(total=Sum("amount"))["total"]
             or 0
@@ -385,6 +441,49 @@ class DailyAiStatsView(APIView):
         return Response(data)
 
 
+class AttendanceAnalyticsView(APIView):
+    """
+    Attendance rates, absence streaks and at-risk students (core.attendance).
+    GET /api/core/attendance-analytics/?start_date=...&end_date=...
+        [&group_by=group|teacher|branch][&period=week|month][&threshold=3]
+        [&branch=1][&teacher=2][&group=3]
+    Teachers only see their own groups.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        params = AttendanceAnalyticsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        groups = Group.objects.filter(
+            start_date__lte=data["end_date"], end_date__gte=data["start_date"]
+        ).select_related("teacher", "branch")
+        user = request.user
+        if not (user.is_ceo or user.is_admin):
+            if not user.is_teacher:
+                return Response(
+                    {"detail": "Sizda bu amalni bajarish uchun ruxsat yo'q."},
+                    status=status.HTTP_403_FORBIDDEN,
+                )
+            groups = groups.filter(teacher=user)
+        for field in ("branch", "teacher"):
+            if field in data:
+                groups = groups.filter(**{f"{field}_id": data[field]})
+        if "group" in data:
+            groups = groups.filter(pk=data["group"])
+
+        analytics = AttendanceAnalytics(
+            groups,
+            data["start_date"],
+            data["end_date"],
+            period=data["period"],
+            threshold=data["threshold"],
+        )
+        return Response(analytics.report(data["group_by"]))
+
+
 class StudentViewSet(viewsets.ModelViewSet):
     """
     ViewSet for listing, creating, and managing Students with advanced filtering.
@@ -392,9 +491,11 @@ class StudentViewSet(viewsets.ModelViewSet):
 
     serializer_class = StudentSerializer
     permission_classes = [IsAuthenticatedOrAdminForUnsafe]
-    filter_backends = [DjangoFilterBackend, SearchFilter]
+    pagination_class = StudentCursorPagination
+    filter_backends = [DjangoFilterBackend, TransliteratedSearchFilter]
     filterset_class = StudentFilter
     search_fields = ["full_name", "phone_number"]
+    search_kind = SearchEntry.Kind.STUDENT
 
     def get_serializer_class(self):
         # Use the new serializer only for the 'create' action
@@ -436,30 +537,24 @@ class StudentViewSet(viewsets.ModelViewSet):
         )
 
     def get_queryset(self):
+        # total_credits, total_debits and balance are ledger columns on Student
         queryset = (
             Student.objects.select_related("branch")
             .prefetch_related("parents")
             .prefetch_related("group_memberships__group__teacher")
-            .annotate(
-                total_credits=Sum(
-                    "group_memberships__transactions__amount",
-                    filter=Q(
-                        group_memberships__transactions__transaction_type="CREDIT"
-                    ),
-                    default=0.0,
-                ),
-                total_debits=Sum(
-                    "group_memberships__transactions__amount",
-                    filter=Q(group_memberships__transactions__transaction_type="DEBIT"),
-                    default=0.0,
-                ),
-                balance=F("total_credits") - F("total_debits"),
-            )
         )
 
         user: User = self.request.user
         if not (user.is_ceo or user.is_admin or user.is_superuser):
-            queryset = queryset.filter(group_memberships__group__teacher__id=user.pk)
+            # EXISTS instead of a join: a student in several of the teacher's
+            # groups must still come back once
+            queryset = queryset.filter(
+                Exists(
+                    StudentGroup.objects.filter(
+                        student=OuterRef("pk"), group__teacher=user
+                    )
+                )
+            )
         if self.request.query_params.get("is_archived"):
             is_archived = (
                 self.request.query_params.get("is_archived", "false").lower() == "true"
@@ -467,6 +562,18 @@ class StudentViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(is_archived=is_archived)
         return queryset.order_by("full_name")
 
+    @action(detail=False, methods=["get"])
+    def count(self, request):
+        """
+        Number of students matching the same filters as the list.
+        GET /api/core/students/count/?branch=1[&approximate=true]
+        `approximate=true` allows a planner estimate for the unfiltered table.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        approximate = request.query_params.get("approximate", "false").lower() == "true"
+        count, is_approximate = count_queryset(queryset, approximate=approximate)
+        return Response({"count": count, "approximate": is_approximate})
+
     def retrieve(self, request, *args, **kwargs):
         """
         Overrides retrieve to add the total balance calculation.
@@ -563,6 +670,8 @@ class GroupViewSet(viewsets.ModelViewSet):
             "teacher", "branch", "room"
         ).prefetch_related("students")
         queryset = queryset.annotate(students_count=Count("students", distinct=True))
+        # Resolve every group's current price in the same query (no per-row lookup)
+        queryset = annotate_current_price(queryset)
         is_archived = (
             self.request.query_params.get("is_archived", "false").lower() == "true"
         )
@@ -593,46 +702,44 @@ class GroupViewSet(viewsets.ModelViewSet):
         - `validated_data`: The incoming data from the serializer.
         - `instance`: The existing group object if we are updating, otherwise None.
         """
-        if "room" not in validated_data or not validated_data["room"]:
-            return  # No room assigned, so no conflict is possible
+        # FKs come from the request as objects, from the merged instance data as ids
+        room = validated_data.get("room", validated_data.get("room_id"))
+        room_id = getattr(room, "pk", room)
+        teacher = validated_data.get("teacher", validated_data.get("teacher_id"))
+        teacher_id = getattr(teacher, "pk", teacher)
+        if not room_id and not teacher_id:
+            return
 
-        room = validated_data["room"]
-        start_time = validated_data["course_start_time"]
-        end_time = validated_data["course_end_time"]
-        weekdays = set(validated_data["weekdays"])  # e.g., {'1', '3', '5'}
         start_date = validated_data["start_date"]
         end_date = validated_data["end_date"]
-
-        # --- CONFLICT CHECKING QUERY ---
-        # Find other groups that could potentially conflict.
-        conflicting_groups = Group.objects.filter(
-            # 1. Must be in the same room.
-            room=room,
-            # 2. Must be an active group.
-            is_archived=False,
-            # 3. Their date range must overlap with the new group's date range.
-            start_date__lte=end_date,
-            end_date__gte=start_date,
-            # 4. Their time slot must overlap.
-            # (StartTimeA < EndTimeB) and (EndTimeA > StartTimeB)
-            course_start_time__lt=end_time,
-            course_end_time__gt=start_time,
+        schedule = (
+            validated_data["weekdays"],
+            validated_data["course_start_time"],
+            validated_data["course_end_time"],
+            start_date,
+            end_date,
         )
+        exclude_group = instance.pk if instance else None
 
-        # If we are updating a group, we must exclude it from the conflict check.
-        if instance:
-            conflicting_groups = conflicting_groups.exclude(pk=instance.pk)
-
-        # Now, we check in Python if the weekdays overlap.
-        for existing_group in conflicting_groups:
-            existing_weekdays = set(existing_group.weekdays)
-            # The '&' operator finds the intersection of two sets.
-            # If the intersection is not empty, it means they share at least one day.
-            if weekdays & existing_weekdays:
-                # CONFLICT FOUND!
-                raise ValidationError(
-                    f"Xona band! Bu vaqtda '{existing_group.name}' guruhi mavjud."
-                )
+        # Index the weekly slots and override lessons of the room and the
+        # teacher in the date range, with one pair of queries for both
+        room_index, teacher_index = OccupancyIndex.for_room_and_teacher(
+            start_date, end_date, room=room_id, teacher=teacher_id
+        )
+        messages = []
+        if room_id:
+            conflicts = room_index.conflicts(
+                room_id, *schedule, exclude_group=exclude_group
+            )
+            messages += conflicts_as_messages(conflicts, "Xona")
+        if teacher_id:
+            conflicts = teacher_index.conflicts(
+                teacher_id, *schedule, exclude_group=exclude_group
+            )
+            messages += conflicts_as_messages(conflicts, "O'qituvchi")
+        if messages:
+            # Report every conflicting slot, not just the first one
+            raise ValidationError(messages)
 
     def perform_create(self, serializer):
         """
@@ -720,33 +827,135 @@ class GroupViewSet(viewsets.ModelViewSet):
         group.save()
         return Response({"status": "Group restored"}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=["get"])
+    def room_availability(self, request):
+        """
+        Free/busy rooms (and free time windows of one room) for a schedule.
+        GET /api/core/groups/room_availability/?weekdays=135&start_date=2025-09-01
+            &end_date=2025-12-31&course_start_time=14:00&course_end_time=15:30
+            [&branch=1][&room=3][&exclude_group=7][&min_duration=60]
+        """
+        params = AvailabilityQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        rooms = Room.objects.filter(is_archived=False).order_by("name")
+        if data.get("branch"):
+            rooms = rooms.filter(branch_id=data["branch"])
+        if data.get("room"):
+            rooms = rooms.filter(pk=data["room"])
+        rooms = list(rooms)
+
+        index = OccupancyIndex.for_rooms(
+            data["start_date"], data["end_date"], rooms=[room.pk for room in rooms]
+        )
+
+        response = {"free_rooms": [], "busy_rooms": []}
+        if data.get("course_start_time"):
+            for room in rooms:
+                conflicts = index.conflicts(
+                    room.pk,
+                    data["weekdays"],
+                    data["course_start_time"],
+                    data["course_end_time"],
+                    data["start_date"],
+                    data["end_date"],
+                    exclude_group=data.get("exclude_group"),
+                )
+                room_data = {
+                    "id": room.pk,
+                    "name": room.name,
+                    "branch_id": room.branch_id,
+                    "capacity": room.capacity,
+                }
+                if conflicts:
+                    room_data["conflicts"] = conflicts_as_data(conflicts)
+                    response["busy_rooms"].append(room_data)
+                else:
+                    response["free_rooms"].append(room_data)
+
+        if data.get("room"):
+            response["free_slots"] = [
+                {"start_time": start, "end_time": end}
+                for start, end in index.free_slots(
+                    data["room"],
+                    data["weekdays"],
+                    data["start_date"],
+                    data["end_date"],
+                    min_duration=data["min_duration"],
+                )
+            ]
+        return Response(response)
+
+    @action(detail=False, methods=["get"])
+    def teacher_availability(self, request):
+        """
+        Free time windows (and conflicts for a given time) of teachers.
+        GET /api/core/groups/teacher_availability/?weekdays=135&start_date=2025-09-01
+            &end_date=2025-12-31[&teacher=4&teacher=9][&branch=1]
+            [&course_start_time=14:00&course_end_time=15:30][&exclude_group=7]
+            [&min_duration=60]
+        Without `teacher`, every active teacher (with groups in the branch) is returned.
+        """
+        params = AvailabilityQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        teachers = User.objects.filter(is_teacher=True, is_active=True).order_by(
+            "full_name"
+        )
+        if data.get("teacher"):
+            teachers = teachers.filter(pk__in=data["teacher"])
+        if data.get("branch"):
+            # Teachers who have (or had) a group in that branch
+            teachers = teachers.filter(
+                Exists(
+                    Group.objects.filter(teacher=OuterRef("pk"), branch=data["branch"])
+                )
+            )
+        teachers = list(teachers.only("id", "full_name"))
+
+        # One index for every requested teacher, built once for the request
+        index = OccupancyIndex.for_teachers(
+            data["start_date"],
+            data["end_date"],
+            teachers=[teacher.pk for teacher in teachers],
+        )
+
+        results = []
+        for teacher in teachers:
+            teacher_data = {
+                "id": teacher.pk,
+                "full_name": teacher.full_name,
+                "free_slots": [
+                    {"start_time": start, "end_time": end}
+                    for start, end in index.free_slots(
+                        teacher.pk,
+                        data["weekdays"],
+                        data["start_date"],
+                        data["end_date"],
+                        min_duration=data["min_duration"],
+                    )
+                ],
+            }
+            if data.get("course_start_time"):
+                conflicts = index.conflicts(
+                    teacher.pk,
+                    data["weekdays"],
+                    data["course_start_time"],
+                    data["course_end_time"],
+                    data["start_date"],
+                    data["end_date"],
+                    exclude_group=data.get("exclude_group"),
+                )
+                teacher_data["is_free"] = not conflicts
+                teacher_data["conflicts"] = conflicts_as_data(conflicts)
+            results.append(teacher_data)
+        return Response({"teachers": results})
+
     def _get_date_range_from_params(self, request):
         """Helper method to parse date range from request query parameters."""
-        year = request.query_params.get("year")
-        month = request.query_params.get("month")
-        start_date_str = request.query_params.get("start_date")
-        end_date_str = request.query_params.get("end_date")
-        if year and month:
-            try:
-                year, month = int(year), int(month)
-                # Get the first and last day of the given month and year
-                first_day = date(year, month, 1)
-                last_day_of_month = monthrange(year, month)[1]
-                last_day = date(year, month, last_day_of_month)
-                return first_day, last_day
-            except (ValueError, TypeError):
-                raise ValidationError("Yil va oy noto'g'ri formatda.")
-        elif start_date_str and end_date_str:
-            try:
-                start_date = date.fromisoformat(start_date_str)
-                end_date = date.fromisoformat(end_date_str)
-                return start_date, end_date
-            except ValueError:
-                raise ValidationError("Sana noto'g'ri formatda (YYYY-MM-DD).")
-        else:
-            raise ValidationError(
-                "Iltimos, 'year' va 'month' yoki 'start_date' va 'end_date' parametrlarini kiriting."
-            )
+        return get_date_range_from_params(request)
 
     @action(detail=True, methods=["get"])
     def lesson_schedule(self, request, pk=None):
@@ -818,18 +1027,9 @@ class StudentGroupViewSet(viewsets.ModelViewSet):
         return StudentGroupEnrollSerializer
 
     def get_queryset(self):
-        # Annotate every enrollment with its calculated balance
+        # Expose the enrollment's ledger balance under the serializer's field name
         queryset = StudentGroup.objects.select_related("student", "group").annotate(
-            current_balance=Sum(
-                "transactions__amount",
-                filter=Q(transactions__transaction_type="CREDIT"),
-                default=0.0,
-            )
-            - Sum(
-                "transactions__amount",
-                filter=Q(transactions__transaction_type="DEBIT"),
-                default=0.0,
-            )
+            current_balance=F("balance")
         )
         is_archived = (
             self.request.query_params.get("is_archived", "false").lower() == "true"
@@ -919,12 +1119,13 @@ class StudentEnrollmentListView(generics.ListAPIView):
 
         # An enrollment is active if the StudentGroup is not archived,
         # the Group is not archived, and the course has not ended.
-        return StudentGroup.objects.filter(
+        queryset = StudentGroup.objects.filter(
             student__id=student_id,
             is_archived=False,
             group__is_archived=False,
             group__end_date__gte=today,
         ).select_related("group__teacher")
+        return annotate_group_price(queryset)
 
 
 class GroupAttendanceView(APIView):
@@ -936,8 +1137,9 @@ class GroupAttendanceView(APIView):
 
     def get(self, request, group_id, *args, **kwargs):
         """
-        GET /api/core/groups/5/attendance/?year=2025&month=8
+        GET /api/core/groups/5/attendance/?year=2025&month=8[&layout=compact]
         Returns all lesson days and existing attendance records for a group in a given month.
+        `layout=compact` returns the columnar payload built by `get_compact`.
         """
         try:
             group = Group.objects.get(pk=group_id)
@@ -968,6 +1170,13 @@ class GroupAttendanceView(APIView):
             )  # and left after or during this month (or not left at all)
         )
 
+        if request.query_params.get("layout") == "compact":
+            return Response(
+                self.get_compact(
+                    relevant_enrollments, lesson_days, start_of_month, end_of_month
+                )
+            )
+
         # 4. Get all existing attendance records for these days and relevant enrollments
         existing_attendance = Attendance.objects.filter(
             student_group__in=relevant_enrollments, date__in=lesson_days
@@ -976,7 +1185,7 @@ class GroupAttendanceView(APIView):
         # 5. Serialize the data into a structured format for the frontend
         serialized_attendance = {}
         for att in existing_attendance:
-            key = f"{att.student_group.id}_{att.date.isoformat()}"
+            key = f"{att.student_group_id}_{att.date.isoformat()}"
             serialized_attendance[key] = {
                 "is_present": att.is_present,
                 "comment": att.comment,
@@ -1001,13 +1210,81 @@ class GroupAttendanceView(APIView):
         }
         return Response(response_data)
 
+    # Cell codes of the compact attendance matrix
+    UNMARKED, PRESENT, ABSENT = 0, 1, 2
+
+    ENROLLMENT_COLUMNS = [
+        "student_group_id",
+        "student_id",
+        "student_name",
+        "student_phone_number",
+        "is_archived",
+        "joined_at",
+        "archived_at",
+    ]
+
+    def get_compact(self, enrollments, lesson_days, start_date, end_date):
+        """
+        Columnar form of the monthly grid, built from values_list rows only:
+        - `lesson_days`: [date, ...] (matrix columns)
+        - `enrollments`: [[student_group_id, student_id, ...], ...] (matrix rows,
+          fields listed in `enrollment_columns`)
+        - `attendance`: rows x columns matrix of UNMARKED/PRESENT/ABSENT codes
+        - `comments`: {"row:column": comment} for the cells that have one
+        """
+        enrollment_rows = list(
+            enrollments.order_by("student__full_name", "id").values_list(
+                "id",
+                "student_id",
+                "student__full_name",
+                "student__phone_number",
+                "is_archived",
+                "joined_at",
+                "archived_at",
+            )
+        )
+        row_of = {row[0]: index for index, row in enumerate(enrollment_rows)}
+        column_of = {day: index for index, day in enumerate(lesson_days)}
+
+        matrix = [[self.UNMARKED] * len(lesson_days) for _ in enrollment_rows]
+        comments = {}
+        if row_of and column_of:
+            records = Attendance.objects.filter(
+                student_group_id__in=row_of, date__range=(start_date, end_date)
+            ).values_list("student_group_id", "date", "is_present", "comment")
+            for student_group_id, day, is_present, comment in records:
+                column = column_of.get(day)
+                if column is None:
+                    continue  # not a lesson day (anymore)
+                row = row_of[student_group_id]
+                matrix[row][column] = self.PRESENT if is_present else self.ABSENT
+                if comment:
+                    comments[f"{row}:{column}"] = comment
+
+        return {
+            "lesson_days": lesson_days,
+            "enrollment_columns": self.ENROLLMENT_COLUMNS,
+            "enrollments": enrollment_rows,
+            "codes": {
+                "unmarked": self.UNMARKED,
+                "present": self.PRESENT,
+                "absent": self.ABSENT,
+            },
+            "attendance": matrix,
+            "comments": comments,
+        }
+
     def post(self, request, group_id, *args, **kwargs):
         """
         POST /api/core/groups/5/attendance/
         Creates, updates, or deletes an attendance record.
         Payload: { student_group_id: 123, date: "YYYY-MM-DD", is_present: true/false/null, comment: "..." }
+        Bulk payload: { cells: [ {...}, {...} ] } (see `bulk_post`)
         """
         data = request.data
+        if isinstance(data, list) or "cells" in data:
+            return self.bulk_post(request, group_id)
+
         student_group_id = data.get("student_group_id")
         attendance_date = data.get("date")
         is_present = data.get("is_present")
@@ -1068,3 +1345,181 @@ class GroupAttendanceView(APIView):
             )
 
         return Response(AttendanceSerializer(record).data, status=status.HTTP_200_OK)
+
+    def bulk_post(self, request, group_id):
+        """
+        Applies many attendance cells of one group at once:
+        one upsert for the marks and one delete for the `is_present: null` cells.
+        Every cell is validated in memory: its enrollment must belong to the
+        group and its date must be an actual lesson day (none after the group
+        was archived); a mark must also fall between the day the student
+        joined and the day they left. Invalid cells are reported and skipped,
+        the rest are saved.
+        Response: { saved, deleted, errors, results: [[student_group_id, date, status], ...] }
+        where status is "saved", "deleted" or an error message, and `deleted`
+        counts the marks that actually existed.
+        """
+        group = generics.get_object_or_404(Group, pk=group_id)
+        cells = (
+            request.data if isinstance(request.data, list) else request.data["cells"]
+        )
+        serializer = AttendanceCellSerializer(data=cells, many=True)
+        serializer.is_valid(raise_exception=True)
+        cells = serializer.validated_data
+        if not cells:
+            raise ValidationError({"cells": "Kamida bitta katak yuborilishi kerak."})
+
+        # Everything needed for validation, loaded once
+        enrollments = {
+            pk: (joined_at, timezone.localdate(archived_at) if archived else None)
+            for pk, joined_at, archived, archived_at in group.students.values_list(
+                "id", "joined_at", "is_archived", "archived_at"
+            )
+        }
+        last_day = last_lesson_day(group)
+        lesson_days = {
+            day
+            for day in group.actual_lesson_days(
+                min(cell["date"] for cell in cells),
+                max(cell["date"] for cell in cells),
+            )
+            if last_day is None or day <= last_day
+        }
+
+        results = []
+        to_save = {}
+        to_delete = defaultdict(set)
+        for cell in cells:
+            key = (cell["student_group_id"], cell["date"])
+            enrollment = enrollments.get(key[0])
+            if enrollment is None:
+                error = "O'quvchi bu guruhga tegishli emas."
+            elif key[1] not in lesson_days:
+                error = "Bu sanada dars yo'q."
+            elif cell["is_present"] is not None and (
+                key[1] < enrollment[0]
+                or (enrollment[1] is not None and key[1] > enrollment[1])
+            ):
+                error = "O'quvchi bu sanada guruhda o'qimagan."
+            else:
+                error = None
+            if error:
+                results.append([key[0], key[1], error])
+                continue
+
+            # The last cell wins if the same cell is sent twice
+            if cell["is_present"] is None:
+                to_save.pop(key, None)
+                to_delete[key[1]].add(key[0])
+                results.append([key[0], key[1], "deleted"])
+            else:
+                to_delete[key[1]].discard(key[0])
+                to_save[key] = Attendance(
+                    student_group_id=key[0],
+                    date=key[1],
+                    is_present=cell["is_present"],
+                    comment=cell["comment"],
+                )
+                results.append([key[0], key[1], "saved"])
+
+        delete_filter = Q(pk__in=[])
+        for day, student_group_ids in to_delete.items():
+            if student_group_ids:
+                delete_filter |= Q(date=day, student_group_id__in=student_group_ids)
+
+        deleted = 0
+        with transaction.atomic():
+            if to_save:
+                Attendance.objects.bulk_create(
+                    to_save.values(),
+                    update_conflicts=True,
+                    unique_fields=["student_group", "date"],
+                    update_fields=["is_present", "comment", "updated_at"],
+                )
+            if any(to_delete.values()):
+                deleted, _ = Attendance.objects.filter(delete_filter).delete()
+
+        return Response(
+            {
+                "saved": len(to_save),
+                "deleted": deleted,
+                "errors": sum(
+                    status_ not in ("saved", "deleted") for _, _, status_ in results
+                ),
+                "results": results,
+            }
+        )
+
+
+class ScheduleView(APIView):
+    """
+    Returns the actual lessons of every group matching the filters in one call.
+    GET /api/core/schedule/?start_date=2025-08-01&end_date=2025-08-31&branch=1
+    Filters: branch, room, teacher (same as the groups list), plus
+    ?year=2025&month=8 OR ?start_date=...&end_date=... for the range.
+    """
+
+    permission_classes = [IsAuthenticated]
+    max_range_days = 366
+
+    def get(self, request, *args, **kwargs):
+        start_range, end_range = get_date_range_from_params(request)
+        if start_range > end_range:
+            raise ValidationError("start_date end_date dan katta bo'lmasligi kerak.")
+        if (end_range - start_range).days >= self.max_range_days:
+            raise ValidationError(
+                f"Sana oralig'i {self.max_range_days} kundan oshmasligi kerak."
+            )
+
+        # Groups alive in the range, or with an extra/rescheduled lesson in it.
+        # A group archived during or after the range keeps its earlier lessons.
+        queryset = (
+            Group.objects.filter(
+                Q(is_archived=False) | Q(archived_at__date__gte=start_range)
+            )
+            .filter(
+                Q(start_date__lte=end_range, end_date__gte=start_range)
+                | Q(schedule_overrides__new_date__range=(start_range, end_range))
+            )
+            .select_related("teacher", "room")
+            .distinct()
+            .order_by("course_start_time", "name")
+        )
+        filterset = GroupFilter(request.query_params, queryset=queryset)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+
+        calendar = LessonCalendar(filterset.qs, start_range, end_range)
+        last_days = {group.pk: last_lesson_day(group) for group in calendar.groups}
+
+        data = {
+            "checked_range": {"start": start_range, "end": end_range},
+            "groups": [
+                {
+                    "id": group.id,
+                    "name": group.name,
+                    "color": group.color,
+                    "text_color": group.text_color,
+                    "teacher_id": group.teacher_id,
+                    "teacher_name": group.teacher.full_name,
+                    "branch_id": group.branch_id,
+                    "room_id": group.room_id,
+                    "room_name": group.room.name if group.room else None,
+                }
+                for group in calendar.groups
+            ],
+            "lessons": [
+                {
+                    "group_id": lesson.group_id,
+                    "date": lesson.date,
+                    "start_time": lesson.start_time,
+                    "end_time": lesson.end_time,
+                    "source": lesson.source,
+                    "override_id": lesson.override_id,
+                }
+                for lesson in calendar.all_lessons()
+                if last_days[lesson.group_id] is None
+                or lesson.date <= last_days[lesson.group_id]
+            ],
+        }
+        return Response(data)
@@ -1,5 +1,11 @@
 from django.contrib import admin
-from .models import GroupPrice, PaymentType, Transaction
+from .models import (
+    DailyFinanceRollup,
+    GroupPrice,
+    PaymentType,
+    TeacherPayroll,
+    Transaction,
+)
 from import_export.admin import ImportExportModelAdmin
 
 
@@ -76,3 +82,51 @@ class TransactionAdmin(ImportExportModelAdmin):
     def amount_display(self, obj: Transaction):
         amount = obj.amount
         return f"{amount:0,.2f}"
+
+
+@admin.register(DailyFinanceRollup)
+class DailyFinanceRollupAdmin(admin.ModelAdmin):
+    # Maintained by finance.rollup; use `rebuild_finance_rollup` to fix it
+    list_display = (
+        "date",
+        "branch",
+        "category",
+        "transaction_type",
+        "payment_type",
+        "receiver",
+        "amount",
+        "count",
+    )
+    list_filter = ("category", "transaction_type", "branch", "payment_type", "date")
+    list_select_related = ("branch", "payment_type", "receiver")
+    date_hierarchy = "date"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TeacherPayroll)
+class TeacherPayrollAdmin(admin.ModelAdmin):
+    # Snapshots are immutable; they are created by `close_payroll` or the API
+    list_display = (
+        "teacher",
+        "month",
+        "pay_type",
+        "collected",
+        "lessons_held",
+        "lessons_planned",
+        "amount",
+        "created_at",
+    )
+    list_filter = ("month", "pay_type")
+    search_fields = ("teacher__full_name",)
+    list_select_related = ("teacher",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
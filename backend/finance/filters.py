@@ -1,5 +1,5 @@
 import django_filters
-from .models import Transaction
+from .models import DailyFinanceRollup, Transaction
 
 
 class TransactionFilter(django_filters.FilterSet):
@@ -31,3 +31,21 @@ class TransactionFilter(django_filters.FilterSet):
             "payment_type",
             "category",
         ]
+
+
+class DailyFinanceRollupFilter(django_filters.FilterSet):
+    # Same parameter names as TransactionFilter, for the filters the rollup keeps
+    start_date = django_filters.DateFilter(field_name="date", lookup_expr="gte")
+    end_date = django_filters.DateFilter(field_name="date", lookup_expr="lte")
+
+    class Meta:
+        model = DailyFinanceRollup
+        fields = [
+            "branch",
+            "transaction_type",
+            "category",
+            "start_date",
+            "end_date",
+            "receiver",
+            "payment_type",
+        ]
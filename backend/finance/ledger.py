@@ -0,0 +1,309 @@
+"""
+Denormalized balance ledger.
+
+`StudentGroup` and `Student` carry `total_credits`, `total_debits` and
+`balance` columns so list views and debtor filters can read balances
+directly instead of aggregating every Transaction row.
+
+The columns are updated incrementally (see finance.signals) inside the same
+database transaction as the Transaction write. Ordinary saves of students
+and enrollments leave them out (core.models.LedgerMixin); reassigning an
+enrollment moves its totals to the new student (`move_enrollment`).
+
+Writes that bypass model signals must apply their own deltas:
+`record_transactions` after a `bulk_create`, `rebuild_balances` for the
+affected enrollments after a `QuerySet.update`, or `recompute_balances` after
+bulk loads.
+"""
+
+from decimal import Decimal
+
+from django.db.models import (
+    Case,
+    DecimalField,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+
+from core.models import LEDGER_FIELDS, Student, StudentGroup
+from core.stats import invalidate_dashboard_stats
+
+
+ZERO = Decimal("0.00")
+
+
+def _zero():
+    return Value(ZERO, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def entry_for(transaction_type, amount):
+    """
+    Returns the (credits, debits) pair a single transaction contributes.
+    """
+    if transaction_type == "CREDIT":
+        return amount, ZERO
+    if transaction_type == "DEBIT":
+        return ZERO, amount
+    return ZERO, ZERO
+
+
+def apply_delta(student_group_id, credits, debits):
+    """
+    Adds the given credits/debits to an enrollment and to its student.
+    Uses F() expressions so concurrent writers never lose an update.
+    """
+    if not credits and not debits:
+        return
+
+    delta = {
+        "total_credits": F("total_credits") + credits,
+        "total_debits": F("total_debits") + debits,
+        "balance": F("balance") + (credits - debits),
+    }
+    StudentGroup.objects.filter(pk=student_group_id).update(**delta)
+    Student.objects.filter(group_memberships__id=student_group_id).update(**delta)
+
+
+# Rows per UPDATE in `record_transactions`, well under SQLite's parameter limit
+DELTA_BATCH = 500
+
+
+def _apply_deltas(model, deltas):
+    """
+    Adds {pk: (credits, debits)} to the ledger columns of `model` with one
+    UPDATE per DELTA_BATCH rows, using CASE expressions on the pk.
+    """
+    items = list(deltas.items())
+    for offset in range(0, len(items), DELTA_BATCH):
+        batch = items[offset : offset + DELTA_BATCH]
+
+        def case(amount):
+            return Case(
+                *[When(pk=pk, then=Value(amount(delta))) for pk, delta in batch],
+                default=_zero(),
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            )
+
+        model.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+            total_credits=F("total_credits") + case(lambda delta: delta[0]),
+            total_debits=F("total_debits") + case(lambda delta: delta[1]),
+            balance=F("balance") + case(lambda delta: delta[0] - delta[1]),
+        )
+
+
+def record_transactions(transactions):
+    """
+    Applies newly bulk-created Transaction objects as F() deltas, like the
+    signals do for single writes, so concurrent updates are never
+    overwritten. One UPDATE per DELTA_BATCH enrollments or students.
+    """
+    deltas = {}
+    for instance in transactions:
+        credits, debits = entry_for(instance.transaction_type, Decimal(instance.amount))
+        old_credits, old_debits = deltas.get(instance.student_group_id, (ZERO, ZERO))
+        deltas[instance.student_group_id] = (old_credits + credits, old_debits + debits)
+    deltas = {pk: delta for pk, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    student_deltas = {}
+    owners = StudentGroup.objects.filter(pk__in=deltas).values_list("pk", "student_id")
+    for student_group_id, student_id in owners:
+        credits, debits = deltas[student_group_id]
+        old_credits, old_debits = student_deltas.get(student_id, (ZERO, ZERO))
+        student_deltas[student_id] = (old_credits + credits, old_debits + debits)
+
+    _apply_deltas(StudentGroup, deltas)
+    _apply_deltas(Student, student_deltas)
+    # bulk_create sends no signals, so drop the dashboard snapshot here
+    invalidate_dashboard_stats()
+
+
+def move_enrollment(student_group_id, from_student_id, to_student_id):
+    """
+    Moves the totals of an enrollment that was reassigned to another student.
+    The totals are read inside the UPDATE statements, so deltas recorded by
+    concurrent payments are moved along with them.
+    """
+    enrollment = StudentGroup.objects.filter(pk=student_group_id)
+
+    def current(field):
+        return Subquery(enrollment.values(field)[:1])
+
+    Student.objects.filter(pk=from_student_id).update(
+        **{field: F(field) - current(field) for field in LEDGER_FIELDS}
+    )
+    Student.objects.filter(pk=to_student_id).update(
+        **{field: F(field) + current(field) for field in LEDGER_FIELDS}
+    )
+
+
+def record_change(previous, current):
+    """
+    Applies the difference between two ledger entries.
+    Each entry is a (student_group_id, transaction_type, amount) tuple or None.
+    """
+    deltas = {}
+    for entry, sign in ((previous, -1), (current, 1)):
+        if entry is None:
+            continue
+        student_group_id, transaction_type, amount = entry
+        credits, debits = entry_for(transaction_type, Decimal(amount))
+        old_credits, old_debits = deltas.get(student_group_id, (ZERO, ZERO))
+        deltas[student_group_id] = (
+            old_credits + sign * credits,
+            old_debits + sign * debits,
+        )
+
+    for student_group_id, (credits, debits) in deltas.items():
+        apply_delta(student_group_id, credits, debits)
+
+
+def enrollment_totals(student_ids=None):
+    """
+    Returns {student_group_id: (credits, debits)} computed from Transaction rows
+    with a single grouped query, optionally limited to the given students.
+    """
+    from finance.models import Transaction
+
+    queryset = Transaction.objects.all()
+    if student_ids is not None:
+        queryset = queryset.filter(student_group__student_id__in=student_ids)
+
+    rows = (
+        queryset.order_by()
+        .values("student_group_id")
+        .annotate(
+            credits=Coalesce(
+                Sum("amount", filter=Q(transaction_type="CREDIT")), _zero()
+            ),
+            debits=Coalesce(Sum("amount", filter=Q(transaction_type="DEBIT")), _zero()),
+        )
+        .values_list("student_group_id", "credits", "debits")
+    )
+    return {sg_id: (credits, debits) for sg_id, credits, debits in rows}
+
+
+def _needs_update(obj, credits, debits):
+    return (obj.total_credits, obj.total_debits, obj.balance) != (
+        credits,
+        debits,
+        credits - debits,
+    )
+
+
+def _set_totals(obj, credits, debits):
+    obj.total_credits = credits
+    obj.total_debits = debits
+    obj.balance = credits - debits
+
+
+def rebuild_balances(student_group_ids=None, batch_size=1000, dry_run=False):
+    """
+    Reconciles ledger columns with the Transaction table in bulk.
+
+    When `student_group_ids` is given, every enrollment of the students owning
+    those enrollments is recomputed (a student's balance depends on all of
+    them); otherwise the whole table is. Only rows that drifted are written.
+    Returns a tuple (enrollments_fixed, students_fixed).
+    """
+    student_ids = None
+    if student_group_ids is not None:
+        student_ids = set(
+            StudentGroup.objects.filter(pk__in=student_group_ids).values_list(
+                "student_id", flat=True
+            )
+        )
+        if not student_ids:
+            return 0, 0
+
+    totals = enrollment_totals(student_ids)
+
+    enrollments = StudentGroup.objects.only("id", "student_id", *LEDGER_FIELDS)
+    students = Student.objects.only("id", *LEDGER_FIELDS)
+    if student_ids is not None:
+        enrollments = enrollments.filter(student_id__in=student_ids)
+        students = students.filter(pk__in=student_ids)
+
+    drifted = []
+    student_totals = {}
+    for enrollment in enrollments.iterator(chunk_size=batch_size):
+        credits, debits = totals.get(enrollment.pk, (ZERO, ZERO))
+        old_credits, old_debits = student_totals.get(
+            enrollment.student_id, (ZERO, ZERO)
+        )
+        student_totals[enrollment.student_id] = (
+            old_credits + credits,
+            old_debits + debits,
+        )
+        if _needs_update(enrollment, credits, debits):
+            _set_totals(enrollment, credits, debits)
+            drifted.append(enrollment)
+
+    drifted_students = []
+    for student in students.iterator(chunk_size=batch_size):
+        credits, debits = student_totals.get(student.pk, (ZERO, ZERO))
+        if _needs_update(student, credits, debits):
+            _set_totals(student, credits, debits)
+            drifted_students.append(student)
+
+    if not dry_run:
+        StudentGroup.objects.bulk_update(
+            drifted, list(LEDGER_FIELDS), batch_size=batch_size
+        )
+        Student.objects.bulk_update(
+            drifted_students, list(LEDGER_FIELDS), batch_size=batch_size
+        )
+        if drifted or drifted_students:
+            # bulk_update sends no signals, so drop the dashboard snapshot here
+            invalidate_dashboard_stats()
+
+    return len(drifted), len(drifted_students)
+
+
+def recompute_balances():
+    """
+    Recomputes every ledger column inside the database, with one UPDATE per
+    table. Meant for bulk loads, where nearly every row changes and the
+    per-row diff of `rebuild_balances` would be slow.
+    Returns (enrollments, students) updated.
+    """
+    from finance.models import Transaction
+
+    def enrollment_total(transaction_type):
+        # The type is a FILTER, not a WHERE, so the lookup always goes through
+        # the student_group index
+        rows = (
+            Transaction.objects.filter(student_group=OuterRef("pk"))
+            .order_by()
+            .values("student_group")
+            .annotate(total=Sum("amount", filter=Q(transaction_type=transaction_type)))
+            .values("total")
+        )
+        return Coalesce(Subquery(rows), _zero())
+
+    def student_total(field):
+        rows = (
+            StudentGroup.objects.filter(student=OuterRef("pk"))
+            .order_by()
+            .values("student")
+            .annotate(total=Sum(field))
+            .values("total")
+        )
+        return Coalesce(Subquery(rows), _zero())
+
+    credits, debits = enrollment_total("CREDIT"), enrollment_total("DEBIT")
+    enrollments = StudentGroup.objects.update(
+        total_credits=credits, total_debits=debits, balance=credits - debits
+    )
+    students = Student.objects.update(
+        **{field: student_total(field) for field in LEDGER_FIELDS}
+    )
+    invalidate_dashboard_stats()
+    return enrollments, students
@@ -0,0 +1,71 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from dateutil.relativedelta import relativedelta
+
+from finance.payroll import close_month, compute_payroll
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes teacher pay for a month and stores it as immutable payroll "
+        "snapshots. Teachers that already have a snapshot for the month are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--month",
+            type=str,
+            help="Month to close in YYYY-MM format. Defaults to the previous month.",
+        )
+        parser.add_argument(
+            "--teacher",
+            type=int,
+            action="append",
+            dest="teachers",
+            help="Only the given teacher id (can be repeated).",
+        )
+        parser.add_argument(
+            "--prorate",
+            action="store_true",
+            help="Pro-rate fixed salaries by the share of lessons held.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the computed payroll without storing it.",
+        )
+
+    def handle(self, *args, **options):
+        if options["month"]:
+            try:
+                month = date.fromisoformat(options["month"] + "-01")
+            except ValueError:
+                raise CommandError("Month format is invalid. Please use YYYY-MM.")
+        else:
+            month = timezone.now().date().replace(day=1) - relativedelta(months=1)
+
+        if options["dry_run"]:
+            payrolls = compute_payroll(
+                month, teacher_ids=options["teachers"], prorate=options["prorate"]
+            )
+            skipped = []
+        else:
+            payrolls, skipped = close_month(
+                month, teacher_ids=options["teachers"], prorate=options["prorate"]
+            )
+
+        for payroll in payrolls:
+            self.stdout.write(
+                f"  {payroll.teacher_id}: {payroll.get_pay_type_display()} "
+                f"{payroll.amount} (collected {payroll.collected}, "
+                f"lessons {payroll.lessons_held}/{payroll.lessons_planned})"
+            )
+        verb = "Would store" if options["dry_run"] else "Stored"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {len(payrolls)} payrolls for {month:%Y-%m}; "
+                f"{len(skipped)} already closed."
+            )
+        )
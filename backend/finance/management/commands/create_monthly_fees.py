@@ -1,13 +1,14 @@
-from datetime import datetime
+import time
 from django.utils import timezone
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from datetime import date, timedelta
 from dateutil.relativedelta import relativedelta
 from django.core.management.base import BaseCommand, CommandError
-from django.db.models.functions import ExtractMonth, ExtractYear
 
 from core.models import StudentGroup
+from finance import ledger, rollup
 from finance.models import Transaction
+from finance.pricing import PriceTimeline
 
 
 month_names = [
@@ -38,6 +39,29 @@ def get_billing_day(enrollment, run_date):
     return default_billing_day
 
 
+def calculate_charge(enrollment, price, run_date, current_month):
+    """
+    Returns (charge_amount, comment) for one enrollment, pro-rated when the
+    student joined during the billed month.
+    """
+    if (
+        enrollment.joined_at.year == run_date.year
+        and enrollment.joined_at.month == run_date.month
+        and enrollment.joined_at.day != 1
+    ):
+        days_in_month = (
+            run_date.replace(day=1) + relativedelta(months=1) - timedelta(days=1)
+        ).day
+        days_attended = days_in_month - enrollment.joined_at.day + 1
+        # A simple pro-rating logic
+        charge_amount = int(round((price / days_in_month) * days_attended, -3))
+        comment = f"{current_month} oyi uchun oylik to'lov. ({days_attended} kun uchun hisoblangan)"
+    else:
+        charge_amount = price
+        comment = f"{current_month} oyi uchun oylik to'lov."
+    return charge_amount, comment
+
+
 class Command(BaseCommand):
     help = (
         "Creates monthly fee (DEBIT) transactions for all active student enrollments."
@@ -50,8 +74,36 @@ class Command(BaseCommand):
             type=str,
             help="Run the command for a specific date in YYYY-MM-DD format. Defaults to today.",
         )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Calculate the fees and print a summary without writing anything.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of transactions inserted per transaction/INSERT. Defaults to 1000.",
+        )
+
+    def _phase(self, name, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"  [{name}] {elapsed * 1000:.1f} ms")
+        return time.perf_counter()
+
+    def _billed(self, billing_month, enrollment_ids=None):
+        fees = Transaction.objects.filter(billing_month=billing_month)
+        if enrollment_ids is not None:
+            fees = fees.filter(student_group_id__in=enrollment_ids)
+        return set(fees.values_list("student_group_id", flat=True))
+
+    def _write(self, batch):
+        with transaction.atomic():
+            Transaction.objects.bulk_create(batch)
+            # bulk_create skips model signals, so apply their deltas here.
+            ledger.record_transactions(batch)
+            rollup.record_transactions(batch)
 
-    @transaction.atomic
     def handle(self, *args, **options):
         """
         The main logic of the management command.
@@ -70,131 +122,138 @@ class Command(BaseCommand):
             run_date = timezone.now().date()
             self.stdout.write(f"Running for today's date: {run_date}")
 
-        current_month = month_names[int(run_date.strftime("%m")) - 1]
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+        dry_run = options["dry_run"]
+        verbose = options["verbosity"] >= 2
+
+        current_month = month_names[run_date.month - 1]
+        started = time.perf_counter()
 
-        # --- 1. Find all active student enrollments ---
+        # --- 1. Load all active student enrollments in one query ---
         # An enrollment is active if the StudentGroup is not archived, the Group is not archived,
         # and the group has not ended yet.
-        active_enrollments = StudentGroup.objects.filter(
-            is_archived=False, group__is_archived=False, group__end_date__gte=run_date
-        ).select_related("student", "group")
-
+        active_enrollments = list(
+            StudentGroup.objects.filter(
+                is_archived=False,
+                group__is_archived=False,
+                group__end_date__gte=run_date,
+            )
+            .select_related("student")
+            .only("id", "group_id", "joined_at", "price", "student__full_name")
+        )
         self.stdout.write(
-            f"Found {active_enrollments.count()} active student enrollments to check..."
+            f"Found {len(active_enrollments)} active student enrollments to check..."
         )
+        started = self._phase("load enrollments", started)
 
-        created_count = 0
-        skipped_count = 0
+        # --- 2. Preload every enrollment already billed for this month ---
+        # By billing month, not created_at: a run for a past or future date
+        # is stored with the current time.
+        billing_month = run_date.replace(day=1)
+        already_billed = self._billed(billing_month)
+        started = self._phase("load existing fees", started)
+
+        # --- 3. Resolve group prices for all groups at once ---
+        price_timeline = PriceTimeline.for_groups(
+            {e.group_id for e in active_enrollments}, until=run_date
+        )
+        started = self._phase("resolve prices", started)
 
-        # --- 2. Loop through each active enrollment ---
+        # --- 4. Compute every charge in memory ---
+        to_create = []
+        skipped_count = 0
         for enrollment in active_enrollments:
             student_name = enrollment.student.full_name
-            group_name = enrollment.group.name
 
             if enrollment.joined_at > run_date:
-                self.stdout.write(
-                    self.style.WARNING(f"⚠️ Skipped {student_name}: joined in future")
-                )
+                if verbose:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"⚠️ Skipped {student_name}: joined in future"
+                        )
+                    )
                 skipped_count += 1
                 continue
 
-            # --- 3. Determine the "billing day" for this month ---
             # It's either the 5th of the month, or 5 days after their join date, whichever is LATER.
-            billing_day = get_billing_day(enrollment, run_date)
-
-            # --- 4. Check if today is the billing day or later for this student ---
-            if run_date.day < billing_day:
-                # It's not yet time to bill this student for this month.
-                skipped_count += 1
-                self.stdout.write(
-                    self.style.WARNING(
-                        f"Skipped {student_name}: joined at {enrollment.joined_at.strftime('%d.%m.%Y')}"
+            if run_date.day < get_billing_day(enrollment, run_date):
+                if verbose:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"Skipped {student_name}: joined at {enrollment.joined_at.strftime('%d.%m.%Y')}"
+                        )
                     )
-                )
+                skipped_count += 1
                 continue
 
-            # --- 5. Check if a monthly fee has ALREADY been created for this month ---
-            start_of_this_month = run_date.replace(day=1)
-            already_created = (
-                Transaction.objects.annotate(
-                    month=ExtractMonth("created_at"), year=ExtractYear("created_at")
-                )
-                .filter(
-                    student_group=enrollment,
-                    category=Transaction.TransactionCategory.MONTHLY_FEE,
-                    month=run_date.month,
-                    year=run_date.year,
-                )
-                .exists()
-            )
-
-            if already_created:
-                self.stdout.write(
-                    self.style.WARNING(
-                        f"Skipped {student_name}: already transaction created"
+            if enrollment.pk in already_billed:
+                if verbose:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"Skipped {student_name}: already transaction created"
+                        )
                     )
-                )
                 skipped_count += 1
                 continue
 
-            # --- 6. If all checks pass, create the DEBIT transaction ---
-            effective_price = (
-                enrollment.effective_price or 0
-            )  # Use the property to get student-specific or group price
-
-            # Pro-rate the price if the student joined this month
-            if (
-                enrollment.joined_at.year == run_date.year
-                and enrollment.joined_at.month == run_date.month
-                and enrollment.joined_at.day != 1
-            ):
-                days_in_month = (
-                    run_date.replace(day=1)
-                    + relativedelta(months=1)
-                    - timedelta(days=1)
-                ).day
-                days_attended = days_in_month - enrollment.joined_at.day + 1
-                # A simple pro-rating logic
-                charge_amount = int(
-                    round((effective_price / days_in_month) * days_attended, -3)
-                )
-                comment = f"{current_month} oyi uchun oylik to'lov. ({days_attended} kun uchun hisoblangan)"
-            else:
-                charge_amount = effective_price
-                comment = f"{current_month} oyi uchun oylik to'lov."
+            # Student-specific price, or the group price active on the run date
+            price = enrollment.price
+            if price is None:
+                price = price_timeline.price_on(enrollment.group_id, run_date) or 0
 
-            try:
-                Transaction.objects.create(
-                    student_group=enrollment,
+            charge_amount, comment = calculate_charge(
+                enrollment, price, run_date, current_month
+            )
+            to_create.append(
+                Transaction(
+                    student_group_id=enrollment.pk,
                     transaction_type=Transaction.TransactionType.DEBIT,
                     category=Transaction.TransactionCategory.MONTHLY_FEE,
                     amount=charge_amount,
                     comment=comment,
-                    created_at=datetime.combine(
-                        run_date,
-                        datetime.min.time(),
-                        tzinfo=timezone.get_current_timezone(),
-                    ),
+                    billing_month=billing_month,
                 )
-                created_count += 1
+            )
+            if verbose:
                 self.stdout.write(
                     self.style.SUCCESS(
-                        f"  + Created DEBIT for {student_name} in {group_name} for {charge_amount} so'm | {comment}"
+                        f"  + DEBIT for {student_name} for {charge_amount} so'm | {comment}"
                     )
                 )
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f"❌ Failed to create for {student_name}: {str(e)}"
+        started = self._phase("compute charges", started)
+
+        # --- 5. Write in chunks, each in its own short transaction ---
+        if dry_run:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"\nDry run: {len(to_create)} monthly fee transactions would be created."
+                )
+            )
+        else:
+            created_count = 0
+            for offset in range(0, len(to_create), batch_size):
+                batch = to_create[offset : offset + batch_size]
+                try:
+                    self._write(batch)
+                except IntegrityError:
+                    # A concurrent run billed some of these enrollments since
+                    # step 2; the unique billing month rejected the whole batch.
+                    billed = self._billed(
+                        billing_month, [fee.student_group_id for fee in batch]
                     )
+                    skipped_count += len(billed)
+                    batch = [fee for fee in batch if fee.student_group_id not in billed]
+                    self._write(batch)
+                created_count += len(batch)
+            started = self._phase("write transactions", started)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"\nSuccessfully created {created_count} new monthly fee transactions."
                 )
-                continue
-
-        self.stdout.write(
-            self.style.SUCCESS(
-                f"\nSuccessfully created {created_count} new monthly fee transactions."
             )
-        )
+
         self.stdout.write(
             f"Skipped {skipped_count} enrollments (either not yet due or already billed)."
         )
@@ -0,0 +1,43 @@
+from django.db import transaction
+from django.core.management.base import BaseCommand
+
+from finance.ledger import rebuild_balances
+
+
+class Command(BaseCommand):
+    help = "Reconciles the denormalized student/enrollment balances with transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--student-group",
+            type=int,
+            action="append",
+            dest="student_groups",
+            help="Only rebuild the given StudentGroup id (can be repeated).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows written per UPDATE batch. Defaults to 1000.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drifted rows, do not write anything.",
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        enrollments_fixed, students_fixed = rebuild_balances(
+            student_group_ids=options["student_groups"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+
+        verb = "Would fix" if options["dry_run"] else "Fixed"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {enrollments_fixed} enrollment and {students_fixed} student balances."
+            )
+        )
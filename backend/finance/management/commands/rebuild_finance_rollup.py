@@ -0,0 +1,58 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance.rollup import rebuild_rollup
+
+
+def parse_date(value, name):
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"{name} format is invalid. Please use YYYY-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = "Backfills and reconciles the daily finance rollup with transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--start", type=str, help="First date to rebuild (YYYY-MM-DD)."
+        )
+        parser.add_argument(
+            "--end", type=str, help="Last date to rebuild (YYYY-MM-DD)."
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows inserted per INSERT. Defaults to 1000.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drifted keys, do not write anything.",
+        )
+
+    def handle(self, *args, **options):
+        start = parse_date(options["start"], "--start")
+        end = parse_date(options["end"], "--end")
+        if start and end and start > end:
+            raise CommandError("--start must not be after --end.")
+
+        drifted = rebuild_rollup(
+            start=start,
+            end=end,
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+        )
+
+        verb = "Would rebuild" if options["dry_run"] else "Rebuilt"
+        if drifted:
+            self.stdout.write(
+                self.style.WARNING(f"{verb} the rollup: {drifted} keys drifted.")
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS("The rollup is up to date."))
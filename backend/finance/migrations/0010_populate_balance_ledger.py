@@ -0,0 +1,62 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Q, Sum
+
+
+def populate_balances(apps, schema_editor):
+    StudentGroup = apps.get_model("core", "StudentGroup")
+    Student = apps.get_model("core", "Student")
+    Transaction = apps.get_model("finance", "Transaction")
+    zero = Decimal("0.00")
+
+    totals = {
+        row["student_group_id"]: row
+        for row in Transaction.objects.order_by()
+        .values("student_group_id")
+        .annotate(
+            credits=Sum("amount", filter=Q(transaction_type="CREDIT")),
+            debits=Sum("amount", filter=Q(transaction_type="DEBIT")),
+        )
+    }
+
+    enrollments = []
+    student_totals = {}
+    for enrollment in StudentGroup.objects.all().iterator():
+        row = totals.get(enrollment.pk, {})
+        credits = row.get("credits") or zero
+        debits = row.get("debits") or zero
+        enrollment.total_credits = credits
+        enrollment.total_debits = debits
+        enrollment.balance = credits - debits
+        enrollments.append(enrollment)
+        old = student_totals.get(enrollment.student_id, (zero, zero))
+        student_totals[enrollment.student_id] = (old[0] + credits, old[1] + debits)
+
+    StudentGroup.objects.bulk_update(
+        enrollments, ["total_credits", "total_debits", "balance"], batch_size=1000
+    )
+
+    students = []
+    for student in Student.objects.filter(pk__in=student_totals.keys()).iterator():
+        credits, debits = student_totals[student.pk]
+        student.total_credits = credits
+        student.total_debits = debits
+        student.balance = credits - debits
+        students.append(student)
+
+    Student.objects.bulk_update(
+        students, ["total_credits", "total_debits", "balance"], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_student_balance_student_total_credits_and_more"),
+        ("finance", "0009_transaction_finance_tra_student_966472_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_searchentry_key"),
+        ("finance", "0010_populate_balance_ledger"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyFinanceRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Sana")),
+                (
+                    "category",
+                    models.CharField(
+                        choices=[
+                            ("MONTHLY_FEE", "Oylik to'lov"),
+                            ("PAYMENT", "To'lov"),
+                            ("DISCOUNT", "Chegirma"),
+                            ("BONUS", "Bonus"),
+                            ("REFUND", "Pulni qaytarish"),
+                            ("OTHER_FEE", "Boshqa to'lovlar uchun"),
+                        ],
+                        max_length=20,
+                        verbose_name="Kategoriya",
+                    ),
+                ),
+                (
+                    "transaction_type",
+                    models.CharField(
+                        choices=[
+                            ("DEBIT", "Debit (Qarz)"),
+                            ("CREDIT", "Credit (To'lov)"),
+                        ],
+                        max_length=6,
+                        verbose_name="Tranzaksiya turi",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=14, verbose_name="Summa"
+                    ),
+                ),
+                ("count", models.IntegerField(default=0, verbose_name="Soni")),
+                (
+                    "branch",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="finance_rollups",
+                        to="core.branch",
+                        verbose_name="Filial",
+                    ),
+                ),
+                (
+                    "payment_type",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="finance_rollups",
+                        to="finance.paymenttype",
+                        verbose_name="To'lov turi",
+                    ),
+                ),
+                (
+                    "receiver",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="finance_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Qabul qiluvchi",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Kunlik moliya hisoboti",
+                "verbose_name_plural": "Kunlik moliya hisobotlari",
+                "indexes": [
+                    models.Index(
+                        fields=["date", "category"], name="finance_dai_date_771fef_idx"
+                    ),
+                    models.Index(
+                        fields=["branch", "date"], name="finance_dai_branch__fdb0b2_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_rollup(apps, schema_editor):
+    Transaction = apps.get_model("finance", "Transaction")
+    DailyFinanceRollup = apps.get_model("finance", "DailyFinanceRollup")
+
+    rows = (
+        Transaction.objects.order_by()
+        .values(
+            "category",
+            "transaction_type",
+            "payment_type_id",
+            "receiver_id",
+            day=TruncDate("created_at"),
+            branch=F("student_group__group__branch_id"),
+        )
+        .annotate(total=Sum("amount"), rows=Count("pk"))
+    )
+    DailyFinanceRollup.objects.bulk_create(
+        (
+            DailyFinanceRollup(
+                date=row["day"],
+                branch_id=row["branch"],
+                category=row["category"],
+                transaction_type=row["transaction_type"],
+                payment_type_id=row["payment_type_id"],
+                receiver_id=row["receiver_id"],
+                amount=row["total"],
+                count=row["rows"],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0011_dailyfinancerollup"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_rollup, migrations.RunPython.noop),
+    ]
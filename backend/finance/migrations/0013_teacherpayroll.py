@@ -0,0 +1,103 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0012_populate_finance_rollup"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TeacherPayroll",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField(help_text="First day of the paid month")),
+                (
+                    "pay_type",
+                    models.CharField(
+                        choices=[("percentage", "Foiz"), ("salary", "Oylik")],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "percentage",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=5, null=True
+                    ),
+                ),
+                (
+                    "salary",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "collected",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        help_text="PAYMENT credits collected on the teacher's groups",
+                        max_digits=14,
+                    ),
+                ),
+                ("lessons_planned", models.PositiveIntegerField(default=0)),
+                ("lessons_held", models.PositiveIntegerField(default=0)),
+                ("prorated", models.BooleanField(default=False)),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=14, verbose_name="Summa"
+                    ),
+                ),
+                (
+                    "details",
+                    models.JSONField(default=list, help_text="Per group breakdown"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="created_payrolls",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "teacher",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="payrolls",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="O'qituvchi",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "O'qituvchi oyligi",
+                "verbose_name_plural": "O'qituvchi oyliklari",
+                "ordering": ["-month", "teacher__full_name"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("teacher", "month"),
+                        name="unique_payroll_per_teacher_month",
+                    )
+                ],
+            },
+        ),
+    ]
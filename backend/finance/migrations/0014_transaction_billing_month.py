@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import Min
+from django.db.models.functions import TruncMonth
+
+
+def populate_billing_month(apps, schema_editor):
+    # Fees so far were stamped with the run time: the first fee of each
+    # enrollment and month takes the month, later duplicates stay empty.
+    Transaction = apps.get_model("finance", "Transaction")
+    firsts = (
+        Transaction.objects.filter(category="MONTHLY_FEE")
+        .order_by()
+        .values("student_group_id", month=TruncMonth("created_at"))
+        .annotate(first=Min("pk"))
+    )
+    batch = []
+    for row in firsts.iterator():
+        batch.append(Transaction(pk=row["first"], billing_month=row["month"].date()))
+        if len(batch) >= 1000:
+            Transaction.objects.bulk_update(batch, ["billing_month"])
+            batch = []
+    Transaction.objects.bulk_update(batch, ["billing_month"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("finance", "0013_teacherpayroll"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="billing_month",
+            field=models.DateField(
+                blank=True, editable=False, null=True, verbose_name="Hisob oyi"
+            ),
+        ),
+        migrations.RunPython(populate_billing_month, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 
 from users.models import User
-from core.models import StudentGroup, Group
+from core.models import Branch, StudentGroup, Group
 
 
 class GroupPrice(models.Model):
@@ -118,6 +118,11 @@ class Transaction(models.Model):
         related_name="created_transactions",
         verbose_name="Kim tomonidan yaratildi",
     )
+    # First day of the month a MONTHLY_FEE bills, set by create_monthly_fees.
+    # Unique per enrollment, so a month can never be billed twice.
+    billing_month = models.DateField(
+        null=True, blank=True, editable=False, verbose_name="Hisob oyi"
+    )
 
     class Meta:
         verbose_name = "Tranzaksiya"
@@ -128,9 +133,20 @@ class Transaction(models.Model):
             models.Index(fields=["category"]),
             models.Index(fields=["transaction_type"]),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["student_group", "billing_month"],
+                name="unique_monthly_fee_per_month",
+            )
+        ]
         ordering = ["-created_at"]
         ordering = ["-created_at"]
 
+    def save(self, *args, **kwargs):
+        # The balance ledger (finance.signals) is updated in the same DB transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         student = self.student_group.student.full_name
         group = self.student_group.group.name
@@ -166,3 +182,123 @@ class Transaction(models.Model):
             self.TransactionCategory.OTHER_FEE,
         ]:
             self.transaction_type = self.TransactionType.DEBIT
+
+
+class DailyFinanceRollup(models.Model):
+    """
+    Transaction totals per day and reporting key, maintained by finance.signals
+    in the same DB transaction as each Transaction write (see finance.rollup).
+    Reports over long ranges read these rows instead of scanning transactions.
+    """
+
+    date = models.DateField(verbose_name="Sana")
+    branch = models.ForeignKey(
+        Branch,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name="finance_rollups",
+        verbose_name="Filial",
+    )
+    category = models.CharField(
+        max_length=20,
+        choices=Transaction.TransactionCategory.choices,
+        verbose_name="Kategoriya",
+    )
+    transaction_type = models.CharField(
+        max_length=6,
+        choices=Transaction.TransactionType.choices,
+        verbose_name="Tranzaksiya turi",
+    )
+    payment_type = models.ForeignKey(
+        PaymentType,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name="finance_rollups",
+        verbose_name="To'lov turi",
+    )
+    receiver = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        related_name="finance_rollups",
+        verbose_name="Qabul qiluvchi",
+    )
+    amount = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name="Summa"
+    )
+    count = models.IntegerField(default=0, verbose_name="Soni")
+
+    class Meta:
+        verbose_name = "Kunlik moliya hisoboti"
+        verbose_name_plural = "Kunlik moliya hisobotlari"
+        indexes = [
+            models.Index(fields=["date", "category"]),
+            models.Index(fields=["branch", "date"]),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.date} {self.get_category_display()}: {self.amount} ({self.count})"
+        )
+
+
+class TeacherPayroll(models.Model):
+    """
+    Immutable snapshot of a teacher's pay for one month, computed by
+    finance.payroll. The rates and figures used are stored with the result,
+    so later changes to the teacher, groups or transactions do not alter it.
+    """
+
+    class PayType(models.TextChoices):
+        PERCENTAGE = "percentage", "Foiz"
+        SALARY = "salary", "Oylik"
+
+    teacher = models.ForeignKey(
+        User,
+        on_delete=models.PROTECT,
+        related_name="payrolls",
+        verbose_name="O'qituvchi",
+    )
+    month = models.DateField(help_text="First day of the paid month")
+    pay_type = models.CharField(max_length=10, choices=PayType.choices)
+    percentage = models.DecimalField(
+        max_digits=5, decimal_places=2, null=True, blank=True
+    )
+    salary = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    collected = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        help_text="PAYMENT credits collected on the teacher's groups",
+    )
+    lessons_planned = models.PositiveIntegerField(default=0)
+    lessons_held = models.PositiveIntegerField(default=0)
+    prorated = models.BooleanField(default=False)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Summa")
+    details = models.JSONField(default=list, help_text="Per group breakdown")
+    created_at = models.DateTimeField(auto_now_add=True)
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="created_payrolls",
+    )
+
+    class Meta:
+        verbose_name = "O'qituvchi oyligi"
+        verbose_name_plural = "O'qituvchi oyliklari"
+        ordering = ["-month", "teacher__full_name"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["teacher", "month"], name="unique_payroll_per_teacher_month"
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Hisoblangan oylikni o'zgartirib bo'lmaydi.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.teacher.full_name} - {self.month:%Y-%m}: {self.amount}"
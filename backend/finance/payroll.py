@@ -0,0 +1,208 @@
+"""
+Teacher payroll.
+
+Pay for a month is computed for every teacher at once with three grouped
+queries (teachers, collected payments per group, lessons per group):
+
+- percentage teachers get `percentage` % of the PAYMENT credits collected in
+  the month on their groups' enrollments;
+- salaried teachers get `salary`, optionally pro-rated by the share of
+  planned lessons (core.LessonOccurrence) that were held, i.e. have at least
+  one attendance mark. Lessons of an archived group after the day it was
+  archived are not counted.
+
+`close_month` stores the result as immutable `TeacherPayroll` snapshots.
+Groups are attributed to their current teacher.
+"""
+
+from datetime import datetime, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import Attendance, LessonOccurrence
+from users.models import User
+from .models import TeacherPayroll, Transaction
+
+
+ZERO = Decimal("0.00")
+CENT = Decimal("0.01")
+
+
+def month_window(month):
+    """
+    Returns (first_day, last_day, start, end) of the month containing `month`,
+    where [start, end) are aware datetimes, so created_at can use its index.
+    """
+    first_day = month.replace(day=1)
+    next_month = first_day + relativedelta(months=1)
+    tz = timezone.get_current_timezone()
+    start = datetime.combine(first_day, datetime.min.time(), tzinfo=tz)
+    end = datetime.combine(next_month, datetime.min.time(), tzinfo=tz)
+    return first_day, next_month - timedelta(days=1), start, end
+
+
+def _collected(teacher_ids, start, end):
+    return (
+        Transaction.objects.filter(
+            category=Transaction.TransactionCategory.PAYMENT,
+            transaction_type=Transaction.TransactionType.CREDIT,
+            created_at__gte=start,
+            created_at__lt=end,
+            student_group__group__teacher_id__in=teacher_ids,
+        )
+        .order_by()
+        .values(
+            teacher=F("student_group__group__teacher_id"),
+            group_id=F("student_group__group_id"),
+            group_name=F("student_group__group__name"),
+        )
+        .annotate(total=Sum("amount"))
+    )
+
+
+def _lessons(teacher_ids, first_day, last_day):
+    marked = Attendance.objects.filter(
+        student_group__group_id=OuterRef("group_id"), date=OuterRef("date")
+    )
+    return (
+        LessonOccurrence.objects.filter(
+            date__range=(first_day, last_day), group__teacher_id__in=teacher_ids
+        )
+        # Matches core.lessons.last_lesson_day, for rows stored before archiving
+        .filter(
+            Q(group__is_archived=False)
+            | Q(group__archived_at__isnull=True)
+            | Q(date__lte=TruncDate("group__archived_at"))
+        )
+        .order_by()
+        .values("group_id", teacher=F("group__teacher_id"), group_name=F("group__name"))
+        .annotate(planned=Count("pk"), held=Count("pk", filter=Q(Exists(marked))))
+    )
+
+
+def pay_for(teacher, collected, planned, held, prorate=False):
+    """
+    Returns (pay_type, amount) for one teacher from its month figures.
+    """
+    if teacher.percentage is not None:
+        amount = collected * teacher.percentage / 100
+        return TeacherPayroll.PayType.PERCENTAGE, amount.quantize(CENT, ROUND_HALF_UP)
+
+    amount = teacher.salary or ZERO
+    if prorate and planned:
+        amount = amount * held / planned
+    return TeacherPayroll.PayType.SALARY, amount.quantize(CENT, ROUND_HALF_UP)
+
+
+def compute_payroll(month, teacher_ids=None, prorate=False):
+    """
+    Returns unsaved TeacherPayroll objects for the month of `month`, one per
+    active teacher (or per id in `teacher_ids`).
+    """
+    first_day, last_day, start, end = month_window(month)
+
+    teachers = User.objects.filter(is_teacher=True)
+    if teacher_ids is not None:
+        teachers = teachers.filter(pk__in=teacher_ids)
+    else:
+        teachers = teachers.filter(is_active=True)
+    teachers = list(
+        teachers.order_by("full_name").only("full_name", "salary", "percentage")
+    )
+    ids = [teacher.pk for teacher in teachers]
+
+    groups = {}
+
+    def group_row(row):
+        key = (row["teacher"], row["group_id"])
+        if key not in groups:
+            groups[key] = {
+                "group_id": row["group_id"],
+                "group_name": row["group_name"],
+                "collected": ZERO,
+                "lessons_planned": 0,
+                "lessons_held": 0,
+            }
+        return groups[key]
+
+    for row in _collected(ids, start, end):
+        group_row(row)["collected"] = row["total"]
+    for row in _lessons(ids, first_day, last_day):
+        item = group_row(row)
+        item["lessons_planned"] = row["planned"]
+        item["lessons_held"] = row["held"]
+
+    by_teacher = {}
+    for (teacher_id, _), item in sorted(
+        groups.items(), key=lambda kv: kv[1]["group_name"]
+    ):
+        by_teacher.setdefault(teacher_id, []).append(item)
+
+    payrolls = []
+    for teacher in teachers:
+        details = by_teacher.get(teacher.pk, [])
+        collected = sum((item["collected"] for item in details), ZERO)
+        planned = sum(item["lessons_planned"] for item in details)
+        held = sum(item["lessons_held"] for item in details)
+        pay_type, amount = pay_for(teacher, collected, planned, held, prorate)
+        payrolls.append(
+            TeacherPayroll(
+                # The instance, so serializers read its name without a query
+                teacher=teacher,
+                month=first_day,
+                pay_type=pay_type,
+                percentage=teacher.percentage,
+                salary=teacher.salary,
+                collected=collected,
+                lessons_planned=planned,
+                lessons_held=held,
+                prorated=prorate and pay_type == TeacherPayroll.PayType.SALARY,
+                amount=amount,
+                details=[
+                    {**item, "collected": str(item["collected"].quantize(CENT))}
+                    for item in details
+                ],
+            )
+        )
+    return payrolls
+
+
+def _closed_teachers(month):
+    return set(
+        TeacherPayroll.objects.filter(month=month).values_list("teacher_id", flat=True)
+    )
+
+
+def close_month(month, teacher_ids=None, prorate=False, created_by=None):
+    """
+    Stores the payroll of the month for every teacher that has no snapshot
+    for it yet. Existing snapshots are never recomputed, including those a
+    concurrent close of the same month stored first.
+    Returns (created, skipped) lists of TeacherPayroll objects.
+    """
+    month = month.replace(day=1)
+    payrolls = compute_payroll(month, teacher_ids=teacher_ids, prorate=prorate)
+    for payroll in payrolls:
+        payroll.created_by = created_by
+
+    closed = _closed_teachers(month)
+    while True:
+        created = [p for p in payrolls if p.teacher_id not in closed]
+        try:
+            with transaction.atomic():
+                TeacherPayroll.objects.bulk_create(created)
+            break
+        except IntegrityError:
+            # Another close committed some of these teachers after they were
+            # read (the unique constraint caught it): keep its snapshots
+            newly_closed = _closed_teachers(month) - closed
+            if not newly_closed:
+                raise
+            closed |= newly_closed
+    skipped = [p for p in payrolls if p.teacher_id in closed]
+    return created, skipped
@@ -0,0 +1,96 @@
+"""
+Batch price resolution for groups.
+
+`Group.current_price` / `Group.get_price_on` answer one question with one
+query. List views and billing need the answer for many groups at once, so this
+module offers two tools:
+
+- `PriceTimeline`: loads the GroupPrice history of many groups in one query
+  and answers "price of group G on date D" in memory with bisect.
+- `current_price_subquery` / `annotate_current_price`: a Subquery annotation
+  for querysets, so a list of N groups costs a constant number of queries.
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import GroupPrice
+
+
+class PriceTimeline:
+    """
+    In-memory, per-group sorted price history.
+    """
+
+    def __init__(self, rows=()):
+        # group_id -> ([start_date, ...], [price, ...]) both sorted by start_date
+        self._dates = defaultdict(list)
+        self._prices = defaultdict(list)
+        for group_id, start_date, price in rows:
+            self._dates[group_id].append(start_date)
+            self._prices[group_id].append(price)
+
+    @classmethod
+    def for_groups(cls, group_ids, until=None):
+        """
+        Loads the timeline of the given groups with a single query.
+        `until` optionally drops prices that start after that date.
+        """
+        queryset = GroupPrice.objects.filter(group_id__in=group_ids)
+        if until is not None:
+            queryset = queryset.filter(start_date__lte=until)
+        rows = queryset.order_by("group_id", "start_date").values_list(
+            "group_id", "start_date", "price"
+        )
+        return cls(rows)
+
+    def price_on(self, group_id, on_date, default=None):
+        """
+        Returns the price of the group active on `on_date`, i.e. the latest
+        GroupPrice with start_date <= on_date.
+        """
+        dates = self._dates.get(group_id)
+        if not dates:
+            return default
+        index = bisect_right(dates, on_date)
+        if index == 0:
+            return default
+        return self._prices[group_id][index - 1]
+
+    def current_price(self, group_id, default=None):
+        return self.price_on(group_id, timezone.now().date(), default)
+
+
+def current_price_subquery(group_ref="pk", on_date=None):
+    """
+    Subquery selecting the price active on `on_date` (default: today) for the
+    group referenced by `group_ref` in the outer query.
+    """
+    if on_date is None:
+        on_date = timezone.now().date()
+    return Subquery(
+        GroupPrice.objects.filter(group=OuterRef(group_ref), start_date__lte=on_date)
+        .order_by("-start_date")
+        .values("price")[:1]
+    )
+
+
+def annotate_current_price(queryset, on_date=None):
+    """
+    Annotates a Group queryset with `current_price`.
+    The model property returns the annotated value instead of querying again.
+    """
+    return queryset.annotate(current_price=current_price_subquery("pk", on_date))
+
+
+def annotate_group_price(queryset, on_date=None):
+    """
+    Annotates a StudentGroup queryset with `group_current_price`, used by
+    `StudentGroup.effective_price` when the enrollment has no custom price.
+    """
+    return queryset.annotate(
+        group_current_price=current_price_subquery("group_id", on_date)
+    )
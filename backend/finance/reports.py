@@ -0,0 +1,170 @@
+"""
+Aggregated finance reports.
+
+Transactions are grouped by any combination of dimensions (period, branch,
+group, teacher, category, payment type, receiver...) and credits/debits are
+summed by the database in one grouped query, so no transaction rows are
+loaded into Python.
+"""
+
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.db.models import Count, DateField, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+
+from .models import DailyFinanceRollup, Transaction
+
+
+ZERO = Decimal("0.00")
+
+
+class Dimension(NamedTuple):
+    key: object
+    label: object = None
+    choices: dict = None
+
+
+DIMENSIONS = {
+    "day": Dimension(TruncDate("created_at")),
+    "month": Dimension(TruncMonth("created_at", output_field=DateField())),
+    "branch": Dimension(
+        F("student_group__group__branch_id"),
+        F("student_group__group__branch__name"),
+    ),
+    "group": Dimension(F("student_group__group_id"), F("student_group__group__name")),
+    "teacher": Dimension(
+        F("student_group__group__teacher_id"),
+        F("student_group__group__teacher__full_name"),
+    ),
+    "category": Dimension(
+        F("category"), choices=dict(Transaction.TransactionCategory.choices)
+    ),
+    "transaction_type": Dimension(
+        F("transaction_type"), choices=dict(Transaction.TransactionType.choices)
+    ),
+    "payment_type": Dimension(F("payment_type_id"), F("payment_type__name")),
+    "receiver": Dimension(F("receiver_id"), F("receiver__full_name")),
+}
+
+# Dimensions kept by DailyFinanceRollup
+ROLLUP_DIMENSIONS = {
+    "day": Dimension(F("date")),
+    "month": Dimension(TruncMonth("date", output_field=DateField())),
+    "branch": Dimension(F("branch_id"), F("branch__name")),
+    "category": DIMENSIONS["category"],
+    "transaction_type": DIMENSIONS["transaction_type"],
+    "payment_type": DIMENSIONS["payment_type"],
+    "receiver": DIMENSIONS["receiver"],
+}
+
+PERIODS = {"day", "month"}
+
+
+def parse_group_by(value, dimensions=DIMENSIONS):
+    """
+    Parses "month,branch" into a list of dimension names.
+    Raises ValueError with a user-facing message on bad input.
+    """
+    names = [name.strip() for name in (value or "").split(",") if name.strip()]
+    unknown = [name for name in names if name not in dimensions]
+    if unknown:
+        raise ValueError(
+            "Noma'lum guruhlash: {}. Mumkin: {}".format(
+                ", ".join(unknown), ", ".join(dimensions)
+            )
+        )
+    if len(PERIODS.intersection(names)) > 1:
+        raise ValueError("Faqat bitta davr tanlanishi mumkin: day yoki month.")
+    # Keep the order given by the client, without duplicates
+    return list(dict.fromkeys(names))
+
+
+def _money(expression):
+    return Coalesce(
+        expression,
+        Value(ZERO, output_field=DecimalField(max_digits=14, decimal_places=2)),
+    )
+
+
+def totals_annotations(
+    amount="amount", transaction_type="transaction_type", count=None
+):
+    """
+    SUM(credits), SUM(debits) and the row count as aggregate expressions.
+    `count` is the expression counted, or a field to sum for pre-counted rows.
+    """
+    return {
+        "credits": _money(Sum(amount, filter=Q(**{transaction_type: "CREDIT"}))),
+        "debits": _money(Sum(amount, filter=Q(**{transaction_type: "DEBIT"}))),
+        "count": Count("pk") if count is None else Coalesce(Sum(count), 0),
+    }
+
+
+def grouped_rows(queryset, group_by, dimensions=DIMENSIONS, **totals):
+    """
+    Runs the grouped query and returns shaped rows, ordered by the dimensions.
+    """
+    columns = {}
+    for name in group_by:
+        dimension = dimensions[name]
+        columns[f"{name}_key"] = dimension.key
+        if dimension.label is not None:
+            columns[f"{name}_label"] = dimension.label
+
+    aggregates = totals_annotations(**totals)
+    if not group_by:
+        rows = [queryset.aggregate(**aggregates)]
+    else:
+        rows = (
+            queryset.order_by()
+            .values(**columns)
+            .annotate(**aggregates)
+            .order_by(*[f"{name}_key" for name in group_by])
+        )
+    return [_shape(row, group_by, dimensions) for row in rows]
+
+
+def _shape(row, group_by, dimensions):
+    item = {}
+    for name in group_by:
+        dimension = dimensions[name]
+        key = row[f"{name}_key"]
+        if name in PERIODS:
+            item[name] = key.isoformat() if key else None
+        elif dimension.choices is not None:
+            item[name] = {"code": key, "name": dimension.choices.get(key, key)}
+        else:
+            item[name] = {"id": key, "name": row.get(f"{name}_label")}
+    credits, debits = row["credits"], row["debits"]
+    item.update(
+        credits=credits, debits=debits, net=credits - debits, count=row["count"]
+    )
+    return item
+
+
+def summarize(rows):
+    credits = sum((row["credits"] for row in rows), ZERO)
+    debits = sum((row["debits"] for row in rows), ZERO)
+    return {
+        "credits": credits,
+        "debits": debits,
+        "net": credits - debits,
+        "count": sum(row["count"] for row in rows),
+    }
+
+
+def build_report(queryset, group_by):
+    """
+    Groups the (already filtered) Transaction queryset by `group_by`.
+    """
+    rows = grouped_rows(queryset, group_by)
+    return {"group_by": group_by, "rows": rows, "totals": summarize(rows)}
+
+
+def build_rollup_report(queryset, group_by):
+    """
+    Same as `build_report`, from a filtered DailyFinanceRollup queryset.
+    """
+    rows = grouped_rows(queryset, group_by, dimensions=ROLLUP_DIMENSIONS, count="count")
+    return {"group_by": group_by, "rows": rows, "totals": summarize(rows)}
@@ -0,0 +1,243 @@
+"""
+Daily finance rollup.
+
+`DailyFinanceRollup` keeps the amount and number of transactions per
+(date, branch, category, transaction_type, payment_type, receiver), so
+reports over months or years read a few hundred rows instead of scanning
+`finance_transaction`.
+
+Rows are updated incrementally (see finance.signals) inside the same database
+transaction as the Transaction write. Writes that bypass model signals
+(`bulk_create`, `QuerySet.update`) must call `record_transactions` or
+`rebuild_rollup`.
+
+Two writers creating the same key at the same time may leave two rows for it.
+Readers always SUM over rows, so the totals stay correct; `rebuild_rollup`
+merges such rows again. The rollup uses the branch of the transaction's group
+at write time, so moving a group to another branch needs a rebuild.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import StudentGroup
+from .models import DailyFinanceRollup, Transaction
+
+
+ZERO = Decimal("0.00")
+
+KEY_FIELDS = (
+    "date",
+    "branch_id",
+    "category",
+    "transaction_type",
+    "payment_type_id",
+    "receiver_id",
+)
+
+# Transaction columns needed to build an entry, as read by `values()`
+SOURCE_FIELDS = (
+    "created_at",
+    "student_group_id",
+    "student_group__group__branch_id",
+    "category",
+    "transaction_type",
+    "payment_type_id",
+    "receiver_id",
+    "amount",
+)
+
+
+def entry_for(row):
+    """
+    Returns the (key, amount) contribution of one transaction, from a dict
+    with SOURCE_FIELDS.
+    """
+    key = (
+        timezone.localdate(row["created_at"]),
+        row["student_group__group__branch_id"],
+        row["category"],
+        row["transaction_type"],
+        row["payment_type_id"],
+        row["receiver_id"],
+    )
+    return key, Decimal(row["amount"])
+
+
+def entry_for_instance(instance, branch_id=None):
+    """
+    Entry of a Transaction instance; the branch is looked up when not given.
+    """
+    if branch_id is None:
+        branch_id = branch_of(instance.student_group_id)
+    return entry_for(
+        {
+            "created_at": instance.created_at,
+            "student_group__group__branch_id": branch_id,
+            "category": instance.category,
+            "transaction_type": instance.transaction_type,
+            "payment_type_id": instance.payment_type_id,
+            "receiver_id": instance.receiver_id,
+            "amount": instance.amount,
+        }
+    )
+
+
+def branch_of(student_group_id):
+    return (
+        StudentGroup.objects.filter(pk=student_group_id)
+        .values_list("group__branch_id", flat=True)
+        .first()
+    )
+
+
+def apply_delta(key, amount, count):
+    """
+    Adds amount/count to one row of the key, creating it when missing.
+    The UPDATE uses F() expressions so concurrent writers never lose an update.
+    """
+    if not amount and not count:
+        return
+
+    lookup = dict(zip(KEY_FIELDS, key))
+    one_row = DailyFinanceRollup.objects.filter(**lookup).values("pk")[:1]
+    updated = DailyFinanceRollup.objects.filter(pk=Subquery(one_row)).update(
+        amount=F("amount") + amount, count=F("count") + count
+    )
+    if not updated:
+        DailyFinanceRollup.objects.create(**lookup, amount=amount, count=count)
+    elif count < 0:
+        # Drop keys whose last transaction was removed
+        DailyFinanceRollup.objects.filter(**lookup, count=0, amount=0).delete()
+
+
+def record_change(previous, current):
+    """
+    Applies the difference between two rollup entries.
+    Each entry is a (key, amount) pair from `entry_for` or None.
+    """
+    deltas = {}
+    for entry, sign in ((previous, -1), (current, 1)):
+        if entry is None:
+            continue
+        key, amount = entry
+        old_amount, old_count = deltas.get(key, (ZERO, 0))
+        deltas[key] = (old_amount + sign * amount, old_count + sign)
+
+    for key, (amount, count) in deltas.items():
+        apply_delta(key, amount, count)
+
+
+def record_transactions(transactions):
+    """
+    Adds newly bulk-created Transaction objects to the rollup, one UPDATE (or
+    INSERT) per distinct key.
+    """
+    branches = dict(
+        StudentGroup.objects.filter(
+            pk__in={t.student_group_id for t in transactions}
+        ).values_list("pk", "group__branch_id")
+    )
+    deltas = defaultdict(lambda: [ZERO, 0])
+    for instance in transactions:
+        key, amount = entry_for_instance(instance, branches[instance.student_group_id])
+        deltas[key][0] += amount
+        deltas[key][1] += 1
+
+    for key, (amount, count) in deltas.items():
+        apply_delta(key, amount, count)
+
+
+def computed_totals(start=None, end=None):
+    """
+    Returns {key: (amount, count)} computed from Transaction rows with one
+    grouped query, optionally limited to local dates [start, end].
+    """
+    queryset = Transaction.objects.all()
+    if start is not None:
+        queryset = queryset.filter(created_at__date__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created_at__date__lte=end)
+
+    rows = (
+        queryset.order_by()
+        .values(
+            "category",
+            "transaction_type",
+            "payment_type_id",
+            "receiver_id",
+            day=TruncDate("created_at"),
+            branch=F("student_group__group__branch_id"),
+        )
+        .annotate(total=Sum("amount"), rows=Count("pk"))
+    )
+    return {
+        (
+            row["day"],
+            row["branch"],
+            row["category"],
+            row["transaction_type"],
+            row["payment_type_id"],
+            row["receiver_id"],
+        ): (row["total"], row["rows"])
+        for row in rows
+    }
+
+
+def rollup_rows(start=None, end=None):
+    queryset = DailyFinanceRollup.objects.all()
+    if start is not None:
+        queryset = queryset.filter(date__gte=start)
+    if end is not None:
+        queryset = queryset.filter(date__lte=end)
+    return queryset
+
+
+def rebuild_rollup(start=None, end=None, batch_size=1000, dry_run=False):
+    """
+    Reconciles the rollup with the Transaction table for local dates
+    [start, end] (the whole table when omitted).
+
+    Returns the number of keys that were missing, wrong, duplicated or stale.
+    When any key drifted, the rollup rows of the range are replaced.
+    """
+    expected = computed_totals(start, end)
+
+    stored = {}
+    duplicated = set()
+    for row in rollup_rows(start, end).values_list(*KEY_FIELDS, "amount", "count"):
+        key, amount, count = row[:-2], row[-2], row[-1]
+        if key in stored:
+            duplicated.add(key)
+            old_amount, old_count = stored[key]
+            amount, count = old_amount + amount, old_count + count
+        stored[key] = (amount, count)
+
+    drifted = duplicated.union(
+        key
+        for key in expected.keys() | stored.keys()
+        if expected.get(key) != stored.get(key)
+    )
+    # Keys emptied by deletes are dropped on rebuild, they are not drift
+    drifted -= {
+        key for key in drifted if key not in expected and stored[key] == (ZERO, 0)
+    }
+
+    if drifted and not dry_run:
+        with transaction.atomic():
+            rollup_rows(start, end).delete()
+            DailyFinanceRollup.objects.bulk_create(
+                [
+                    DailyFinanceRollup(
+                        **dict(zip(KEY_FIELDS, key)), amount=amount, count=count
+                    )
+                    for key, (amount, count) in expected.items()
+                ],
+                batch_size=batch_size,
+            )
+    return len(drifted)
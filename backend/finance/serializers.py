@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import GroupPrice, PaymentType, Transaction
+from .models import GroupPrice, PaymentType, TeacherPayroll, Transaction
 from core.models import Group, StudentGroup
 from users.models import User
 from django.core.exceptions import ValidationError as DjangoValidationError
@@ -209,3 +209,46 @@ class TransactionDetailSerializer(serializers.ModelSerializer):
             "created_by_id",
             "created_by_name",
         ]
+
+
+class TeacherPayrollSerializer(serializers.ModelSerializer):
+    """
+    Read-only representation of a payroll snapshot (or of a preview).
+    """
+
+    teacher_name = serializers.CharField(source="teacher.full_name", read_only=True)
+    month = serializers.DateField(format="%Y-%m")
+
+    class Meta:
+        model = TeacherPayroll
+        fields = [
+            "id",
+            "teacher",
+            "teacher_name",
+            "month",
+            "pay_type",
+            "percentage",
+            "salary",
+            "collected",
+            "lessons_planned",
+            "lessons_held",
+            "prorated",
+            "amount",
+            "details",
+            "created_at",
+            "created_by",
+        ]
+        read_only_fields = fields
+
+
+class PayrollMonthSerializer(serializers.Serializer):
+    """
+    Validates the month (YYYY-MM) and options of payroll preview/close.
+    """
+
+    month = serializers.DateField(input_formats=["%Y-%m", "%Y-%m-%d"])
+    prorate = serializers.BooleanField(default=False)
+    teacher = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate_month(self, value):
+        return value.replace(day=1)
@@ -0,0 +1,93 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from core.models import StudentGroup
+from . import ledger, rollup
+from .models import Transaction
+
+
+def _ledger_entry(instance):
+    return (instance.student_group_id, instance.transaction_type, instance.amount)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_previous_entry(sender, instance, raw=False, **kwargs):
+    # Keep the stored version so an update can be applied as a delta.
+    instance._ledger_previous = None
+    instance._rollup_previous = None
+    if instance.pk and not raw:
+        row = (
+            Transaction.objects.filter(pk=instance.pk)
+            .values(*rollup.SOURCE_FIELDS)
+            .first()
+        )
+        if row is not None:
+            instance._ledger_previous = (
+                row["student_group_id"],
+                row["transaction_type"],
+                row["amount"],
+            )
+            instance._rollup_previous = rollup.entry_for(row)
+            instance._rollup_branch = (
+                row["student_group_id"],
+                row["student_group__group__branch_id"],
+            )
+
+
+@receiver(post_save, sender=Transaction)
+def update_balance_on_save(sender, instance, created, raw=False, **kwargs):
+    # Fixture loading (raw) is reconciled with `rebuild_balances` instead.
+    if raw:
+        return
+    previous = None if created else getattr(instance, "_ledger_previous", None)
+    ledger.record_change(previous, _ledger_entry(instance))
+
+
+@receiver(post_save, sender=Transaction)
+def update_rollup_on_save(sender, instance, created, raw=False, **kwargs):
+    # Fixture loading (raw) is reconciled with `rebuild_rollup` instead.
+    if raw:
+        return
+    previous = None if created else getattr(instance, "_rollup_previous", None)
+    # Reuse the branch read in pre_save when the enrollment did not change
+    branch_id = None
+    if previous is not None:
+        student_group_id, branch_id = instance._rollup_branch
+        if student_group_id != instance.student_group_id:
+            branch_id = None
+    rollup.record_change(previous, rollup.entry_for_instance(instance, branch_id))
+
+
+@receiver(post_delete, sender=Transaction)
+def update_balance_on_delete(sender, instance, **kwargs):
+    ledger.record_change(_ledger_entry(instance), None)
+
+
+@receiver(post_delete, sender=Transaction)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    rollup.record_change(rollup.entry_for_instance(instance), None)
+
+
+@receiver(pre_save, sender=StudentGroup)
+def remember_previous_student(
+    sender, instance, raw=False, update_fields=None, **kwargs
+):
+    # Keep the stored student so a reassignment can move the enrollment's totals.
+    instance._ledger_student_id = None
+    if instance._state.adding or raw:
+        return
+    if update_fields is not None and not {"student", "student_id"} & set(update_fields):
+        return
+    instance._ledger_student_id = (
+        StudentGroup.objects.filter(pk=instance.pk)
+        .values_list("student_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=StudentGroup)
+def move_balance_on_reassign(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, "_ledger_student_id", None)
+    if created or raw or previous is None or previous == instance.student_id:
+        return
+    ledger.move_enrollment(instance.pk, previous, instance.student_id)
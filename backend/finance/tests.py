@@ -1,3 +1,623 @@
+import csv
+import zipfile
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.core.management import call_command
+from django.db.models import Count, Sum
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.admin import StudentGroupResource
+from core.models import Attendance, Branch, Group, Student, StudentGroup
+from users.models import User
+from .export import COLUMNS as EXPORT_COLUMNS
+from .ledger import rebuild_balances
+from .management.commands.create_monthly_fees import Command
+from .models import GroupPrice, TeacherPayroll, Transaction
+from .payroll import close_month, compute_payroll
+from .pricing import PriceTimeline, annotate_current_price
+
+
+class LedgerTests(TestCase):
+    """
+    The ledger columns follow every transaction write, survive ordinary
+    saves of stale instances and move with a reassigned enrollment.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user(998900000050, "T", is_teacher=True)
+        cls.branch = Branch.objects.create(name="Main", address="-")
+        cls.group = Group.objects.create(
+            name="Group",
+            teacher=cls.teacher,
+            branch=cls.branch,
+            start_date=date(2025, 1, 6),
+            end_date=date(2025, 6, 30),
+            course_start_time=time(9),
+            course_end_time=time(10),
+            weekdays="135",
+            color="#000000",
+            text_color="#ffffff",
+        )
+
+    def setUp(self):
+        self.student = self._student(998930000101)
+        self.enrollment = StudentGroup.objects.create(
+            student=self.student, group=self.group, joined_at=date(2025, 1, 6)
+        )
+
+    def _student(self, phone):
+        return Student.objects.create(
+            full_name="Student", phone_number=phone, branch=self.branch
+        )
+
+    def _transaction(self, transaction_type, amount):
+        return Transaction.objects.create(
+            student_group=self.enrollment,
+            transaction_type=transaction_type,
+            category="MONTHLY_FEE" if transaction_type == "DEBIT" else "PAYMENT",
+            amount=amount,
+        )
+
+    def assertTotals(self, obj, credits, debits):
+        obj.refresh_from_db()
+        self.assertEqual(
+            (obj.total_credits, obj.total_debits, obj.balance),
+            (Decimal(credits), Decimal(debits), Decimal(credits) - Decimal(debits)),
+        )
+
+    def assertNoDrift(self):
+        self.assertEqual(rebuild_balances(dry_run=True), (0, 0))
+
+    def test_create_update_delete(self):
+        fee = self._transaction("DEBIT", 500000)
+        payment = self._transaction("CREDIT", 300000)
+        self.assertTotals(self.enrollment, 300000, 500000)
+        self.assertTotals(self.student, 300000, 500000)
+
+        payment.amount = 450000
+        payment.save()
+        self.assertTotals(self.enrollment, 450000, 500000)
+
+        fee.delete()
+        self.assertTotals(self.enrollment, 450000, 0)
+        self.assertTotals(self.student, 450000, 0)
+        self.assertNoDrift()
+
+    def test_saving_stale_instances_keeps_totals(self):
+        enrollment = StudentGroup.objects.get(pk=self.enrollment.pk)
+        student = Student.objects.get(pk=self.student.pk)
+        self._transaction("DEBIT", 500000)
+
+        enrollment.is_archived = True
+        enrollment.save()
+        student.comment = "Izoh"
+        student.save()
+
+        self.assertTotals(self.enrollment, 0, 500000)
+        self.assertTotals(self.student, 0, 500000)
+        self.assertTrue(StudentGroup.objects.get(pk=self.enrollment.pk).is_archived)
+        self.assertNoDrift()
+
+    def test_reassignment_moves_totals(self):
+        other = self._student(998930000102)
+        StudentGroup.objects.create(
+            student=other,
+            group=Group.objects.create(
+                name="Other",
+                teacher=self.teacher,
+                branch=self.branch,
+                start_date=date(2025, 1, 6),
+                end_date=date(2025, 6, 30),
+                course_start_time=time(11),
+                course_end_time=time(12),
+                weekdays="135",
+                color="#000000",
+                text_color="#ffffff",
+            ),
+            joined_at=date(2025, 1, 6),
+        )
+        self._transaction("DEBIT", 500000)
+        self._transaction("CREDIT", 200000)
+
+        enrollment = StudentGroup.objects.get(pk=self.enrollment.pk)
+        enrollment.student = other
+        enrollment.save()
+
+        self.assertTotals(self.student, 0, 0)
+        self.assertTotals(other, 200000, 500000)
+        self.assertTotals(self.enrollment, 200000, 500000)
+        self.assertNoDrift()
+
+    def test_import_does_not_write_totals(self):
+        self._transaction("DEBIT", 500000)
+        resource = StudentGroupResource()
+        dataset = resource.export(StudentGroup.objects.filter(pk=self.enrollment.pk))
+        for header in ("total_credits", "total_debits", "balance"):
+            del dataset[header]
+            dataset.append_col([0] * dataset.height, header=header)
+
+        result = resource.import_data(dataset, raise_errors=True)
+        self.assertFalse(result.has_errors())
+        self.assertTotals(self.enrollment, 0, 500000)
+        self.assertNoDrift()
+
+
+class CreateMonthlyFeesTests(TestCase):
+    """
+    The monthly fee run bills each due enrollment once per month, pro-rates
+    students who joined during the month and applies the fees to the ledger
+    as deltas.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create_user(998900000060, "T", is_teacher=True)
+        branch = Branch.objects.create(name="Main", address="-")
+        cls.group = Group.objects.create(
+            name="Group",
+            teacher=teacher,
+            branch=branch,
+            start_date=date(2025, 1, 1),
+            end_date=date(2025, 12, 31),
+            course_start_time=time(9),
+            course_end_time=time(10),
+            weekdays="135",
+            color="#000000",
+            text_color="#ffffff",
+        )
+        GroupPrice.objects.create(
+            group=cls.group, price=600000, start_date=date(2025, 1, 1)
+        )
+        cls.enrollments = {}
+        for phone, joined_at in (
+            (998930000201, date(2025, 1, 1)),
+            (998930000202, date(2025, 1, 10)),
+            (998930000203, date(2025, 1, 25)),
+        ):
+            student = Student.objects.create(
+                full_name="Student", phone_number=phone, branch=branch
+            )
+            cls.enrollments[joined_at.day] = StudentGroup.objects.create(
+                student=student, group=cls.group, joined_at=joined_at
+            )
+
+    def _run(self, run_date, *args):
+        call_command(
+            "create_monthly_fees", "--date", run_date, *args, stdout=StringIO()
+        )
+
+    def _fees(self):
+        fees = Transaction.objects.filter(category="MONTHLY_FEE")
+        return {
+            row["student_group_id"]: (row["count"], row["total"])
+            for row in fees.values("student_group_id").annotate(
+                count=Count("pk"), total=Sum("amount")
+            )
+        }
+
+    def test_fees_are_prorated_and_created_once(self):
+        expected = {
+            self.enrollments[1].pk: (1, Decimal("600000")),
+            self.enrollments[10].pk: (1, Decimal("426000")),
+        }
+        self._run("2025-01-20")
+        self.assertEqual(self._fees(), expected)
+        self._run("2025-01-20")
+        self.assertEqual(self._fees(), expected)
+
+        # Joined on the 10th: 22 of 31 days. Joined on the 25th: billed from
+        # the 29th, when the trial ends.
+        self._run("2025-01-31")
+        expected[self.enrollments[25].pk] = (1, Decimal("135000"))
+        self.assertEqual(self._fees(), expected)
+
+        # The next month is billed once more, whatever the run dates
+        self._run("2025-02-05")
+        self._run("2025-02-28")
+        self._run("2025-01-31")
+        self.assertEqual(
+            {pk: count for pk, (count, _) in self._fees().items()},
+            {enrollment.pk: 2 for enrollment in self.enrollments.values()},
+        )
+
+    def test_concurrent_run_does_not_bill_twice(self):
+        self._run("2025-01-31")
+        billed = Command._billed
+
+        def stale(command, billing_month, enrollment_ids=None):
+            # What a run that started before the first one committed saw
+            if enrollment_ids is None:
+                return set()
+            return billed(command, billing_month, enrollment_ids)
+
+        with mock.patch.object(Command, "_billed", stale):
+            self._run("2025-01-31", "--batch-size", "2")
+        self.assertEqual(
+            {pk: count for pk, (count, _) in self._fees().items()},
+            {enrollment.pk: 1 for enrollment in self.enrollments.values()},
+        )
+        self.assertEqual(rebuild_balances(dry_run=True), (0, 0))
+
+    def test_dry_run_writes_nothing(self):
+        self._run("2025-01-20", "--dry-run")
+        self.assertEqual(self._fees(), {})
+
+    def test_fees_are_applied_to_the_ledger(self):
+        enrollment = self.enrollments[1]
+        Transaction.objects.create(
+            student_group=enrollment,
+            transaction_type="CREDIT",
+            category="PAYMENT",
+            amount=200000,
+        )
+        self._run("2025-01-20", "--batch-size", "1")
+
+        enrollment.refresh_from_db()
+        enrollment.student.refresh_from_db()
+        self.assertEqual(enrollment.balance, Decimal("-400000"))
+        self.assertEqual(enrollment.student.balance, Decimal("-400000"))
+        self.assertEqual(
+            StudentGroup.objects.get(pk=self.enrollments[10].pk).balance,
+            Decimal("-426000"),
+        )
+        self.assertEqual(rebuild_balances(dry_run=True), (0, 0))
+
+
+class PayrollTests(TestCase):
+    """
+    Percentage teachers are paid from the month's collected payments,
+    salaried ones optionally pro-rated by held lessons, and a closed month is
+    never recomputed.
+    """
+
+    MONTH = date(2025, 1, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.by_percentage = User.objects.create_user(
+            998900000070, "P", is_teacher=True, percentage=20
+        )
+        cls.salaried = User.objects.create_user(
+            998900000071, "S", is_teacher=True, salary=3000000
+        )
+        branch = Branch.objects.create(name="Main", address="-")
+        cls.enrollments = {}
+        for teacher in (cls.by_percentage, cls.salaried):
+            group = Group.objects.create(
+                name=teacher.full_name,
+                teacher=teacher,
+                branch=branch,
+                start_date=date(2025, 1, 1),
+                end_date=date(2025, 6, 30),
+                course_start_time=time(9),
+                course_end_time=time(10),
+                weekdays="135",
+                color="#000000",
+                text_color="#ffffff",
+            )
+            student = Student.objects.create(
+                full_name="Student", phone_number=teacher.phone_number, branch=branch
+            )
+            cls.enrollments[teacher.pk] = StudentGroup.objects.create(
+                student=student, group=group, joined_at=date(2025, 1, 1)
+            )
+
+        payment = Transaction.objects.create(
+            student_group=cls.enrollments[cls.by_percentage.pk],
+            transaction_type="CREDIT",
+            category="PAYMENT",
+            amount=500000,
+        )
+        Transaction.objects.filter(pk=payment.pk).update(
+            created_at=timezone.make_aware(datetime(2025, 1, 10, 12))
+        )
+
+        # 14 lessons in January (Mon, Wed, Fri), the first 7 of them marked
+        cls.salaried_group = cls.enrollments[cls.salaried.pk].group
+        for day in (1, 3, 6, 8, 10, 13, 15):
+            Attendance.objects.create(
+                student_group=cls.enrollments[cls.salaried.pk],
+                date=date(2025, 1, day),
+                is_present=True,
+            )
+
+    def _pay(self, prorate=False):
+        return {
+            payroll.teacher_id: payroll
+            for payroll in compute_payroll(self.MONTH, prorate=prorate)
+        }
+
+    def test_percentage(self):
+        payroll = self._pay()[self.by_percentage.pk]
+        self.assertEqual(payroll.pay_type, TeacherPayroll.PayType.PERCENTAGE)
+        self.assertEqual(payroll.collected, Decimal("500000"))
+        self.assertEqual(payroll.amount, Decimal("100000.00"))
+
+    def test_salary(self):
+        payroll = self._pay()[self.salaried.pk]
+        self.assertEqual(payroll.pay_type, TeacherPayroll.PayType.SALARY)
+        self.assertEqual((payroll.lessons_planned, payroll.lessons_held), (14, 7))
+        self.assertEqual(payroll.amount, Decimal("3000000.00"))
+        self.assertFalse(payroll.prorated)
+
+    def test_prorated_salary(self):
+        payroll = self._pay(prorate=True)[self.salaried.pk]
+        self.assertEqual(payroll.amount, Decimal("1500000.00"))
+        self.assertTrue(payroll.prorated)
+
+    def test_archived_group_lessons_stop_at_archive_date(self):
+        # Lessons stored before the group was archived are not counted either
+        Group.objects.filter(pk=self.salaried_group.pk).update(
+            is_archived=True,
+            archived_at=timezone.make_aware(datetime(2025, 1, 15, 18)),
+        )
+        payroll = self._pay(prorate=True)[self.salaried.pk]
+        self.assertEqual((payroll.lessons_planned, payroll.lessons_held), (7, 7))
+        self.assertEqual(payroll.amount, Decimal("3000000.00"))
+
+    def test_close_month_is_idempotent(self):
+        created, skipped = close_month(self.MONTH, prorate=True)
+        self.assertEqual((len(created), len(skipped)), (2, 0))
+
+        User.objects.filter(pk=self.salaried.pk).update(salary=4000000)
+        created, skipped = close_month(self.MONTH)
+        self.assertEqual((len(created), len(skipped)), (0, 2))
+        self.assertEqual(TeacherPayroll.objects.count(), 2)
+        self.assertEqual(
+            TeacherPayroll.objects.get(teacher=self.salaried).amount,
+            Decimal("1500000.00"),
+        )
+
+    def test_concurrent_close_keeps_the_first_snapshot(self):
+        # Another close stores the salaried teacher after this one has read
+        # which teachers are closed
+        close_month(self.MONTH, teacher_ids=[self.salaried.pk], prorate=True)
+        with mock.patch(
+            "finance.payroll._closed_teachers",
+            side_effect=[set(), {self.salaried.pk}],
+        ):
+            created, skipped = close_month(self.MONTH)
+
+        self.assertEqual([p.teacher_id for p in created], [self.by_percentage.pk])
+        self.assertEqual([p.teacher_id for p in skipped], [self.salaried.pk])
+        self.assertEqual(TeacherPayroll.objects.count(), 2)
+        self.assertEqual(
+            TeacherPayroll.objects.get(teacher=self.salaried).amount,
+            Decimal("1500000.00"),
+        )
+
+
+class ReportTests(TestCase):
+    """
+    The report rejects invalid filters on both sources instead of dropping
+    them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ceo = User.objects.create_user(998900000080, "CEO", is_ceo=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.ceo)
+
+    def _report(self, **params):
+        return self.client.get(
+            "/api/finance/transactions/report/", {"group_by": "month", **params}
+        )
+
+    def test_invalid_filter_is_rejected(self):
+        for source in ("auto", "rollup", "transactions"):
+            response = self._report(source=source, start_date="2025-13-01")
+            self.assertEqual(response.status_code, 400, source)
+            self.assertIn("start_date", response.json())
+
+    def test_valid_filter_uses_rollup(self):
+        response = self._report(start_date="2025-01-01")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["source"], "rollup")
+
+
+class PricingTests(TestCase):
+    """
+    The price of a group on a date is the latest price started on or before
+    it, whichever path resolves it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create_user(998900000090, "T", is_teacher=True)
+        branch = Branch.objects.create(name="Main", address="-")
+        cls.group, cls.unpriced = [
+            Group.objects.create(
+                name=name,
+                teacher=teacher,
+                branch=branch,
+                start_date=date(2025, 1, 6),
+                end_date=date(2025, 12, 31),
+                course_start_time=time(9),
+                course_end_time=time(10),
+                weekdays="135",
+                color="#000000",
+                text_color="#ffffff",
+            )
+            for name in ("Group", "Unpriced")
+        ]
+        for start_date, price in (
+            (date(2025, 3, 1), Decimal("300000")),
+            (date(2025, 1, 6), Decimal("250000")),
+            (date(2025, 9, 1), Decimal("350000")),
+        ):
+            GroupPrice.objects.create(
+                group=cls.group, start_date=start_date, price=price
+            )
+
+    # (date, expected price of cls.group)
+    CASES = [
+        (date(2025, 1, 5), None),
+        (date(2025, 1, 6), Decimal("250000")),
+        (date(2025, 2, 28), Decimal("250000")),
+        (date(2025, 3, 1), Decimal("300000")),
+        # Between two prices the earlier one still applies
+        (date(2025, 6, 15), Decimal("300000")),
+        (date(2025, 8, 31), Decimal("300000")),
+        (date(2025, 9, 1), Decimal("350000")),
+        (date(2026, 5, 1), Decimal("350000")),
+    ]
+
+    def test_timeline(self):
+        timeline = PriceTimeline.for_groups([self.group.pk, self.unpriced.pk])
+        for on_date, expected in self.CASES:
+            with self.subTest(on_date=on_date):
+                self.assertEqual(timeline.price_on(self.group.pk, on_date), expected)
+                self.assertIsNone(timeline.price_on(self.unpriced.pk, on_date))
+        self.assertEqual(timeline.price_on(self.unpriced.pk, date(2025, 3, 1), 0), 0)
+
+    def test_timeline_until(self):
+        timeline = PriceTimeline.for_groups([self.group.pk], until=date(2025, 8, 31))
+        self.assertEqual(
+            timeline.price_on(self.group.pk, date(2026, 5, 1)), Decimal("300000")
+        )
+
+    def test_group_price_on(self):
+        prefetched = Group.objects.prefetch_related("price_history").get(
+            pk=self.group.pk
+        )
+        for on_date, expected in self.CASES:
+            with self.subTest(on_date=on_date):
+                self.assertEqual(self.group.get_price_on(on_date), expected)
+                with self.assertNumQueries(0):
+                    self.assertEqual(prefetched.get_price_on(on_date), expected)
+        self.assertIsNone(self.unpriced.get_price_on(date(2025, 3, 1)))
+
+    def test_annotated_price(self):
+        for on_date, expected in self.CASES:
+            with self.subTest(on_date=on_date):
+                group = annotate_current_price(
+                    Group.objects.filter(pk=self.group.pk), on_date
+                ).get()
+                self.assertEqual(group.current_price, expected)
+
+
+class ExportTests(TestCase):
+    """
+    Exported files open with the expected header and rows, and user text
+    can neither run as a CSV formula nor break the XLSX XML.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ceo = User.objects.create_user(998900000100, "CEO", is_ceo=True)
+        teacher = User.objects.create_user(998900000101, "T", is_teacher=True)
+        branch = Branch.objects.create(name="Main", address="-")
+        group = Group.objects.create(
+            name="Group",
+            teacher=teacher,
+            branch=branch,
+            start_date=date(2025, 1, 6),
+            end_date=date(2025, 6, 30),
+            course_start_time=time(9),
+            course_end_time=time(10),
+            weekdays="135",
+            color="#000000",
+            text_color="#ffffff",
+        )
+        student = Student.objects.create(
+            full_name="=Ali\x01 Valiyev", phone_number=998930000900, branch=branch
+        )
+        enrollment = StudentGroup.objects.create(
+            student=student, group=group, joined_at=date(2025, 1, 6)
+        )
+        cls.transactions = [
+            Transaction.objects.create(
+                student_group=enrollment,
+                transaction_type="DEBIT",
+                category="MONTHLY_FEE",
+                amount=Decimal("250000"),
+            ),
+            Transaction.objects.create(
+                student_group=enrollment,
+                transaction_type="CREDIT",
+                category="PAYMENT",
+                amount=Decimal("100000.50"),
+                comment='@SUM(1+1) & "naqd"\x0b',
+            ),
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.ceo)
+
+    def _export(self, file_format):
+        response = self.client.get(
+            "/api/finance/transactions/export/", {"file_format": file_format}
+        )
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_csv(self):
+        content = self._export("csv").decode("utf-8")
+
+        self.assertTrue(content.startswith("﻿"))
+        rows = list(csv.reader(StringIO(content[1:])))
+        self.assertEqual(rows[0], [header for header, _ in EXPORT_COLUMNS])
+        self.assertEqual(len(rows), 3)
+        debit, credit = rows[1:]
+        self.assertEqual(debit[0], str(self.transactions[0].pk))
+        self.assertEqual(debit[2], "'=Ali\x01 Valiyev")
+        self.assertEqual(
+            debit[3:10],
+            [
+                "998930000900",
+                "Group",
+                "Main",
+                "T",
+                "Debit (Qarz)",
+                "Oylik to'lov",
+                "250000.00",
+            ],
+        )
+        self.assertEqual(credit[9], "100000.50")
+        self.assertEqual(credit[13], '\'@SUM(1+1) & "naqd"\x0b')
+
+    def test_xlsx(self):
+        content = self._export("xlsx")
+
+        with zipfile.ZipFile(BytesIO(content)) as package:
+            self.assertIn("xl/workbook.xml", package.namelist())
+            sheet = ElementTree.fromstring(package.read("xl/worksheets/sheet1.xml"))
+        namespace = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+        def value(cell):
+            node = cell.find("x:v", namespace)
+            if node is None:
+                node = cell.find("x:is/x:t", namespace)
+            return None if node is None else node.text
+
+        rows = [
+            [value(cell) for cell in row.findall("x:c", namespace)]
+            for row in sheet.findall("x:sheetData/x:row", namespace)
+        ]
+        self.assertEqual(rows[0], [header for header, _ in EXPORT_COLUMNS])
+        self.assertEqual(len(rows), 3)
+        debit, credit = rows[1:]
+        # Inline strings are never formulas, only the invalid character goes
+        self.assertEqual(debit[2], "=Ali Valiyev")
+        self.assertEqual(debit[9], "250000.00")
+        self.assertEqual(credit[9], "100000.50")
+        self.assertEqual(credit[13], '@SUM(1+1) & "naqd"')
+        self.assertIsNone(credit[10])
 
-# Create your tests here.
+    def test_invalid_format_is_rejected(self):
+        response = self.client.get(
+            "/api/finance/transactions/export/", {"file_format": "pdf"}
+        )
+        self.assertEqual(response.status_code, 400)
@@ -1,6 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import GroupPriceViewSet, PaymentTypeViewSet, TransactionViewSet
+from .views import (
+    GroupPriceViewSet,
+    PaymentTypeViewSet,
+    TeacherPayrollViewSet,
+    TransactionViewSet,
+)
 
 # Create a router
 router = DefaultRouter()
@@ -8,6 +13,7 @@ router = DefaultRouter()
 router.register(r"group-prices", GroupPriceViewSet, basename="groupprice")
 router.register(r"payment-types", PaymentTypeViewSet, basename="paymenttype")
 router.register(r"transactions", TransactionViewSet, basename="transaction")
+router.register(r"payrolls", TeacherPayrollViewSet, basename="payroll")
 
 urlpatterns = [
     path("", include(router.urls)),
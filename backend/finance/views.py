@@ -3,20 +3,38 @@ from django.utils import timezone
 from django.db.models import Sum, Q
 from rest_framework import generics
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from dateutil.relativedelta import relativedelta
 from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 from users.permissions import IsAuthenticatedOrAdminForUnsafe
-from .models import GroupPrice, PaymentType, Transaction
+from .models import (
+    DailyFinanceRollup,
+    GroupPrice,
+    PaymentType,
+    TeacherPayroll,
+    Transaction,
+)
 from .serializers import (
     GroupPriceSerializer,
     PaymentTypeSerializer,
     PaymentCreateSerializer,
     TransactionDetailSerializer,
+    TeacherPayrollSerializer,
+    PayrollMonthSerializer,
+)
+from .filters import DailyFinanceRollupFilter, TransactionFilter
+from .payroll import close_month, compute_payroll
+from .export import FORMATS as EXPORT_FORMATS, export_response
+from .reports import (
+    ROLLUP_DIMENSIONS,
+    build_report,
+    build_rollup_report,
+    parse_group_by,
 )
-from .filters import TransactionFilter
 
 
 class GroupPriceViewSet(viewsets.ModelViewSet):
@@ -71,22 +89,23 @@ class PaymentTypeViewSet(viewsets.ModelViewSet):
         # Calculate the first day of the previous month
         start_of_last_month = start_of_current_month - relativedelta(months=1)
 
-        # Annotate each PaymentType with the calculated sums
+        # Annotate each PaymentType with the calculated sums, read from the
+        # daily rollup (finance.rollup) instead of scanning transactions
         queryset = PaymentType.objects.annotate(
             current_month_total=Sum(
-                "transaction__amount",
+                "finance_rollups__amount",
                 filter=Q(
-                    transaction__category="PAYMENT",
-                    transaction__created_at__gte=start_of_current_month,
+                    finance_rollups__category="PAYMENT",
+                    finance_rollups__date__gte=start_of_current_month,
                 ),
                 default=0.0,
             ),
             last_month_total=Sum(
-                "transaction__amount",
+                "finance_rollups__amount",
                 filter=Q(
-                    transaction__category="PAYMENT",
-                    transaction__created_at__gte=start_of_last_month,
-                    transaction__created_at__lt=start_of_current_month,
+                    finance_rollups__category="PAYMENT",
+                    finance_rollups__date__gte=start_of_last_month,
+                    finance_rollups__date__lt=start_of_current_month,
                 ),
                 default=0.0,
             ),
@@ -130,15 +149,21 @@ class TransactionViewSet(viewsets.ModelViewSet):
         # Only allow users to see transactions for their own students
         # This is a key security measure
         user = self.request.user
+        # Every relation TransactionDetailSerializer reads, to avoid a query per row
+        related = (
+            "student_group__group__branch",
+            "student_group__student",
+            "payment_type",
+            "receiver",
+            "created_by",
+        )
         if user.is_ceo or user.is_admin:
-            return Transaction.objects.select_related(
-                "student_group__group", "payment_type", "receiver", "student_group__group__branch",
-            ).all()
+            return Transaction.objects.select_related(*related).all()
         elif user.is_teacher:
             # Teachers can only see transactions for students in their groups
             return Transaction.objects.filter(
                 student_group__group__teacher=user
-            ).select_related("student_group__group", "payment_type", "receiver", "student_group__group__branch",)
+            ).select_related(*related)
         return Transaction.objects.none()
 
     def get_serializer_context(self):
@@ -149,3 +174,145 @@ class TransactionViewSet(viewsets.ModelViewSet):
         context = super().get_serializer_context()
         context["request"] = self.request
         return context
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Streams the filtered transactions as CSV or XLSX (`?file_format=`).
+        Takes the same filters as the list endpoint.
+        """
+        file_format = request.query_params.get("file_format", "csv").lower()
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {
+                    "detail": "Fayl formati noto'g'ri. Mumkin: "
+                    + ", ".join(EXPORT_FORMATS)
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        filename = "tranzaksiyalar-" + timezone.localdate().isoformat()
+        return export_response(queryset, file_format, filename)
+
+    @action(detail=False, methods=["get"])
+    def report(self, request):
+        """
+        Credits/debits summed per `?group_by=` dimensions, e.g.
+        ?group_by=month,payment_type&start_date=2025-01-01.
+        Takes the same filters as the list endpoint.
+
+        `?source=rollup` reads the daily rollup table, `?source=transactions`
+        the transactions; by default the rollup is used whenever the requested
+        dimensions and filters are all kept by it.
+        """
+        try:
+            group_by = parse_group_by(request.query_params.get("group_by"))
+        except ValueError as error:
+            return Response({"detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        source = request.query_params.get("source", "auto")
+        if source not in ("auto", "rollup", "transactions"):
+            return Response(
+                {"detail": "Noto'g'ri manba. Mumkin: auto, rollup, transactions"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        rollup_supported = self._rollup_supports(request, group_by)
+        if source == "rollup" and not rollup_supported:
+            return Response(
+                {
+                    "detail": "Bu guruhlash yoki filtrlar uchun kunlik hisobotdan foydalanib bo'lmaydi."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if source != "transactions" and rollup_supported:
+            filterset = DailyFinanceRollupFilter(
+                request.query_params, queryset=DailyFinanceRollup.objects.all()
+            )
+            # An invalid value would otherwise be dropped and widen the report
+            if not filterset.is_valid():
+                raise ValidationError(filterset.errors)
+            data = build_rollup_report(filterset.qs, group_by)
+            data["source"] = "rollup"
+        else:
+            queryset = self.filter_queryset(self.get_queryset())
+            data = build_report(queryset, group_by)
+            data["source"] = "transactions"
+        return Response(data)
+
+    def _rollup_supports(self, request, group_by):
+        # The rollup is not scoped per teacher, so only CEO/admins may read it
+        user = request.user
+        if not (user.is_ceo or user.is_admin):
+            return False
+        if not set(group_by) <= set(ROLLUP_DIMENSIONS):
+            return False
+        used_filters = {
+            name
+            for name in TransactionFilter.base_filters
+            if request.query_params.get(name) not in (None, "")
+        }
+        return used_filters <= set(DailyFinanceRollupFilter.base_filters)
+
+
+class TeacherPayrollViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Monthly teacher payroll (finance.payroll).
+    Stored snapshots are read-only; `preview` computes a month without saving
+    and `close` stores the snapshots of a month. Teachers only see their own.
+    """
+
+    serializer_class = TeacherPayrollSerializer
+    permission_classes = [IsAuthenticatedOrAdminForUnsafe]
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ["teacher", "month", "pay_type"]
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = TeacherPayroll.objects.select_related("teacher")
+        if user.is_ceo or user.is_admin:
+            return queryset
+        if user.is_teacher:
+            return queryset.filter(teacher=user)
+        return queryset.none()
+
+    def _month_params(self, data):
+        params = PayrollMonthSerializer(data=data)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        user = self.request.user
+        if not (user.is_ceo or user.is_admin):
+            data["teacher"] = [user.pk]
+        return data
+
+    @action(detail=False, methods=["get"])
+    def preview(self, request):
+        """
+        ?month=2025-06[&prorate=true][&teacher=1&teacher=2]
+        """
+        data = self._month_params(request.query_params)
+        payrolls = compute_payroll(
+            data["month"], teacher_ids=data.get("teacher"), prorate=data["prorate"]
+        )
+        return Response(TeacherPayrollSerializer(payrolls, many=True).data)
+
+    @action(detail=False, methods=["post"])
+    def close(self, request):
+        """
+        Stores the month's payroll for teachers that have none yet:
+        {"month": "2025-06", "prorate": true, "teacher": [1, 2]}
+        """
+        data = self._month_params(request.data)
+        created, skipped = close_month(
+            data["month"],
+            teacher_ids=data.get("teacher"),
+            prorate=data["prorate"],
+            created_by=request.user,
+        )
+        return Response(
+            {
+                "created": TeacherPayrollSerializer(created, many=True).data,
+                "skipped": [payroll.teacher_id for payroll in skipped],
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
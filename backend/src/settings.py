@@ -35,7 +35,6 @@ INSTALLED_APPS = [
     "rest_framework_simplejwt",
     "rest_framework_simplejwt.token_blacklist",
     "django_filters",
-    "debug_toolbar",
     "import_export",
     "colorfield",
     # local apps
@@ -47,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.perf.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -56,9 +56,13 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
 ]
 
+# The toolbar is a development tool; it slows every request down
+if DEBUG:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.append("debug_toolbar.middleware.DebugToolbarMiddleware")
+
 
 ROOT_URLCONF = "src.urls"
 
@@ -94,6 +98,63 @@ import sys
 if "test" in sys.argv:
     DATABASES["default"] = DATABASES["test"]
 
+# Trigram lookups (pg_trgm) for core.search are only available on PostgreSQL
+if DATABASES["default"].get("ENGINE") == "django.db.backends.postgresql":
+    INSTALLED_APPS.append("django.contrib.postgres")
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory is per process. Set CACHE_LOCATION to a directory to share
+# cached snapshots (e.g. dashboard stats) between all workers.
+
+if os.environ.get("CACHE_LOCATION"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ["CACHE_LOCATION"],
+        }
+    }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Seconds a dashboard stats snapshot is served before it is recomputed,
+# even if no invalidating change happened
+DASHBOARD_STATS_TTL = int(os.environ.get("DASHBOARD_STATS_TTL", 300))
+
+
+# Request profiling (core.perf)
+# Share of requests profiled: 0 disables it, 1 profiles every request
+PERF_SAMPLE_RATE = float(os.environ.get("PERF_SAMPLE_RATE", 0))
+# Return the figures of profiled requests in a Server-Timing header
+PERF_SERVER_TIMING = os.environ.get("PERF_SERVER_TIMING", str(DEBUG)).lower() in (
+    "true",
+    "1",
+    "t",
+)
+# Slowest statements logged per profiled request
+PERF_SLOWEST_STATEMENTS = int(os.environ.get("PERF_SLOWEST_STATEMENTS", 3))
+
+# Slow query fingerprints (core.slowqueries), served by /api/ops/slow-queries/
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "False").lower() in ("true", "1", "t")
+# Statements slower than this get their EXPLAIN output captured
+SLOW_QUERY_EXPLAIN_MS = float(os.environ.get("SLOW_QUERY_EXPLAIN_MS", 200))
+# Use EXPLAIN ANALYZE on PostgreSQL; it runs read-only slow SELECTs a second time
+SLOW_QUERY_EXPLAIN_ANALYZE = os.environ.get(
+    "SLOW_QUERY_EXPLAIN_ANALYZE", "False"
+).lower() in ("true", "1", "t")
+
+# Profiles are logged as one JSON object per line
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {"message": {"format": "%(message)s"}},
+    "handlers": {"perf": {"class": "logging.StreamHandler", "formatter": "message"}},
+    "loggers": {
+        "core.perf": {"handlers": ["perf"], "level": "INFO", "propagate": False},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -2,11 +2,12 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from debug_toolbar.toolbar import debug_toolbar_urls
 
 # import users.urls
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from core.views import PerfSummaryView, SlowQueryView
+
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -19,8 +20,12 @@ urlpatterns = [
     path("api/users/", include("users.urls")),
     path("api/core/", include("core.urls")),
     path("api/finance/", include("finance.urls")),
+    path("api/ops/perf/", PerfSummaryView.as_view(), name="perf-summary"),
+    path("api/ops/slow-queries/", SlowQueryView.as_view(), name="slow-queries"),
 ]
 
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    from debug_toolbar.toolbar import debug_toolbar_urls
+
     urlpatterns += debug_toolbar_urls()
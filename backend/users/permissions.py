@@ -125,3 +125,20 @@ class IsCeoForUnsafe(permissions.BasePermission):
             and request.user.is_authenticated
             and (request.user.is_ceo or request.user.is_superuser)
         )
+
+
+class IsStaffUser(permissions.BasePermission):
+    """
+    Allows access only to CEOs, admins and superusers, for every method.
+    """
+
+    def has_permission(self, request, view):
+        return (
+            request.user
+            and request.user.is_authenticated
+            and (
+                request.user.is_ceo
+                or request.user.is_admin
+                or request.user.is_superuser
+            )
+        )